@@ -0,0 +1,379 @@
+# autosave.py
+"""Journal de sauvegarde automatique
+
+Chaque modification du dessin est ajoutée au journal sous forme d'un
+enregistrement compact (une ligne JSON) : seules les formes qui diffèrent
+de l'état précédent y figurent. Les écritures sont regroupées et
+synchronisées sur le disque (fsync) par un thread, au plus une fois par
+SYNC_DELAY ; enregistrer une modification ne fait donc que calculer la
+différence.
+
+Tous les CHECKPOINT_INTERVAL enregistrements, l'état complet est écrit
+dans un point de reprise (format .cbrd) et le journal repart de zéro.
+Après un plantage, l'état est reconstruit à partir du dernier point de
+reprise et des seuls enregistrements qui le suivent.
+
+Chaque session (fenêtre, processus) écrit dans son propre répertoire
+session-* du répertoire d'autosauvegarde et y tient un verrou (LOCK_NAME)
+tant qu'elle est ouverte ; le système le libère si le processus plante.
+Seules les sessions dont le verrou est libre sont proposées à la
+récupération : une autre fenêtre ouverte ne perd donc jamais son journal.
+
+Fichiers d'une session :
+    checkpoint-<n>.cbrd   état après l'enregistrement n
+    journal-<n>.log       enregistrements qui suivent l'enregistrement n
+    session.lock          verrou de la session en cours
+"""
+
+from typing import Any, Dict, IO, List, Optional, Tuple
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from project_file import ProjectFile, encode_project
+
+AUTOSAVE_DIR = os.path.join(os.path.expanduser("~"), ".creabroderie", "autosave")
+
+SYNC_DELAY = 1.0            # Secondes entre deux synchronisations du journal
+CHECKPOINT_INTERVAL = 200   # Enregistrements entre deux points de reprise
+
+FILE_PATTERN = re.compile(r"^(checkpoint|journal)-(\d+)\.(cbrd|log)$")
+SESSION_PREFIX = "session-"
+LOCK_NAME = "session.lock"
+
+Shape = Tuple[str, List[float], Dict[str, Any]]  # Comme capture_state()
+
+def diff_states(old: List[Shape], new: List[Shape]) -> Tuple[int, int, List[Shape]]:
+    """Différence entre deux états : (début, nombre de formes retirées, formes ajoutées)
+
+    Les formes communes au début et à la fin des deux listes sont
+    ignorées ; une modification isolée ne produit donc qu'une forme.
+    """
+    limit = min(len(old), len(new))
+    start = 0
+    while start < limit and old[start] == new[start]:
+        start += 1
+    end = 0
+    while end < limit - start and old[-1 - end] == new[-1 - end]:
+        end += 1
+    return start, len(old) - start - end, new[start:len(new) - end]
+
+def _normalize(shape) -> Shape:
+    """Forme relue en JSON : les polices redeviennent des tuples"""
+    item_type, coords, config = shape
+    if isinstance(config.get("font"), list):
+        config["font"] = tuple(config["font"])
+    return item_type, coords, config
+
+def _fsync_write(path: str, data: bytes):
+    """Écrit un fichier complet sur le disque avant de le mettre en place"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _lock(directory: str) -> Optional[IO]:
+    """Prend le verrou d'une session sans attendre ; None s'il est déjà tenu
+
+    Le verrou est tenu tant que le fichier retourné reste ouvert.
+    """
+    try:
+        f = open(os.path.join(directory, LOCK_NAME), "a+b")
+    except OSError:
+        return None
+    try:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+class AutosaveJournal:
+    """Journal des modifications du dessin, pour la récupération après un plantage"""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.root = directory or AUTOSAVE_DIR
+        self.directory: Optional[str] = None  # Répertoire de la session, créé par start()
+        self._lock_file: Optional[IO] = None
+        self._recovered: Optional[Tuple[str, IO]] = None  # Session récupérée et son verrou
+        self._state: Optional[List[Shape]] = None  # Dernier état enregistré
+        self._sequence = 0
+        self._checkpoint_sequence = 0
+        self._pending: List[Tuple[int, str]] = []  # (numéro, ligne) en attente d'écriture
+        self._checkpoint: Optional[Tuple[int, List[Shape]]] = None  # Point de reprise demandé
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self._journal = None  # Fichier journal ouvert en ajout
+        self._closing = False
+
+    def _files(self, kind: str, directory: Optional[str] = None) -> List[Tuple[int, str]]:
+        """Fichiers (numéro, chemin) d'un type, du plus ancien au plus récent"""
+        directory = directory or self.directory
+        try:
+            names = os.listdir(directory) if directory else []
+        except OSError:
+            return []
+        files = []
+        for name in names:
+            match = FILE_PATTERN.match(name)
+            if match and match.group(1) == kind:
+                files.append((int(match.group(2)), os.path.join(directory, name)))
+        return sorted(files)
+
+    def _abandoned_sessions(self) -> List[str]:
+        """Sessions interrompues (fichiers présents, verrou libre), la plus récente d'abord
+
+        Le répertoire d'autosauvegarde lui-même compte comme une session :
+        les versions précédentes y écrivaient directement.
+        """
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return []
+        candidates = [self.root] + [os.path.join(self.root, name) for name in names
+                                    if name.startswith(SESSION_PREFIX)]
+        sessions = []
+        for directory in candidates:
+            if directory == self.directory or not os.path.isdir(directory):
+                continue
+            has_files = bool(_session_files(directory))
+            if not has_files and directory == self.root:
+                continue
+            lock = _lock(directory)
+            if lock is None:
+                continue  # Session ouverte par une autre fenêtre ou un autre processus
+            if not has_files:
+                _remove_session(directory, self.root, lock)  # Interrompue avant toute écriture
+                continue
+            lock.close()
+            sessions.append((os.path.getmtime(directory), directory))
+        return [directory for _, directory in sorted(sessions, reverse=True)]
+
+    def has_recovery(self) -> bool:
+        """Vrai si une session précédente n'a pas été fermée proprement"""
+        return bool(self._abandoned_sessions())
+
+    def recover(self) -> Optional[List[Shape]]:
+        """Reconstruit le dernier état enregistré par la session interrompue la plus récente
+
+        Part du point de reprise le plus récent lisible et rejoue les
+        enregistrements suivants ; une ligne incomplète (écriture
+        interrompue par le plantage) arrête la relecture. La session
+        récupérée reste verrouillée, puis est effacée par start().
+        """
+        for directory in self._abandoned_sessions():
+            lock = _lock(directory)
+            if lock is not None:
+                break
+        else:
+            return None
+        self._release_recovered()
+        self._recovered = (directory, lock)
+
+        state: List[Shape] = []
+        sequence = 0
+        for number, path in reversed(self._files("checkpoint", directory)):
+            try:
+                with ProjectFile(path) as project:
+                    state = project.shapes()
+                sequence = number
+                break
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Point de reprise illisible ({os.path.basename(path)}) : {str(e)}")
+        else:
+            if not self._files("journal", directory):
+                return None
+
+        for _, path in self._files("journal", directory):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            break
+                        if record["n"] <= sequence:
+                            continue
+                        if record["n"] != sequence + 1:
+                            break  # Enregistrement manquant : on s'arrête au dernier état sûr
+                        start, removed = record["i"], record["d"]
+                        state[start:start + removed] = [_normalize(shape) for shape in record["a"]]
+                        sequence = record["n"]
+            except OSError as e:
+                print(f"Journal illisible ({os.path.basename(path)}) : {str(e)}")
+        return state
+
+    def _release_recovered(self, discard: bool = False):
+        """Libère la session récupérée ; discard efface ses fichiers"""
+        if self._recovered is None:
+            return
+        directory, lock = self._recovered
+        self._recovered = None
+        if discard:
+            _remove_session(directory, self.root, lock)
+        else:
+            lock.close()
+
+    def start(self, state: List[Shape]):
+        """Démarre une nouvelle session à partir de state
+
+        La session récupérée par recover(), s'il y en a une, est effacée :
+        state reprend ce qu'on a voulu en garder. Les sessions des autres
+        fenêtres ne sont pas touchées.
+        """
+        self.close(discard=True)
+        self._release_recovered(discard=True)
+        os.makedirs(self.root, exist_ok=True)
+        self.directory = tempfile.mkdtemp(prefix=SESSION_PREFIX, dir=self.root)
+        self._lock_file = _lock(self.directory)
+        self._state = list(state)
+        self._sequence = 0
+        self._checkpoint_sequence = 0
+        self._closing = False
+        if state:
+            # État de départ (projet récupéré) : point de reprise immédiat
+            self._checkpoint = (0, self._state)
+            self._start_writer()
+
+    def record(self, state: List[Shape]):
+        """Ajoute l'état courant au journal s'il a changé (sans écriture sur le disque)"""
+        if self._state is None:
+            return
+        start, removed, added = diff_states(self._state, state)
+        if not removed and not added:
+            return
+        self._state = list(state)
+        self._sequence += 1
+        line = json.dumps({"n": self._sequence, "i": start, "d": removed, "a": added},
+                          ensure_ascii=False, separators=(",", ":"))
+        with self._condition:
+            self._pending.append((self._sequence, line))
+            if self._sequence - self._checkpoint_sequence >= CHECKPOINT_INTERVAL:
+                self._checkpoint = (self._sequence, self._state)
+                self._checkpoint_sequence = self._sequence
+            self._start_writer()
+            self._condition.notify()
+
+    def _start_writer(self):
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, daemon=True)
+            self._writer.start()
+
+    def _write_loop(self):
+        """Thread d'écriture : synchronise le journal par lots"""
+        while True:
+            with self._condition:
+                while not self._pending and self._checkpoint is None and not self._closing:
+                    self._condition.wait()
+                if self._closing:
+                    return
+            # Laisser les modifications rapprochées s'accumuler dans un même lot
+            time.sleep(SYNC_DELAY)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Erreur lors de la sauvegarde automatique : {str(e)}")
+
+    def flush(self):
+        """Écrit et synchronise immédiatement les enregistrements en attente"""
+        with self._write_lock:
+            with self._condition:
+                pending, self._pending = self._pending, []
+                checkpoint, self._checkpoint = self._checkpoint, None
+            if checkpoint is None:
+                self._append(pending)
+                return
+
+            # Enregistrements antérieurs au point de reprise dans l'ancien journal,
+            # les suivants dans un nouveau journal
+            number, state = checkpoint
+            self._append([entry for entry in pending if entry[0] <= number])
+            _fsync_write(os.path.join(self.directory, f"checkpoint-{number}.cbrd"),
+                         encode_project(state))
+            self._close_journal()
+            self._journal = open(os.path.join(self.directory, f"journal-{number}.log"),
+                                 "a", encoding="utf-8")
+            for old_number, path in self._files("checkpoint") + self._files("journal"):
+                if old_number < number:
+                    os.remove(path)
+            self._append([entry for entry in pending if entry[0] > number])
+
+    def _append(self, entries: List[Tuple[int, str]]):
+        if not entries:
+            return
+        if self._journal is None:
+            self._journal = open(os.path.join(self.directory, "journal-0.log"),
+                                 "a", encoding="utf-8")
+        self._journal.write("".join(line + "\n" for _, line in entries))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def _close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def close(self, discard: bool = False):
+        """Arrête le journal ; discard efface les fichiers (fermeture normale)"""
+        with self._condition:
+            self._closing = True
+            self._condition.notify()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        if discard:
+            with self._condition:
+                self._pending.clear()
+                self._checkpoint = None
+        elif self._state is not None:
+            self.flush()
+        self._close_journal()
+        self._state = None
+        lock, self._lock_file = self._lock_file, None
+        if discard and self.directory is not None:
+            _remove_session(self.directory, self.root, lock)
+            self.directory = None
+        elif lock is not None:
+            lock.close()
+
+def _remove_session(directory: str, root: str, lock: Optional[IO]):
+    """Efface une session dont on tient le verrou, puis le libère
+
+    Le journal et les points de reprise sont effacés sous le verrou ; le
+    répertoire (sauf l'ancien répertoire commun) l'est après, une fois le
+    fichier de verrou fermé.
+    """
+    for _, path in sorted(_session_files(directory)):
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"Impossible d'effacer {path} : {str(e)}")
+    if lock is not None:
+        lock.close()
+    if os.path.abspath(directory) != os.path.abspath(root):
+        shutil.rmtree(directory, ignore_errors=True)
+    else:
+        try:
+            os.remove(os.path.join(directory, LOCK_NAME))
+        except OSError:
+            pass
+
+def _session_files(directory: str) -> List[Tuple[str, str]]:
+    """(nom, chemin) des points de reprise et journaux d'une session"""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    return [(name, os.path.join(directory, name)) for name in names if FILE_PATTERN.match(name)]
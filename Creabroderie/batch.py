@@ -0,0 +1,279 @@
+# batch.py
+"""Variantes personnalisées d'un modèle (prénoms, numéros...)
+
+    python batch.py modele.cbrd prenoms.csv sortie/ --format pes --name "{prenom}"
+
+Le modèle est un projet .cbrd dont les textes contiennent des champs
+{colonne} ; chaque ligne du CSV (avec une ligne d'en-tête) donne une
+variante. Les formes sans champ sont converties une seule fois, dans le
+processus principal, et la palette (réduite si demandé) est calculée une
+fois pour toutes : les processus de conversion reçoivent leurs points en
+colonnes et ne refont que la conversion des textes variables. Les variantes sont converties, vérifiées et exportées en
+parallèle ; un rapport (rapport.csv) donne le résultat de la
+vérification de chaque fichier, ou l'erreur qui a empêché de l'écrire
+(valeur incompatible avec le format d'un champ, par exemple).
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from string import Formatter
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+import argparse
+import csv
+import os
+import re
+import time
+from embroidery_export import EXPORTERS, EmbroideryDesign, StitchColumns, StitchPoint, StitchType
+from palette import insert_color_changes, reduce_palette
+from profiling import span
+from stitch_conversion import CONVERTERS, Shape, shapes_size_mm, translate_stitches
+
+REPORT_NAME = "rapport.csv"
+
+# Erreurs de str.format_map sur une valeur du CSV ({x:d} avec du texte...)
+FORMAT_ERRORS = (KeyError, IndexError, AttributeError, TypeError, ValueError)
+
+@dataclass
+class VariantResult:
+    """Résultat de l'export d'une variante"""
+    path: str
+    problems: List[str] = field(default_factory=list)  # Vérification du motif
+    error: str = ""                                     # Fichier non écrit
+
+def template_fields(shapes: Sequence[Shape]) -> Set[str]:
+    """Champs {colonne} utilisés par les textes du modèle"""
+    fields = set()
+    for item_type, _, config in shapes:
+        if item_type == 'text':
+            fields.update(name for _, name, _, _ in Formatter().parse(config.get('text', ''))
+                          if name)
+    return fields
+
+def is_variable(shape: Shape) -> bool:
+    item_type, _, config = shape
+    return item_type == 'text' and any(name for _, name, _, _
+                                       in Formatter().parse(config.get('text', '')))
+
+class TemplateConverter:
+    """Convertit les variantes d'un modèle en réutilisant les points des parties fixes
+
+    La palette ne dépend pas des variantes (seuls les textes changent) : elle
+    est établie et réduite une fois, d'après le nombre de points des formes
+    fixes, et les points de chaque forme fixe sont gardés en colonnes avec
+    leur index de couleur définitif. Créé dans le processus principal, il
+    est transmis tel quel aux processus de conversion.
+    """
+
+    def __init__(self, shapes: Sequence[Shape], density: float, hoop_size: tuple,
+                 max_colors: int = 0, tolerance: float = 0.0):
+        self.shapes = list(shapes)
+        self.density = density
+        self.hoop_size = tuple(hoop_size)
+
+        # Palette dans l'ordre d'apparition, comme shapes_to_stitches
+        colors: List[str] = []
+        for item_type, _, config in self.shapes:
+            fill = config.get('fill')
+            if fill and item_type in CONVERTERS and fill not in colors:
+                colors.append(fill)
+
+        # Points des formes fixes en colonnes (x, y, couleurs, types), avec
+        # l'index de la palette d'origine
+        self._fixed: Dict[int, Tuple[list, list, list, list]] = {}
+        weights = [1.0] * len(colors)
+        with span("template_fixed_shapes"):
+            for index, shape in enumerate(self.shapes):
+                item_type, coords, config = shape
+                fill = config.get('fill')
+                if not fill or item_type not in CONVERTERS or is_variable(shape):
+                    continue
+                points = self._convert(shape, colors.index(fill))
+                weights[colors.index(fill)] += len(points)
+                self._fixed[index] = ([point.x for point in points], [point.y for point in points],
+                                      [point.color_index for point in points],
+                                      [point.stitch_type for point in points])
+
+        self.thread_colors, self._mapping = reduce_palette(colors, weights, max_colors, tolerance)
+        self._colors = colors
+        for index, (xs, ys, color_indexes, types) in self._fixed.items():
+            self._fixed[index] = (xs, ys, [self._mapping[color] for color in color_indexes], types)
+
+    def _convert(self, shape: Shape, color_index: int) -> List[StitchPoint]:
+        item_type, coords, config = shape
+        try:
+            return CONVERTERS[item_type](coords, color_index, self.density, config)
+        except Exception as e:
+            print(f"Erreur lors de la conversion de {item_type}: {str(e)}")
+            return []
+
+    def convert(self, values: Dict[str, str]) -> EmbroideryDesign:
+        """Motif de la variante dont les champs valent values"""
+        points = StitchColumns([], [], [], [])
+        shapes = []
+        for index, shape in enumerate(self.shapes):
+            if index in self._fixed:
+                translate_stitches(points, self._fixed[index], 0.0, 0.0)
+                shapes.append(shape)
+                continue
+            item_type, coords, config = shape
+            if is_variable(shape):
+                config = dict(config, text=config['text'].format_map(values))
+                shape = (item_type, coords, config)
+                fill = config.get('fill')
+                if fill and item_type in CONVERTERS:
+                    for point in self._convert(shape, self._mapping[self._colors.index(fill)]):
+                        points.xs.append(point.x)
+                        points.ys.append(point.y)
+                        points.colors.append(point.color_index)
+                        points.types.append(point.stitch_type)
+            shapes.append(shape)
+
+        if not len(points):
+            points = StitchColumns([0.0], [0.0], [0], [StitchType.NORMAL])
+        return EmbroideryDesign(points=insert_color_changes(points),
+                                thread_colors=list(self.thread_colors),
+                                size_mm=shapes_size_mm(shapes), hoop_size_mm=self.hoop_size)
+
+def variant_filename(pattern: str, values: Dict[str, str], number: int, extension: str) -> str:
+    """Nom de fichier d'une variante (caractères interdits remplacés)"""
+    name = pattern.format_map(dict(values, n=number)) if pattern else f"variante-{number:04d}"
+    name = re.sub(r'[\\/:*?"<>|\x00-\x1f]+', "_", name).strip(" .") or f"variante-{number:04d}"
+    return name + extension
+
+# Modèle de conversion de chaque processus, reçu du processus principal par _init_worker
+_converter: Optional[TemplateConverter] = None
+
+def _init_worker(converter: TemplateConverter):
+    global _converter
+    _converter = converter
+
+def _export_variant(values: Dict[str, str], path: str, format_type: str) -> VariantResult:
+    """Convertit, vérifie et écrit une variante"""
+    from validator import validate_design
+    try:
+        design = _converter.convert(values)
+    except FORMAT_ERRORS as e:
+        return VariantResult(path, error=f"champ invalide : {e}")
+    report = validate_design(design)
+    try:
+        with open(path, "wb") as f:
+            f.write(EXPORTERS[format_type]().to_bytes(design))
+    except OSError as e:
+        return VariantResult(path, error=str(e))
+    return VariantResult(path, report.summary())
+
+def read_variants(csv_path: str) -> List[Dict[str, str]]:
+    """Lignes du CSV (séparateur détecté), indexées par les noms de colonnes"""
+    with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        return [{name.strip(): (value or "").strip() for name, value in row.items() if name}
+                for row in csv.DictReader(f, dialect=dialect)]
+
+def run_batch(shapes: Sequence[Shape], variants: Sequence[Dict[str, str]], output_dir: str,
+              format_type: str, settings: Dict[str, Any], name_pattern: str = "",
+              workers: Optional[int] = None) -> List[VariantResult]:
+    """Exporte toutes les variantes ; retourne leurs résultats dans l'ordre du CSV
+
+    Lève ValueError si le format est inconnu, si un champ du modèle manque
+    dans le CSV ou si aucun texte variable n'est brodé (toutes les variantes
+    seraient identiques). Une ligne dont une valeur ne convient pas au
+    format d'un champ est notée en erreur, sans arrêter les autres.
+    """
+    if format_type not in EXPORTERS:
+        raise ValueError(f"Format inconnu : {format_type} (disponibles : {', '.join(EXPORTERS)})")
+    columns = set(variants[0] if variants else ())
+    missing = template_fields(shapes) - columns
+    missing |= {name for _, name, _, _ in Formatter().parse(name_pattern) if name} - columns - {"n"}
+    if missing:
+        raise ValueError(f"Colonnes absentes du CSV : {', '.join(sorted(missing))}")
+    if not any(is_variable(shape) and shape[2].get('fill') and shape[0] in CONVERTERS
+               for shape in shapes):
+        raise ValueError("Aucun texte variable n'est brodé (champ {colonne} dans un texte "
+                         "avec une couleur) : toutes les variantes seraient identiques")
+
+    os.makedirs(output_dir, exist_ok=True)
+    extension = "." + format_type
+    results: List[Optional[VariantResult]] = [None] * len(variants)
+    tasks = []  # (index, valeurs, chemin)
+    used = set()
+    for number, values in enumerate(variants, 1):
+        try:
+            filename = variant_filename(name_pattern, values, number, extension)
+        except FORMAT_ERRORS as e:
+            filename = f"variante-{number:04d}{extension}"
+            results[number - 1] = VariantResult(os.path.join(output_dir, filename),
+                                                error=f"nom de fichier invalide : {e}")
+            continue
+        if filename in used:  # Deux lignes identiques : numéro en suffixe
+            filename = f"{os.path.splitext(filename)[0]}-{number}{extension}"
+        used.add(filename)
+        tasks.append((number - 1, values, os.path.join(output_dir, filename)))
+
+    # Formes fixes converties une fois ici ; les processus reçoivent leurs points
+    converter = TemplateConverter(shapes, settings["density"], settings["hoop_size"],
+                                  settings.get("max_colors", 0), settings.get("tolerance", 0.0))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(converter,)) as executor:
+        done = executor.map(_export_variant, [values for _, values, _ in tasks],
+                            [path for _, _, path in tasks], [format_type] * len(tasks),
+                            chunksize=16)
+        for (index, _, _), result in zip(tasks, done):
+            results[index] = result
+    return results
+
+def write_report(results: Sequence[VariantResult], path: str):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["fichier", "vérification", "problèmes"])
+        for result in results:
+            if result.error:
+                status, details = "erreur", result.error
+            else:
+                status, details = "à vérifier" if result.problems else "ok", " ; ".join(result.problems)
+            writer.writerow([os.path.basename(result.path), status, details])
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporte les variantes personnalisées d'un modèle")
+    parser.add_argument("template", help="Projet .cbrd dont les textes contiennent des champs {colonne}")
+    parser.add_argument("csv", help="Valeurs des champs, une variante par ligne (avec en-tête)")
+    parser.add_argument("output", help="Répertoire des fichiers machine")
+    parser.add_argument("--format", default="pes", choices=sorted(EXPORTERS))
+    parser.add_argument("--name", default="", help="Nom des fichiers, ex. \"{prenom}\" ({n} : numéro de ligne)")
+    parser.add_argument("--density", type=float, default=2.0)
+    parser.add_argument("--hoop", default="100x100", help="Taille du tambour en mm (LxH)")
+    parser.add_argument("--max-colors", type=int, default=0)
+    parser.add_argument("--tolerance", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=None, help="Processus de conversion")
+    args = parser.parse_args()
+
+    from project_file import ProjectFile
+    try:
+        with ProjectFile(args.template) as project:
+            shapes = project.shapes()
+        variants = read_variants(args.csv)
+        hoop_size = tuple(int(size) for size in args.hoop.lower().split("x"))
+    except (OSError, ValueError, KeyError) as e:
+        parser.error(str(e))
+
+    settings = {"density": args.density, "hoop_size": list(hoop_size),
+                "max_colors": args.max_colors, "tolerance": args.tolerance}
+    start = time.perf_counter()
+    try:
+        results = run_batch(shapes, variants, args.output, args.format, settings,
+                            args.name, args.workers)
+    except ValueError as e:
+        parser.error(str(e))
+    write_report(results, os.path.join(args.output, REPORT_NAME))
+
+    failed = sum(1 for result in results if result.error)
+    flagged = sum(1 for result in results if result.problems)
+    print(f"{len(results) - failed} variantes exportées en {time.perf_counter() - start:.1f} s "
+          f"dans {args.output} ; {flagged} à vérifier, {failed} en erreur (voir {REPORT_NAME})")
+
+if __name__ == "__main__":
+    main()
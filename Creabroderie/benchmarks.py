@@ -0,0 +1,329 @@
+# benchmarks.py
+"""Mesures de performance de Créabroderie
+
+Usage : python benchmarks.py [nom ...]   (sans argument : toutes les mesures)
+"""
+
+from typing import Callable, Dict
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+def timed(function: Callable, repeat: int) -> float:
+    """Durée moyenne d'un appel, en microsecondes"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+def bench_database(calls: int = 2000):
+    """Connexion persistante de ThreadDatabase contre une connexion par appel"""
+    from thread_management import CATALOG_PATH, ThreadDatabase
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "threads.db")
+        db = ThreadDatabase(db_path)
+
+        def connect_per_call():
+            # Comportement d'origine : ouverture et fermeture à chaque appel
+            with sqlite3.connect(CATALOG_PATH) as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT brand, reference, name, hex_color FROM threads "
+                               "WHERE brand = ?", ("DMC",))
+                rows = cursor.fetchall()
+            conn.close()
+            return rows
+
+        def persistent():
+            return db.get_all_threads("DMC")
+
+        def toggle():
+            db.toggle_favorite("DMC", "310")
+
+        results = {
+            "connexion par appel": timed(connect_per_call, calls),
+            "connexion persistante": timed(persistent, calls),
+            "toggle_favorite": timed(toggle, calls // 10),
+        }
+        db.close()
+
+    for label, duration in results.items():
+        print(f"  {label:<28} {duration:8.1f} µs/appel")
+    speedup = results["connexion par appel"] / results["connexion persistante"]
+    print(f"  gain : x{speedup:.1f}")
+
+def bench_database_startup(runs: int = 20):
+    """Ouverture de ThreadDatabase (catalogue livré + base utilisateur existante)"""
+    from thread_management import ThreadDatabase
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "threads.db")
+        ThreadDatabase(db_path).close()  # Première ouverture : création de la base utilisateur
+
+        def open_database():
+            db = ThreadDatabase(db_path)
+            db.get_brands()
+            db.close()
+
+        duration = timed(open_database, runs)
+    print(f"  {'ouverture + marques':<28} {duration / 1000:8.2f} ms")
+
+def bench_project(stitches: int = 1_000_000, runs: int = 20):
+    """Ouverture d'un projet .cbrd avec points en cache, puis parcours des points"""
+    from embroidery_export import EmbroideryDesign, StitchPoint, StitchType
+    from project_file import ProjectFile, save_project
+
+    points = [StitchPoint((i % 1000) * 0.1, (i // 1000) * 0.1, StitchType.NORMAL, i * 4 // stitches)
+              for i in range(stitches)]
+    design = EmbroideryDesign(points=points, thread_colors=["#000000"] * 4, size_mm=(100, 100),
+                              hoop_size_mm=(100, 100), thread_references=[])
+    shapes = [("rectangle", [0.0, 0.0, 10.0, 10.0], {"fill": "red", "outline": "black", "width": "1.0"})]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "projet.cbrd")
+        start = time.perf_counter()
+        save_project(path, shapes, design, {"density": 2.0})
+        print(f"  {'enregistrement':<28} {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+        def open_project():
+            with ProjectFile(path) as project:
+                project.shapes()
+                project.design()
+
+        print(f"  {'ouverture (formes + motif)':<28} {timed(open_project, runs) / 1000:8.2f} ms")
+        with ProjectFile(path) as project:
+            design = project.design()
+            start = time.perf_counter()
+            for _ in design.points:
+                pass
+            print(f"  {'parcours des points':<28} {(time.perf_counter() - start) * 1000:8.1f} ms")
+            del design
+
+def bench_autosave(shapes: int = 2000, edits: int = 1000):
+    """Coût d'une modification journalisée et durée de la récupération après plantage"""
+    import autosave
+
+    state = [("rectangle", [float(i), float(i), i + 10.0, i + 10.0],
+              {"fill": "#ff0000", "outline": "black", "width": "1.0"}) for i in range(shapes)]
+    with tempfile.TemporaryDirectory() as tmp:
+        journal = autosave.AutosaveJournal(tmp)
+        journal.start(state)
+        durations = []
+        for i in range(edits):
+            state = list(state)
+            item_type, coords, config = state[i * 7 % shapes]
+            state[i * 7 % shapes] = (item_type, [c + 1.0 for c in coords], config)
+            start = time.perf_counter()
+            journal.record(state)
+            durations.append(time.perf_counter() - start)
+        journal.flush()
+        print(f"  {'modification (moyenne)':<28} {sum(durations) / edits * 1e6:8.1f} µs")
+        print(f"  {'modification (max)':<28} {max(durations) * 1e6:8.1f} µs")
+
+        # Plantage simulé : le journal est fermé sans être effacé (verrou libéré)
+        journal.close()
+        start = time.perf_counter()
+        recovered = autosave.AutosaveJournal(tmp).recover()
+        print(f"  {'récupération':<28} {(time.perf_counter() - start) * 1000:8.1f} ms"
+              f" ({len(recovered)} formes)")
+
+def bench_export_cache(shapes: int = 300, runs: int = 5):
+    """Export d'un motif : conversion et encodage complets contre relecture du cache"""
+    from export_cache import ExportCache, export_key
+    from project_file import shapes_digest
+    from stitch_conversion import convert_shapes
+
+    state = [("rectangle", [i * 3.0, i * 2.0, i * 3.0 + 200, i * 2.0 + 150],
+              {"fill": f"#{i * 40503 % 0xffffff:06x}", "outline": "", "width": "1.0"})
+             for i in range(shapes)]
+    settings = {"density": 2.0, "hoop_size": [100, 100], "max_colors": 8, "tolerance": 0}
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ExportCache(tmp)
+
+        def export(use_cache):
+            key = export_key(shapes_digest(state), "pes", settings)
+            if not use_cache:
+                cache.clear()
+            return cache.export(key, "pes", lambda: convert_shapes(state, 2.0, (100, 100), 8))
+
+        print(f"  {'absent du cache':<28} {timed(lambda: export(False), runs) / 1000:8.1f} ms")
+        print(f"  {'relu du cache':<28} {timed(lambda: export(True), runs) / 1000:8.2f} ms")
+        print(f"  {'taux de succès':<28} {cache.hit_rate():8.0%}")
+
+def bench_multi_hoop(shapes: int = 40):
+    """Découpage d'une bannière en passages de tambour : durée selon le nombre de passages"""
+    from multi_hoop import export_hoopings, split_design
+    from stitch_conversion import convert_shapes
+
+    state = [("rectangle", [i * 250.0, 0, i * 250.0 + 600, 3000],
+              {"fill": f"#{i * 40503 % 0xffffff:06x}", "outline": "", "width": "1.0"})
+             for i in range(shapes)]
+    for hoop in ((300, 200), (200, 200), (100, 100)):
+        design = convert_shapes(state, 1.0, hoop)
+        start = time.perf_counter()
+        hoopings = split_design(design)
+        split = time.perf_counter() - start
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            export_hoopings(hoopings, os.path.join(tmp, "banniere.dst"), "dst")
+            written = time.perf_counter() - start
+        print(f"  tambour {hoop[0]}x{hoop[1]} : {len(hoopings):3d} passages, "
+              f"découpage {split * 1000:7.1f} ms, export {written * 1000:7.1f} ms "
+              f"({len(design.points)} points)")
+
+def bench_long_moves(stitches: int = 500_000, runs: int = 3):
+    """Découpe des déplacements trop longs : motif sans long déplacement, puis avec 1 % de sauts longs"""
+    from embroidery_export import StitchPoint, StitchType, split_long_moves
+
+    # Remplissage en serpentin : aucun déplacement de plus de 12,7 mm
+    short = [StitchPoint((i % 500 if i // 500 % 2 == 0 else 499 - i % 500) * 0.2,
+                         (i // 500) * 0.2, StitchType.NORMAL, 0)
+             for i in range(stitches)]
+    travel = [StitchPoint(point.x + (300 if i % 100 == 50 else 0), point.y,
+                          StitchType.JUMP if i % 100 in (50, 51) else point.stitch_type, 0)
+              for i, point in enumerate(short)]
+    for label, points in (("sans long déplacement", short), ("1 % de sauts longs", travel)):
+        duration = timed(lambda: split_long_moves(points, 127), runs)
+        moves = len(split_long_moves(points, 127)[0])
+        print(f"  {label:<28} {duration / 1000:8.1f} ms ({moves} déplacements)")
+
+def bench_validate(stitches: int = 1_000_000, runs: int = 3):
+    """Vérification avant export d'un motif d'un million de points (liste et projet .cbrd)"""
+    from embroidery_export import EmbroideryDesign, StitchPoint, StitchType
+    from project_file import ProjectFile, save_project
+    from validator import validate_design
+
+    points = [StitchPoint((i % 500 if i // 500 % 2 == 0 else 499 - i % 500) * 0.4,
+                          (i // 500) * 0.4, StitchType.NORMAL, 0)
+              for i in range(stitches)]
+    design = EmbroideryDesign(points=points, thread_colors=["#000000"],
+                              size_mm=(200, stitches / 1250), hoop_size_mm=(200, 200))
+    print(f"  {'liste de points':<28} {timed(lambda: validate_design(design), runs) / 1000:8.1f} ms")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "motif.cbrd")
+        save_project(path, [], design, {"density": 1.0})
+        with ProjectFile(path) as project:
+            mapped = project.design()
+            duration = timed(lambda: validate_design(mapped), runs)
+            del mapped
+        print(f"  {'projet .cbrd':<28} {duration / 1000:8.1f} ms")
+    print("  " + "; ".join(validate_design(design).summary()))
+
+def bench_batch(variants: int = 50, runs: int = 20):
+    """Variantes d'un modèle : conversion complète contre réutilisation des parties fixes"""
+    from batch import TemplateConverter, run_batch
+    from stitch_conversion import convert_shapes
+
+    shapes = [("rectangle", [i * 7.0, i * 5.0, i * 7.0 + 600, i * 5.0 + 400],
+               {"fill": f"#{i * 40503 % 0xffffff:06x}", "outline": "", "width": "1.0"})
+              for i in range(20)]
+    shapes.append(("text", [100.0, 500.0], {"fill": "#000000", "text": "{prenom} {numero}",
+                                            "font": ("Arial", 12), "anchor": "center"}))
+    values = {"prenom": "Camille", "numero": "7"}
+    converter = TemplateConverter(shapes, 2.0, (100, 100), 4)
+    full = timed(lambda: convert_shapes(shapes, 2.0, (100, 100), 4), runs)
+    print(f"  {'conversion complète':<28} {full / 1000:8.2f} ms/variante")
+    print(f"  {'parties fixes réutilisées':<28} {timed(lambda: converter.convert(values), runs) / 1000:8.2f} ms/variante")
+
+    rows = [{"prenom": f"Prénom{i}", "numero": str(i)} for i in range(variants)]
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        run_batch(shapes, rows, tmp, "pes", {"density": 2.0, "hoop_size": [100, 100], "max_colors": 4},
+                  "{prenom}")
+        duration = time.perf_counter() - start
+    print(f"  {'lot complet (vérif. + export)':<28} {duration / variants * 1000:8.1f} ms/variante "
+          f"({variants} variantes, {os.cpu_count()} processeurs)")
+
+def bench_instances(copies: int = 200, runs: int = 5):
+    """Motif répété : copies indépendantes contre copies liées (points calculés une fois)"""
+    from stitch_conversion import convert_shapes
+
+    pattern = [("oval", [0.0, 0.0, 300.0, 200.0], {"fill": "#c03030"}),
+               ("rectangle", [40.0, 40.0, 160.0, 120.0], {"fill": "#3050c0"})]
+    independent, linked = [], []
+    for copy in range(copies):
+        dx, dy = (copy % 20) * 350.0, (copy // 20) * 250.0
+        for index, (item_type, coords, config) in enumerate(pattern):
+            moved = [value + (dx if i % 2 == 0 else dy) for i, value in enumerate(coords)]
+            independent.append((item_type, moved, dict(config)))
+            linked.append((item_type, moved, dict(config, instance=index + 1)))
+    for label, shapes in (("copies indépendantes", independent), ("copies liées", linked)):
+        duration = timed(lambda: convert_shapes(shapes, 2.0, (100, 100)), runs)
+        print(f"  {label:<28} {duration / 1000:8.1f} ms ({copies} copies)")
+
+STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import debug
+imported = time.perf_counter()
+if sys.argv[1] == "window":
+    import tkinter as tk
+    marks = {}
+    on_window_ready = debug.EmbroideryDesigner.on_window_ready
+    def mark_window_ready(app):
+        marks["shown"] = time.perf_counter()
+        on_window_ready(app)
+    debug.EmbroideryDesigner.on_window_ready = mark_window_ready
+    root = tk.Tk()
+    app = debug.EmbroideryDesigner(root)
+    while "shown" not in marks:
+        root.update()
+    root.update()  # Panneaux et polices différés
+    ready = time.perf_counter()
+    app.quit_application()
+    root.destroy()
+    print(imported - start, marks["shown"] - start, ready - start)
+else:
+    print(imported - start)
+"""
+
+def bench_startup(runs: int = 5):
+    """Démarrage à froid : import de debug.py, premier affichage, panneaux différés"""
+    directory = os.path.dirname(os.path.abspath(__file__))
+
+    def run(mode, home):
+        # Nouveau processus à chaque fois : les imports ne sont pas en cache.
+        # HOME temporaire : base des fils et journal sans effet sur ceux de l'utilisateur
+        output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT, mode], cwd=directory,
+                                capture_output=True, text=True, env=dict(os.environ, HOME=home))
+        if output.returncode != 0:
+            return None
+        return [float(value) * 1000 for value in output.stdout.split()[-3 if mode == "window" else -1:]]
+
+    with tempfile.TemporaryDirectory() as home:
+        imports = [run("import", home)[0] for _ in range(runs)]
+        print(f"  {'import de debug.py':<28} {min(imports):8.1f} ms")
+        windows = [run("window", home) for _ in range(runs)]
+    if None in windows:
+        print("  (pas d'affichage disponible : premier affichage non mesuré)")
+        return
+    print(f"  {'premier affichage':<28} {min(w[1] for w in windows):8.1f} ms")
+    print(f"  {'panneaux différés prêts':<28} {min(w[2] for w in windows):8.1f} ms")
+
+BENCHMARKS: Dict[str, Callable] = {
+    "database": bench_database,
+    "database_startup": bench_database_startup,
+    "project": bench_project,
+    "autosave": bench_autosave,
+    "export_cache": bench_export_cache,
+    "startup": bench_startup,
+    "multi_hoop": bench_multi_hoop,
+    "long_moves": bench_long_moves,
+    "validate": bench_validate,
+    "batch": bench_batch,
+    "instances": bench_instances,
+}
+
+def main(names):
+    for name in names or BENCHMARKS:
+        if name not in BENCHMARKS:
+            print(f"Mesure inconnue : {name} (disponibles : {', '.join(BENCHMARKS)})")
+            continue
+        print(f"[{name}] {BENCHMARKS[name].__doc__}")
+        BENCHMARKS[name]()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,21 @@
+# build_catalog.py
+"""Construction du catalogue de fils livré avec Créabroderie
+
+Usage : python build_catalog.py [catalogue.csv|.json|.jsonl ...]
+
+Le catalogue de base (DEFAULT_THREADS) est complété par les fichiers donnés
+(qui doivent avoir une colonne marque), puis écrit dans CATALOG_PATH. Changer CATALOG_VERSION dans
+thread_management.py quand le contenu du catalogue change.
+"""
+
+import itertools
+import sys
+from thread_management import CATALOG_PATH, DEFAULT_THREADS, build_catalog_snapshot, read_catalog
+
+def main(paths):
+    rows = itertools.chain(DEFAULT_THREADS, *(read_catalog(path) for path in paths))
+    count = build_catalog_snapshot(CATALOG_PATH, rows)
+    print(f"{count} fils écrits dans {CATALOG_PATH}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
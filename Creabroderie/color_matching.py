@@ -0,0 +1,210 @@
+# color_matching.py
+
+from typing import Dict, List, Optional, Sequence, Tuple
+import heapq
+import math
+from PIL import ImageColor
+from thread_management import ThreadColor, ThreadDatabase
+
+Lab = Tuple[float, float, float]
+
+def hex_to_rgb(color: str) -> Tuple[int, int, int]:
+    """Convertit une couleur (#rrggbb, #rgb ou nom de couleur) en RGB"""
+    return ImageColor.getrgb(color)[:3]
+
+def rgb_to_lab(rgb: Sequence[int]) -> Lab:
+    """Convertit une couleur sRGB (0-255) en CIELAB (illuminant D65)"""
+    def linear(c):
+        c = c / 255.0
+        return c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
+
+    r, g, b = (linear(c) for c in rgb)
+    x = (0.4124564 * r + 0.3575761 * g + 0.1804375 * b) / 0.95047
+    y = 0.2126729 * r + 0.7151522 * g + 0.0721750 * b
+    z = (0.0193339 * r + 0.1191920 * g + 0.9503041 * b) / 1.08883
+
+    def f(t):
+        return t ** (1 / 3) if t > 216 / 24389 else (24389 / 27 * t + 16) / 116
+
+    fx, fy, fz = f(x), f(y), f(z)
+    return 116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz)
+
+def hex_to_lab(color: str) -> Lab:
+    return rgb_to_lab(hex_to_rgb(color))
+
+def delta_e_2000(lab1: Lab, lab2: Lab) -> float:
+    """Différence de couleur CIEDE2000"""
+    l1, a1, b1 = lab1
+    l2, a2, b2 = lab2
+
+    c1 = math.hypot(a1, b1)
+    c2 = math.hypot(a2, b2)
+    c_mean7 = ((c1 + c2) / 2) ** 7
+    g = 0.5 * (1 - math.sqrt(c_mean7 / (c_mean7 + 25 ** 7)))
+    a1p, a2p = a1 * (1 + g), a2 * (1 + g)
+    c1p, c2p = math.hypot(a1p, b1), math.hypot(a2p, b2)
+    h1p = math.degrees(math.atan2(b1, a1p)) % 360 if c1p else 0.0
+    h2p = math.degrees(math.atan2(b2, a2p)) % 360 if c2p else 0.0
+
+    dl = l2 - l1
+    dc = c2p - c1p
+    if c1p * c2p == 0:
+        dh = 0.0
+    elif abs(h2p - h1p) <= 180:
+        dh = h2p - h1p
+    elif h2p - h1p > 180:
+        dh = h2p - h1p - 360
+    else:
+        dh = h2p - h1p + 360
+    dH = 2 * math.sqrt(c1p * c2p) * math.sin(math.radians(dh / 2))
+
+    l_mean = (l1 + l2) / 2
+    c_mean = (c1p + c2p) / 2
+    if c1p * c2p == 0:
+        h_mean = h1p + h2p
+    elif abs(h1p - h2p) <= 180:
+        h_mean = (h1p + h2p) / 2
+    elif h1p + h2p < 360:
+        h_mean = (h1p + h2p + 360) / 2
+    else:
+        h_mean = (h1p + h2p - 360) / 2
+
+    t = (1 - 0.17 * math.cos(math.radians(h_mean - 30))
+         + 0.24 * math.cos(math.radians(2 * h_mean))
+         + 0.32 * math.cos(math.radians(3 * h_mean + 6))
+         - 0.20 * math.cos(math.radians(4 * h_mean - 63)))
+    d_theta = 30 * math.exp(-(((h_mean - 275) / 25) ** 2))
+    c_mean_7 = c_mean ** 7
+    r_c = 2 * math.sqrt(c_mean_7 / (c_mean_7 + 25 ** 7))
+    s_l = 1 + 0.015 * (l_mean - 50) ** 2 / math.sqrt(20 + (l_mean - 50) ** 2)
+    s_c = 1 + 0.045 * c_mean
+    s_h = 1 + 0.015 * c_mean * t
+    r_t = -math.sin(math.radians(2 * d_theta)) * r_c
+
+    return math.sqrt(
+        (dl / s_l) ** 2 + (dc / s_c) ** 2 + (dH / s_h) ** 2
+        + r_t * (dc / s_c) * (dH / s_h)
+    )
+
+class KDTree:
+    """Arbre k-d sur des points Lab, pour la recherche des plus proches voisins"""
+
+    def __init__(self, points: List[Lab]):
+        self.points = points
+        # Noeud : (index du point, axe, sous-arbre gauche, sous-arbre droit)
+        self.root = self._build(list(range(len(points))), 0)
+
+    def _build(self, indices: List[int], depth: int):
+        if not indices:
+            return None
+        axis = depth % 3
+        indices.sort(key=lambda i: self.points[i][axis])
+        middle = len(indices) // 2
+        return (indices[middle], axis,
+                self._build(indices[:middle], depth + 1),
+                self._build(indices[middle + 1:], depth + 1))
+
+    def nearest(self, target: Lab, k: int) -> List[Tuple[float, int]]:
+        """Les k points les plus proches (distance euclidienne au carré, index)"""
+        best: List[Tuple[float, int]] = []  # Tas max (distances négatives)
+        points = self.points
+
+        def visit(node):
+            if node is None:
+                return
+            index, axis, left, right = node
+            point = points[index]
+            distance = ((point[0] - target[0]) ** 2 + (point[1] - target[1]) ** 2
+                        + (point[2] - target[2]) ** 2)
+            if len(best) < k:
+                heapq.heappush(best, (-distance, index))
+            elif distance < -best[0][0]:
+                heapq.heapreplace(best, (-distance, index))
+
+            diff = target[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            visit(near)
+            # Explorer l'autre côté seulement s'il peut contenir un point plus proche
+            if len(best) < k or diff * diff < -best[0][0]:
+                visit(far)
+
+        visit(self.root)
+        return sorted((-d, i) for d, i in best)
+
+class ThreadMatcher:
+    """Recherche des fils les plus proches d'une couleur (ΔE2000)
+
+    Le catalogue est converti une seule fois en Lab. Les candidats sont
+    présélectionnés par distance euclidienne dans un arbre k-d (ΔE76), puis
+    reclassés par ΔE2000 ; en dessous de BRUTE_FORCE_LIMIT fils, tous les
+    fils sont comparés directement.
+    """
+    BRUTE_FORCE_LIMIT = 64
+    CANDIDATES_PER_RESULT = 4  # Taille de la présélection par résultat demandé
+
+    def __init__(self, threads: List[ThreadColor]):
+        self.threads = threads
+        self.labs = [hex_to_lab(thread.hex_color) for thread in threads]
+        self.tree = KDTree(self.labs) if len(threads) > self.BRUTE_FORCE_LIMIT else None
+        self._cache: Dict[Tuple[str, int], List[Tuple[ThreadColor, float]]] = {}
+
+    def match(self, color: str, k: int = 1) -> List[Tuple[ThreadColor, float]]:
+        """Les k fils les plus proches de la couleur, avec leur ΔE2000"""
+        key = (color.lower(), k)
+        if key in self._cache:
+            return self._cache[key]
+        if not self.threads:
+            return []
+
+        try:
+            lab = hex_to_lab(color)
+        except ValueError:  # Couleur Tk inconnue de PIL
+            return []
+        if self.tree is None:
+            candidates = range(len(self.threads))
+        else:
+            pool = min(len(self.threads), max(k * self.CANDIDATES_PER_RESULT, 8))
+            candidates = [index for _, index in self.tree.nearest(lab, pool)]
+
+        scored = sorted((delta_e_2000(lab, self.labs[i]), i) for i in candidates)
+        result = [(self.threads[i], delta) for delta, i in scored[:k]]
+        self._cache[key] = result
+        return result
+
+    def match_palette(self, colors: Sequence[str], k: int = 1) -> List[List[Tuple[ThreadColor, float]]]:
+        """Associe chaque couleur d'une palette à ses k fils les plus proches"""
+        return [self.match(color, k) for color in colors]
+
+class ThreadColorIndex:
+    """Index de correspondance couleur -> fil, construit à la demande par filtre"""
+
+    def __init__(self, db: ThreadDatabase):
+        self.db = db
+        # Filtre -> (révision de la base au moment de la construction, index)
+        self._matchers: Dict[Tuple[Optional[str], bool], Tuple[tuple, ThreadMatcher]] = {}
+
+    def matcher(self, brand: Optional[str] = None, favorites_only: bool = False) -> ThreadMatcher:
+        """Retourne l'index pour une marque et/ou les seuls favoris
+
+        L'index est reconstruit si le catalogue (ou, pour les favoris, la
+        liste des favoris) a changé depuis sa construction.
+        """
+        key = (brand, favorites_only)
+        revision = (self.db.catalog_revision,
+                    self.db.favorites_revision if favorites_only else 0)
+        cached = self._matchers.get(key)
+        if cached is None or cached[0] != revision:
+            threads = self.db.get_favorites() if favorites_only else self.db.get_all_threads(brand)
+            if favorites_only and brand:
+                threads = [thread for thread in threads if thread.brand == brand]
+            cached = (revision, ThreadMatcher(threads))
+            self._matchers[key] = cached
+        return cached[1]
+
+    def invalidate(self):
+        """À appeler quand le catalogue ou les favoris changent"""
+        self._matchers.clear()
+
+    def match_palette(self, colors: Sequence[str], k: int = 1, brand: Optional[str] = None,
+                      favorites_only: bool = False) -> List[List[Tuple[ThreadColor, float]]]:
+        return self.matcher(brand, favorites_only).match_palette(colors, k)
@@ -0,0 +1,367 @@
+# conversion_service.py
+"""Service local de conversion et d'export des motifs
+
+Usage : python conversion_service.py [--socket CHEMIN | --port N] [--workers N] [--max-queue N]
+                                     [--no-cache]
+
+Le service reçoit une description de motif en JSON et retourne le fichier
+machine (PES, DST ou JEF) :
+
+    POST /convert   {"format": "pes", "density": 2.0, "hoop": [100, 100],
+                     "palette": ["#ff0000", ...],
+                     "shapes": [{"type": "rectangle", "coords": [x1, y1, x2, y2],
+                                 "color": 0}, ...],
+                     "max_colors": 0, "tolerance": 0}
+    GET  /metrics   file d'attente, requêtes fusionnées, latences
+
+Les coordonnées sont en mm ; color est un index de palette ou une couleur
+hex. Un texte ("type": "text", coords [x, y] du coin haut gauche) porte
+aussi "text" et "font" (police Tk, ex. ["Arial", 24, "bold"]). Les formes
+répétées peuvent porter une même clé "instance" : leurs points ne sont
+calculés qu'une fois, puis décalés. Les conversions sont faites par un
+pool de processus borné : au-delà de max_queue conversions en cours, les
+nouvelles requêtes sont refusées (503). Des requêtes identiques reçues
+pendant qu'une conversion est en cours partagent son résultat au lieu
+d'être converties à nouveau.
+
+Les fichiers produits sont conservés dans le cache d'export
+(export_cache.py) : une requête déjà servie est relue sans conversion.
+
+Sur un socket Unix, le service n'est accessible qu'en local, sans réseau ;
+request_conversion() et fetch_metrics() en sont le client.
+"""
+
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from PIL import ImageColor
+from embroidery_export import EXPORTERS
+from export_cache import ExportCache, export_key
+from stitch_conversion import convert_shapes
+from viewport import PIXELS_PER_MM
+
+DEFAULT_PORT = 8765
+MAX_QUEUE = 32          # Conversions en cours au-delà desquelles les requêtes sont refusées
+REQUEST_TIMEOUT = 120   # Secondes d'attente maximale d'une conversion
+LATENCY_WINDOW = 1000   # Nombre de requêtes récentes prises en compte dans les latences
+MAX_BODY = 16 * 1024 * 1024
+
+SHAPE_COORDS = {"rectangle": 4, "oval": 4, "text": 2}
+
+class ServiceBusy(RuntimeError):
+    """File d'attente pleine : la requête doit être renvoyée plus tard"""
+
+def parse_description(description: Dict[str, Any]) -> Dict[str, Any]:
+    """Valide une description de motif et la ramène à une forme canonique
+
+    Les formes sont converties en (type, coordonnées du monde, config),
+    comme capture_state(). Lève ValueError si la description est invalide.
+    """
+    if not isinstance(description, dict):
+        raise ValueError("La description doit être un objet JSON")
+    format_type = str(description.get("format", "pes")).lower()
+    if format_type not in EXPORTERS:
+        raise ValueError(f"Format inconnu : {format_type} (disponibles : {', '.join(EXPORTERS)})")
+    try:
+        density = float(description.get("density", 2.0))
+        hoop = [int(value) for value in description.get("hoop", (100, 100))]
+        max_colors = int(description.get("max_colors", 0))
+        tolerance = float(description.get("tolerance", 0.0))
+    except (TypeError, ValueError):
+        raise ValueError("Paramètres numériques invalides (density, hoop, max_colors, tolerance)")
+    if density <= 0 or len(hoop) != 2:
+        raise ValueError("density doit être positive et hoop de la forme [largeur, hauteur]")
+
+    palette = description.get("palette") or []
+    shapes = []
+    for index, shape in enumerate(description.get("shapes") or []):
+        if not isinstance(shape, dict):
+            raise ValueError(f"Forme {index} : objet JSON attendu")
+        item_type = shape.get("type")
+        if item_type not in SHAPE_COORDS:
+            raise ValueError(f"Forme {index} : type inconnu {item_type!r}")
+        coords = shape.get("coords") or []
+        if len(coords) != SHAPE_COORDS[item_type]:
+            raise ValueError(f"Forme {index} : {SHAPE_COORDS[item_type]} coordonnées attendues")
+        color = shape.get("color", 0)
+        if isinstance(color, int):
+            if not 0 <= color < len(palette):
+                raise ValueError(f"Forme {index} : couleur {color} absente de la palette")
+            color = palette[color]
+        try:
+            color = "#%02x%02x%02x" % ImageColor.getrgb(str(color))[:3]
+        except ValueError:
+            raise ValueError(f"Forme {index} : couleur invalide {color!r}")
+        try:
+            world = [float(value) * PIXELS_PER_MM for value in coords]
+        except (TypeError, ValueError):
+            raise ValueError(f"Forme {index} : coordonnées invalides")
+        config = {"fill": color}
+        if item_type == "text":
+            text, text_font = shape.get("text", ""), shape.get("font", ["Arial", 12])
+            if not isinstance(text, str) or not isinstance(text_font, (str, list)):
+                raise ValueError(f"Forme {index} : text (chaîne) et font (liste ou chaîne) attendus")
+            config.update(text=text, font=text_font, anchor="nw")
+        instance = shape.get("instance")
+        if instance is not None:
+            if not isinstance(instance, (int, str)) or isinstance(instance, bool):
+                raise ValueError(f"Forme {index} : instance invalide {instance!r}")
+            config["instance"] = instance
+        shapes.append((item_type, world, config))
+
+    return {"format": format_type, "density": density, "hoop": hoop,
+            "max_colors": max_colors, "tolerance": tolerance, "shapes": shapes}
+
+def request_key(request: Dict[str, Any]) -> str:
+    """Empreinte d'une requête canonique : deux requêtes identiques ont la même"""
+    data = json.dumps(request, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+def convert_request(request: Dict[str, Any]) -> bytes:
+    """Convertit une requête canonique en fichier machine (exécuté dans le pool)"""
+    design = convert_shapes(request["shapes"], request["density"], tuple(request["hoop"]),
+                            request["max_colors"], request["tolerance"])
+    return EXPORTERS[request["format"]]().to_bytes(design)
+
+class ConversionService:
+    """Pool de conversion borné, avec fusion des requêtes identiques et mesures"""
+
+    def __init__(self, workers: Optional[int] = None, max_queue: int = MAX_QUEUE, executor=None,
+                 cache: Optional[ExportCache] = None):
+        self.executor = executor or ProcessPoolExecutor(max_workers=workers)
+        self.max_queue = max_queue
+        self.cache = cache  # Fichiers déjà produits, relus sans passer par le pool
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}  # Empreinte -> conversion en cours
+        self._latencies = deque(maxlen=LATENCY_WINDOW)  # Secondes, requêtes récentes
+        self._counters = {"requests": 0, "coalesced": 0, "rejected": 0, "errors": 0}
+
+    def submit(self, description: Dict[str, Any]) -> Future:
+        """Lance la conversion d'une description, ou rejoint une conversion identique en cours"""
+        request = parse_description(description)
+        key = request_key(request)
+        with self._lock:
+            self._counters["requests"] += 1
+            future = self._in_flight.get(key)
+            if future is not None:
+                self._counters["coalesced"] += 1
+                return future
+
+        cache_key = export_key(key, request["format"], {})
+        if self.cache is not None:
+            content = self.cache.get(cache_key)
+            if content is not None:
+                future = Future()
+                future.set_result(content)
+                return future
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:  # Lancée entre-temps par une requête identique
+                self._counters["coalesced"] += 1
+                return future
+            if len(self._in_flight) >= self.max_queue:
+                self._counters["rejected"] += 1
+                raise ServiceBusy(f"File d'attente pleine ({self.max_queue} conversions en cours)")
+            future = self.executor.submit(convert_request, request)
+            self._in_flight[key] = future
+        future.add_done_callback(lambda done: self._finished(key, cache_key, done))
+        return future
+
+    def _finished(self, key: str, cache_key: str, future: Future):
+        if self.cache is not None and not future.cancelled() and future.exception() is None:
+            self.cache.put(cache_key, future.result())
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def convert(self, description: Dict[str, Any], timeout: float = REQUEST_TIMEOUT) -> bytes:
+        """Convertit une description et retourne le fichier machine"""
+        start = time.perf_counter()
+        try:
+            # Description invalide (400) ou file pleine (503) : pas une erreur de conversion
+            future = self.submit(description)
+            try:
+                return future.result(timeout)
+            except Exception:
+                with self._lock:
+                    self._counters["errors"] += 1
+                raise
+        finally:
+            with self._lock:
+                self._latencies.append(time.perf_counter() - start)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Profondeur de la file, compteurs et latences (ms) des requêtes récentes"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            result: Dict[str, Any] = dict(self._counters, queue_depth=len(self._in_flight),
+                                          max_queue=self.max_queue)
+        if latencies:
+            result["latency_ms"] = {
+                "mean": sum(latencies) / len(latencies) * 1000,
+                "p50": latencies[len(latencies) // 2] * 1000,
+                "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+                "max": latencies[-1] * 1000,
+            }
+        if self.cache is not None:
+            result["cache"] = self.cache.report()
+        return result
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+class ConversionHandler(BaseHTTPRequestHandler):
+    """Requêtes HTTP du service : POST /convert et GET /metrics"""
+
+    def address_string(self):
+        # Sur un socket Unix, client_address est une chaîne vide
+        return self.client_address[0] if self.client_address else "local"
+
+    def send_json(self, status: int, data: Dict[str, Any]):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self.send_json(200, self.server.service.metrics())
+        else:
+            self.send_json(404, {"error": f"Chemin inconnu : {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/convert":
+            self.send_json(404, {"error": f"Chemin inconnu : {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.send_json(400, {"error": "En-tête Content-Length invalide"})
+            return
+        if length > MAX_BODY:
+            self.send_json(413, {"error": "Description trop volumineuse"})
+            return
+        try:
+            description = json.loads(self.rfile.read(length).decode("utf-8"))
+            data = self.server.service.convert(description)
+        except ServiceBusy as e:
+            self.send_json(503, {"error": str(e)})
+            return
+        except ValueError as e:  # JSON ou description invalide
+            self.send_json(400, {"error": str(e)})
+            return
+        except Exception as e:
+            print(f"Erreur lors de la conversion : {str(e)}")
+            self.send_json(500, {"error": str(e)})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Disposition",
+                         f'attachment; filename="motif.{description.get("format", "pes").lower()}"')
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serveur HTTP sur un socket Unix (accès local uniquement)"""
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)  # Socket laissé par une exécution précédente
+        super().server_bind()
+
+def make_server(service: ConversionService, socket_path: Optional[str] = None,
+                host: str = "127.0.0.1", port: int = DEFAULT_PORT):
+    """Crée le serveur HTTP du service, sur un socket Unix si socket_path est donné"""
+    if socket_path:
+        server = UnixHTTPServer(socket_path, ConversionHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), ConversionHandler)
+    server.service = service
+    return server
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """Connexion HTTP cliente sur un socket Unix"""
+
+    def __init__(self, socket_path: str, timeout: float = REQUEST_TIMEOUT):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+def _connection(socket_path: Optional[str], host: str, port: int) -> http.client.HTTPConnection:
+    if socket_path:
+        return UnixHTTPConnection(socket_path)
+    return http.client.HTTPConnection(host, port, timeout=REQUEST_TIMEOUT)
+
+def request_conversion(description: Dict[str, Any], socket_path: Optional[str] = None,
+                       host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> bytes:
+    """Client : envoie une description au service et retourne le fichier machine"""
+    conn = _connection(socket_path, host, port)
+    try:
+        conn.request("POST", "/convert", body=json.dumps(description).encode("utf-8"),
+                     headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        data = response.read()
+    finally:
+        conn.close()
+    if response.status != 200:
+        message = json.loads(data.decode("utf-8")).get("error", "") if data else ""
+        raise RuntimeError(f"Conversion refusée ({response.status}) : {message}")
+    return data
+
+def fetch_metrics(socket_path: Optional[str] = None, host: str = "127.0.0.1",
+                  port: int = DEFAULT_PORT) -> Dict[str, Any]:
+    """Client : mesures du service"""
+    conn = _connection(socket_path, host, port)
+    try:
+        conn.request("GET", "/metrics")
+        return json.loads(conn.getresponse().read().decode("utf-8"))
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Service local de conversion des motifs")
+    parser.add_argument("--socket", help="Chemin du socket Unix (sinon HTTP sur 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=None, help="Processus de conversion")
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE)
+    parser.add_argument("--no-cache", action="store_true", help="Ne pas utiliser le cache d'export")
+    args = parser.parse_args()
+
+    service = ConversionService(args.workers, args.max_queue,
+                                cache=None if args.no_cache else ExportCache())
+    server = make_server(service, args.socket, port=args.port)
+    where = args.socket or f"http://127.0.0.1:{args.port}"
+    print(f"Service de conversion à l'écoute sur {where}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+if __name__ == "__main__":
+    main()
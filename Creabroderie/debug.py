@@ -1,11 +1,21 @@
+import time
+STARTUP_START = time.perf_counter()  # Référence pour mesurer le démarrage à froid
 import tkinter as tk
 from tkinter import ttk, colorchooser, font, simpledialog, filedialog, messagebox
-from PIL import Image, ImageDraw, ImageTk, ImageFont
-import os
-from thread_management import ThreadPanel
-from typing import List, Tuple
 import math
-from embroidery_export import EmbroideryDesign, StitchPoint, StitchType, PesExporter, DstExporter, JefExporter
+import os
+from typing import TYPE_CHECKING
+from viewport import (Viewport, PIXELS_PER_MM, LOD_FULL, LOD_SIMPLIFIED, LOD_COARSE, oval_outline,
+                      scale_font)
+from font_list import FontCatalog, LRUCache, VirtualListbox, load_font_list
+from profiling import PROFILER, span
+
+# Les modules lourds (PIL, base des fils, conversion, export) sont importés
+# à leur première utilisation, pour que la fenêtre s'affiche au plus vite
+if TYPE_CHECKING:
+    from color_matching import ThreadColorIndex
+    from embroidery_export import EmbroideryDesign
+    from thread_management import ThreadPanel
 
 class EmbroideryDesigner:
     def __init__(self, root):
@@ -30,7 +40,32 @@ class EmbroideryDesigner:
         self.grid_size = 20
         self.show_grid = False
         self.snap_to_grid = False
-        self.grid_lines = []
+        self.grid_items = set()  # Éléments du canvas appartenant à la grille
+        self.grid_image = None  # Image de la grille (référence conservée pour Tk)
+        self.grid_image_key = None  # (largeur, hauteur, pas) de l'image en cache
+
+        # Aperçu des points de broderie
+        self.show_stitch_preview = False
+        self.stitch_preview = None  # StitchPreviewRenderer, créé au premier affichage de l'aperçu
+        self.preview_density = 2.0  # Densité utilisée pour l'aperçu
+        self.preview_layer = set()  # Éléments du canvas appartenant à l'aperçu
+        self.preview_tile_items = {}  # Tuile -> élément image du canvas
+        self.preview_photos = {}  # Tuile -> PhotoImage (références conservées pour Tk)
+        self.preview_veil = None  # Voile blanc atténuant les formes sous l'aperçu
+        self.preview_veil_image = None
+        self.preview_veil_key = None
+        self.preview_pending = None  # Identifiant du rafraîchissement programmé
+        self.preview_design = None  # Dernier motif converti pour l'aperçu
+        self.preview_shapes = {}  # Points de chaque forme de l'aperçu (voir shapes_to_stitches)
+
+        # Vue (zoom et déplacement) et niveau de détail
+        self.viewport = Viewport()
+        self.world_fonts = {}  # Élément texte -> police à 100 %
+        self.lod_proxies = {}  # Forme simplifiée affichée -> élément remplacé
+        self.lod_hidden = set()  # Éléments masqués par le niveau de détail
+        self.lod_checked = set()  # Éléments déjà examinés au niveau de détail courant
+        self.lod_level = LOD_FULL  # Niveau de détail des simplifications affichées
+        self.pan_last = None  # Dernière position de la souris pendant un déplacement de la vue
         self.current_outline_width = 1  # Épaisseur par défaut du contour
         self.outline_width = tk.StringVar(value="1")  # Pour le widget Combobox
 
@@ -39,6 +74,13 @@ class EmbroideryDesigner:
         self.current_step = -1  # Position actuelle dans l'historique
         self.max_history = 50  # Nombre maximum d'actions dans l'historique
 
+        # Projet enregistré
+        self.project_path = None  # Fichier .cbrd du dessin en cours
+        self.project_file = None  # ProjectFile ouvert (les points en cache y sont lus sans copie)
+        self.stitch_cache = None  # (empreinte des formes, paramètres, motif converti)
+        self.autosave = None  # AutosaveJournal, démarré une fois la récupération proposée
+        self.export_cache = None  # ExportCache des fichiers machine, ouvert au premier export
+
         # Variables de sélection
         self.selected_item = None
         self.selection_rect = None
@@ -62,8 +104,14 @@ class EmbroideryDesigner:
         self.HANDLE_SW = 6  # Sud-Ouest
         self.HANDLE_W  = 7  # Ouest
 
+        # Correspondance entre les couleurs du motif et les fils du catalogue
+        self.thread_index = None  # Construit au premier export
+
         # Variables pour copier/coller
-        self.clipboard = None  # Stockera les propriétés de l'élément copié
+        self.clipboard = None  # Stockera les propriétés des éléments copiés
+        self.selected_items = []  # Éléments sélectionnés en plus de selected_item (Maj+clic, groupe)
+        self.selection_marks = {}  # Élément de selected_items -> cadre de sélection
+        self.next_link_id = 1  # Prochain numéro d'instance ou de groupe
         
         # Variables pour le texte
         self.text_preview = ""
@@ -73,6 +121,12 @@ class EmbroideryDesigner:
         self.font_italic = tk.BooleanVar(value=False)
         self.font_underline = tk.BooleanVar(value=False)
 
+        # Aperçu de police : un rendu au plus par image affichée, mis en cache
+        self.font_preview_pending = None  # Identifiant du rendu programmé
+        self.font_preview_key = None  # Paramètres de l'aperçu affiché
+        self.preview_fonts = LRUCache(32)  # (famille, taille, graisse, style) -> font.Font
+        self.preview_layouts = LRUCache(256)  # Paramètres complets -> mise en page
+
         # Frame principal
         self.main_frame = ttk.Frame(self.root)
         self.main_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -85,18 +139,21 @@ class EmbroideryDesigner:
         self.main_paned = ttk.PanedWindow(self.main_frame, orient=tk.HORIZONTAL)
         self.main_paned.pack(fill=tk.BOTH, expand=True)
      
-        # Panneau de fils à gauche
-        self.thread_panel = ThreadPanel(self.main_paned, self.on_thread_select)
-        self.main_paned.add(self.thread_panel, weight=1)
+        # Panneau de fils à gauche : construit après le premier affichage
+        # (ouverture de la base des fils), voir ensure_thread_panel()
+        self.thread_panel = None
 
         # Frame de contenu à droite
         self.content_frame = ttk.Frame(self.main_paned)
         self.main_paned.add(self.content_frame, weight=3)
         
         self.setup_canvas()
-        self.setup_text_panel()
+        self.font_listbox = None  # Panneau du texte construit après le premier affichage
 
         # Raccourcis clavier (macOS)
+        self.root.bind('<Command-o>', lambda e: self.open_project())
+        self.root.bind('<Command-s>', lambda e: self.save_project())
+        self.root.bind('<Command-Shift-S>', lambda e: self.save_project(save_as=True))  # ⌘⇧S
         self.root.bind('<Command-z>', lambda e: self.undo())
         self.root.bind('<Command-y>', lambda e: self.redo())
         self.root.bind('<Command-c>', lambda e: self.copy())
@@ -110,6 +167,70 @@ class EmbroideryDesigner:
         self.root.bind('<Command-Shift-F>', lambda e: self.bring_to_front())      # ⌘⇧F
         self.root.bind('<Command-Shift-B>', lambda e: self.send_to_back())        # ⌘⇧B
 
+        # Raccourcis pour la vue
+        self.root.bind('<Command-plus>', lambda e: self.zoom_view(1.25))    # ⌘+
+        self.root.bind('<Command-equal>', lambda e: self.zoom_view(1.25))   # ⌘= (sans Maj)
+        self.root.bind('<Command-minus>', lambda e: self.zoom_view(0.8))    # ⌘-
+        self.root.bind('<Command-0>', lambda e: self.reset_view())          # ⌘0
+
+        # Fin du démarrage une fois la fenêtre affichée
+        self.root.protocol("WM_DELETE_WINDOW", self.quit_application)
+        self.root.after_idle(self.on_window_ready)
+
+    def on_window_ready(self):
+        """Note le démarrage à froid dans le profileur puis lance les chargements différés"""
+        PROFILER.add_span("startup_window_ready", STARTUP_START, time.perf_counter())
+        self.recover_autosave()
+        self.root.after_idle(self.ensure_thread_panel)
+        self.root.after_idle(self.ensure_font_list, True)
+
+    def ensure_thread_panel(self) -> "ThreadPanel":
+        """Construit le panneau des fils (et ouvre la base) s'il ne l'est pas déjà"""
+        if self.thread_panel is None:
+            from thread_management import ThreadPanel
+            self.thread_panel = ThreadPanel(self.main_paned, self.on_thread_select)
+            self.main_paned.insert(0, self.thread_panel, weight=1)
+        return self.thread_panel
+
+    def ensure_text_panel(self):
+        """Construit le panneau des paramètres du texte s'il ne l'est pas déjà"""
+        if self.font_listbox is None:
+            self.setup_text_panel()
+
+    def record_autosave(self, state):
+        """Ajoute un état au journal de sauvegarde automatique, s'il est démarré"""
+        if self.autosave is not None:
+            self.autosave.record(state)
+
+    def recover_autosave(self):
+        """Propose de récupérer le travail d'une session interrompue, puis démarre le journal"""
+        from autosave import AutosaveJournal
+        self.autosave = AutosaveJournal()
+        state = []
+        if self.autosave.has_recovery():
+            recovered = self.autosave.recover()
+            if recovered and messagebox.askyesno(
+                    "Récupération",
+                    "L'application ne s'est pas fermée correctement.\n"
+                    f"Récupérer le dessin non enregistré ({len(recovered)} éléments) ?"):
+                state = recovered
+                self.restore_state(state)
+                self.history = [state]
+                self.current_step = 0
+        self.autosave.start(state)
+
+    def quit_application(self):
+        """Fermeture normale : le journal de sauvegarde automatique est effacé
+
+        Les favoris en attente d'écriture sont enregistrés avant de quitter.
+        """
+        if self.autosave is not None:
+            self.autosave.close(discard=True)
+        if self.thread_panel is not None:
+            self.thread_panel.db.close()
+        self.close_project()
+        self.root.quit()
+
     def on_thread_select(self, hex_color: str):
         """Callback appelé quand une couleur de fil est sélectionnée"""
         # L'indentation du docstring et du code était incorrecte
@@ -125,9 +246,16 @@ class EmbroideryDesigner:
         file_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Fichier", menu=file_menu)
         file_menu.add_command(label="Nouveau", command=self.new_design)
+        file_menu.add_command(label="Ouvrir... (⌘O)", command=self.open_project)
+        file_menu.add_command(label="Enregistrer (⌘S)", command=self.save_project)
+        file_menu.add_command(label="Enregistrer sous... (⌘⇧S)",
+                              command=lambda: self.save_project(save_as=True))
+        file_menu.add_separator()
         file_menu.add_command(label="Exporter...", command=self.export_design)
+        file_menu.add_command(label="Importer une image...", command=self.import_raster_image)
+        file_menu.add_command(label="Importer un catalogue de fils...", command=self.import_thread_catalog)
         file_menu.add_separator()
-        file_menu.add_command(label="Quitter", command=self.root.quit)
+        file_menu.add_command(label="Quitter", command=self.quit_application)
         
        # Menu Edition
         edit_menu = tk.Menu(menubar, tearoff=0)
@@ -137,6 +265,7 @@ class EmbroideryDesigner:
         edit_menu.add_separator()
         edit_menu.add_command(label="Copier (⌘C)", command=self.copy)
         edit_menu.add_command(label="Coller (⌘V)", command=self.paste)
+        edit_menu.add_command(label="Rompre le lien des copies", command=self.unlink_selected)
         edit_menu.add_separator()
         edit_menu.add_command(label="Supprimer", command=self.delete_selected)
 
@@ -158,8 +287,19 @@ class EmbroideryDesigner:
         menubar.add_cascade(label="Affichage", menu=view_menu)
         view_menu.add_checkbutton(label="Grille", command=self.toggle_grid)
         view_menu.add_checkbutton(label="Magnétisme", command=self.toggle_snap)
+        view_menu.add_checkbutton(label="Aperçu des points", command=self.toggle_stitch_preview)
+        view_menu.add_separator()
+        view_menu.add_command(label="Zoom avant (⌘+)", command=lambda: self.zoom_view(1.25))
+        view_menu.add_command(label="Zoom arrière (⌘-)", command=lambda: self.zoom_view(0.8))
+        view_menu.add_command(label="Zoom 100 % (⌘0)", command=self.reset_view)
         view_menu.add_separator()
         view_menu.add_command(label="Panneau des fils", command=self.toggle_thread_panel)
+        view_menu.add_separator()
+        self.profiling_var = tk.BooleanVar(value=PROFILER.enabled)
+        view_menu.add_checkbutton(label="Profiler les exports", variable=self.profiling_var,
+                                  command=self.toggle_profiling)
+        view_menu.add_command(label="Enregistrer la trace de profilage...",
+                              command=self.save_profiling_trace)
         
         # Menu Outils
         tools_menu = tk.Menu(menubar, tearoff=0)
@@ -173,7 +313,7 @@ class EmbroideryDesigner:
         """Interface d'export du motif"""
         export_window = tk.Toplevel(self.root)
         export_window.title("Exporter le motif")
-        export_window.geometry("400x300")
+        export_window.geometry("420x640")
         export_window.transient(self.root)
         export_window.grab_set()
         
@@ -185,7 +325,7 @@ class EmbroideryDesigner:
         format_frame = ttk.Frame(params_frame)
         format_frame.pack(fill=tk.X, padx=5, pady=5)
         ttk.Label(format_frame, text="Format :").pack(side=tk.LEFT)
-        format_var = tk.StringVar(value="pes")
+        format_var = tk.StringVar(value="Brother (*.pes)")
         formats = {
             "Brother (*.pes)": "pes",
             "Tajima (*.dst)": "dst",
@@ -215,11 +355,154 @@ class EmbroideryDesigner:
                                     textvariable=density_var, state="readonly")
         density_combo.pack(side=tk.LEFT, padx=5)
 
+        # Fils du catalogue utilisés pour la correspondance des couleurs
+        threads_frame = ttk.Frame(params_frame)
+        threads_frame.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Label(threads_frame, text="Fils :").pack(side=tk.LEFT)
+        thread_filters = {
+            "Toutes les marques": (None, False),
+            "Favoris": (None, True),
+        }
+        for brand in self.ensure_thread_panel().db.get_brands():
+            thread_filters[brand] = (brand, False)
+        thread_var = tk.StringVar(value="Toutes les marques")
+        thread_combo = ttk.Combobox(threads_frame, values=list(thread_filters.keys()),
+                                    textvariable=thread_var, state="readonly")
+        thread_combo.pack(side=tk.LEFT, padx=5)
+
+        # Réduction de la palette (0 : pas de réduction)
+        reduction_frame = ttk.Frame(params_frame)
+        reduction_frame.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Label(reduction_frame, text="Fils max :").pack(side=tk.LEFT)
+        max_colors_var = tk.StringVar(value="0")
+        max_colors_spin = ttk.Spinbox(reduction_frame, from_=0, to=64, width=4,
+                                      textvariable=max_colors_var)
+        max_colors_spin.pack(side=tk.LEFT, padx=5)
+        ttk.Label(reduction_frame, text="Tolérance ΔE :").pack(side=tk.LEFT)
+        tolerance_var = tk.StringVar(value="0")
+        tolerance_spin = ttk.Spinbox(reduction_frame, from_=0, to=30, increment=1, width=4,
+                                     textvariable=tolerance_var)
+        tolerance_spin.pack(side=tk.LEFT, padx=5)
+
+        def reduction_settings():
+            """Retourne (fils max, tolérance ΔE) saisis dans la fenêtre"""
+            try:
+                return max(0, int(max_colors_var.get())), max(0.0, float(tolerance_var.get()))
+            except ValueError:
+                return 0, 0.0
+
         # Informations
         info_frame = ttk.LabelFrame(export_window, text="Informations")
         info_frame.pack(fill=tk.X, padx=10, pady=5)
-        self.export_info_label = ttk.Label(info_frame, text="Calculé des points...")
+        self.export_info_label = ttk.Label(info_frame, text="Calculé des points...",
+                                           justify=tk.LEFT)
         self.export_info_label.pack(padx=5, pady=5)
+
+        def show_thread_matches(event=None):
+            """Affiche le fil le plus proche de chaque couleur du motif"""
+            usage = {}  # Couleur -> nombre d'éléments qui l'utilisent
+            for item_type, coords, config in self.capture_state():
+                fill = config.get('fill')
+                if fill:
+                    usage[fill] = usage.get(fill, 0) + 1
+            max_colors, tolerance = reduction_settings()
+            from palette import reduce_palette
+            palette, _ = reduce_palette(list(usage), list(usage.values()), max_colors, tolerance)
+            brand, favorites_only = thread_filters[thread_var.get()]
+            matches = self.get_thread_index().match_palette(palette, 1, brand, favorites_only)
+
+            lines = []
+            if len(palette) < len(usage):
+                lines.append(f"{len(usage)} couleurs réduites à {len(palette)} fils")
+            for color, match in zip(palette[:8], matches):
+                if match:
+                    thread, delta_e = match[0]
+                    lines.append(f"{color} → {self.format_thread(thread)} (ΔE {delta_e:.1f})")
+                else:
+                    lines.append(f"{color} → aucun fil")
+            if len(palette) > 8:
+                lines.append(f"... et {len(palette) - 8} autres couleurs")
+            self.export_info_label.config(text="\n".join(lines) or "Aucune couleur")
+
+        thread_combo.bind('<<ComboboxSelected>>', show_thread_matches)
+        for spin in (max_colors_spin, tolerance_spin):
+            spin.config(command=show_thread_matches)
+            spin.bind('<Return>', show_thread_matches)
+            spin.bind('<FocusOut>', show_thread_matches)
+        show_thread_matches()
+
+        def read_settings():
+            """Paramètres de conversion saisis dans la fenêtre"""
+            max_colors, tolerance = reduction_settings()
+            return {
+                "density": float(density_var.get()),
+                "hoop_size": list(map(int, hoop_var.get().split('x'))),
+                "thread_filter": list(thread_filters[thread_var.get()]),
+                "max_colors": max_colors,
+                "tolerance": tolerance,
+            }
+
+        def get_design(settings):
+            """Motif converti avec ces paramètres (repris du dernier export si possible)"""
+            design = self.get_cached_design(settings)
+            if design is None:
+                from project_file import shapes_digest
+                design = self.convert_to_embroidery(
+                    settings["density"], tuple(settings["hoop_size"]),
+                    tuple(settings["thread_filter"]), settings["max_colors"], settings["tolerance"])
+                self.stitch_cache = (shapes_digest(self.capture_state()), settings, design)
+            return design
+
+        # Vérification : densité des piqûres et problèmes trouvés, sur le tambour
+        check_frame = ttk.LabelFrame(export_window, text="Vérification")
+        check_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        check_canvas = tk.Canvas(check_frame, width=380, height=180, bg="white",
+                                 highlightthickness=0)
+        check_canvas.pack(padx=5, pady=5)
+        check_label = ttk.Label(check_frame, text="Vérifié à chaque export.", justify=tk.LEFT)
+        check_label.pack(padx=5, pady=(0, 5), anchor=tk.W)
+
+        def check_design(design):
+            """Vérifie le motif et affiche la carte des problèmes"""
+            from validator import validate_design
+            report = validate_design(design)
+            self.draw_validation_overlay(check_canvas, report)
+            check_label.config(text="\n".join(report.summary()) or "Aucun problème trouvé.")
+            return report
+
+        def check_hoopings(design, hoopings):
+            """Vérifie chaque passage de tambour, et la densité du motif entier
+
+            Retourne les problèmes trouvés, passage par passage.
+            """
+            from dataclasses import replace
+            from multi_hoop import hooping_label
+            from validator import validate_design
+            # Points de chaque passage relatifs au coin du tambour, sauf passage unique
+            origin = (0.0, 0.0) if len(hoopings) > 1 else hoopings[0].origin_mm
+            problems = []
+            for hooping in hoopings:
+                report = validate_design(hooping.design, hoop_origin_mm=origin)
+                problems.extend(f"Passage {hooping_label(hooping)} : {line}"
+                                for line in report.summary())
+            # Motif entier : seule la densité compte, le découpage règle le dépassement
+            overall = validate_design(design)
+            overall = replace(overall, out_of_hoop=0, short_stitches=0, long_stitches=0,
+                              markers={})
+            problems.extend(overall.summary())
+            self.draw_validation_overlay(check_canvas, overall)
+            check_label.config(text="\n".join(problems[:6] + (["..."] if len(problems) > 6 else []))
+                               or "Aucun problème trouvé.")
+            return problems
+
+        def do_check():
+            try:
+                check_label.config(text="Conversion en cours...")
+                export_window.update()
+                check_design(get_design(read_settings()))
+            except Exception as e:
+                check_label.config(text=f"Erreur lors de la vérification : {str(e)}")
+
         # Boutons (à ajouter après self.export_info_label.pack())
         btn_frame = ttk.Frame(export_window)
         btn_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=10)
@@ -248,23 +531,63 @@ class EmbroideryDesigner:
             
             if filename:
                 try:
-                    # Récupérer les paramètres
-                    density = float(density_var.get())
-                    hoop_size = tuple(map(int, hoop_var.get().split('x')))
-                    
                     # Convertir le dessin
                     self.export_info_label.config(text="Conversion en cours...")
                     export_window.update()
                     
-                    design = self.convert_to_embroidery(density, hoop_size)
-                    
-                    # Exporter selon le format
-                    success = self.export_to_format(design, filename, selected_format)
+                    settings = read_settings()
+                    hoop_size = tuple(settings["hoop_size"])
+                    built = []  # Motif converti (une seule fois), si l'export n'était pas dans le cache
+
+                    def build_design():
+                        if not built:
+                            built.append(get_design(settings))
+                        return built[0]
+
+                    # Motif plus grand que le tambour : un fichier par passage de tambour
+                    from stitch_conversion import shapes_size_mm
+                    width, height = shapes_size_mm(self.capture_state())
+                    if not ((width <= hoop_size[0] and height <= hoop_size[1])
+                            or (width <= hoop_size[1] and height <= hoop_size[0])):
+                        from multi_hoop import fits_hoop, split_design
+                        design = build_design()
+                        if not fits_hoop(design):
+                            hoopings = split_design(design)
+                            self.export_hoopings(design, hoopings, check_hoopings(design, hoopings),
+                                                 filename, selected_format, export_window)
+                            return
+
+                    # Vérification : résultat gardé avec l'entrée du cache d'export ;
+                    # sans entrée vérifiée (absente, abîmée, écrite par le service de
+                    # conversion), le motif est construit et vérifié
+                    entry = self.get_export_cache().get_entry(
+                        self.get_export_key(selected_format, settings))
+                    problems = (entry[1] or {}).get("problems") if entry is not None else None
+                    if problems is None:
+                        problems = check_design(build_design()).summary()
+                    else:
+                        check_label.config(text="\n".join(problems) or "Aucun problème trouvé.")
+                    if problems and not messagebox.askyesno(
+                            "Motif à vérifier",
+                            "\n".join(problems) + "\n\nExporter quand même ?",
+                            parent=export_window):
+                        return
+
+                    # Exporter selon le format (relu du cache d'export si possible)
+                    success = self.export_to_format(build_design, filename, selected_format,
+                                                    settings, problems, entry)
                     
                     if success:
+                        from palette import count_color_changes
+                        if built:
+                            details = (f"{len(built[0].thread_colors)} fils, "
+                                       f"{count_color_changes(built[0].points)} changements de couleur.")
+                        else:
+                            details = "Fichier repris du cache d'export."
                         messagebox.showinfo(
                             "Export réussi",
-                            "Le motif a été exporté avec succès.",
+                            f"Le motif a été exporté avec succès.\n{details}\n"
+                            f"Cache d'export : {self.get_export_cache().hit_rate():.0%} de succès.",
                             parent=export_window
                         )
                         export_window.destroy()
@@ -284,11 +607,260 @@ class EmbroideryDesigner:
         ttk.Button(btn_frame, text="Exporter", command=do_export).pack(side=tk.RIGHT, padx=5)
         ttk.Button(btn_frame, text="Annuler", 
                   command=export_window.destroy).pack(side=tk.RIGHT)    
+        ttk.Button(btn_frame, text="Vérifier", command=do_check).pack(side=tk.LEFT)
+
+
+
+    def export_hoopings(self, design, hoopings, problems, filename: str, format_type: str, parent):
+        """Exporte les passages de tambour d'un motif trop grand, après confirmation
+
+        problems (vérification des passages) est rappelé dans la demande de
+        confirmation.
+        """
+        from multi_hoop import export_hoopings
+        hoop_w, hoop_h = hoopings[0].design.hoop_size_mm
+        rotation = (f"\nLe tambour est à poser tourné d'un quart de tour ({hoop_w}x{hoop_h} mm)."
+                    if hoopings[0].rotated else "")
+        if not messagebox.askyesno(
+                "Motif plus grand que le tambour",
+                f"Le motif ({design.size_mm[0]:.0f}x{design.size_mm[1]:.0f} mm) dépasse le "
+                f"tambour ({design.hoop_size_mm[0]}x{design.hoop_size_mm[1]} mm).\n"
+                f"L'exporter en {len(hoopings)} passages de tambour, avec des marques de repérage ?"
+                + rotation
+                + ("\n\nÀ vérifier :\n" + "\n".join(problems[:10])
+                   + (f"\n... et {len(problems) - 10} autres" if len(problems) > 10 else "")
+                   if problems else ""),
+                parent=parent):
+            return
+        paths = export_hoopings(hoopings, filename, format_type)
+        messagebox.showinfo(
+            "Export réussi",
+            f"{len(paths)} fichiers exportés, un par passage de tambour"
+            + (f" (tambour tourné, {hoop_w}x{hoop_h} mm)" if hoopings[0].rotated else "")
+            + " :\n" + "\n".join(os.path.basename(path) for path in paths),
+            parent=parent
+        )
+        parent.destroy()
+
+    def get_cached_design(self, settings):
+        """Motif déjà converti avec ces paramètres, si les formes n'ont pas changé"""
+        if self.stitch_cache is None:
+            return None
+        from project_file import shapes_digest
+        digest, cached_settings, design = self.stitch_cache
+        if cached_settings != settings or digest != shapes_digest(self.capture_state()):
+            return None
+        return design
+
+    def open_project(self):
+        """Ouvre un projet .cbrd ; les points en cache ne sont lus qu'à l'export"""
+        from project_file import ProjectFile, PROJECT_EXTENSION
+        filename = filedialog.askopenfilename(
+            title="Ouvrir un projet",
+            filetypes=[("Projet Créabroderie", "*" + PROJECT_EXTENSION), ("Tous les fichiers", "*.*")]
+        )
+        if not filename:
+            return
+        try:
+            project = ProjectFile(filename)
+            shapes = project.shapes()
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Erreur", f"Impossible d'ouvrir le projet : {e}")
+            return
+
+        self.close_project()
+        self.clear_selection()
+        self.restore_state(shapes)
+        self.history = [shapes]
+        self.current_step = 0
+        self.record_autosave(shapes)
+        self.project_file = project
+        self.project_path = filename
+        design = project.design()
+        if design is not None:
+            self.stitch_cache = (project.stitch_digest(), project.stitch_settings(), design)
+        self.root.title(f"Créateur de Motifs de Broderie - {os.path.basename(filename)}")
+
+    def save_project(self, save_as=False):
+        """Enregistre le dessin, avec les points convertis s'ils sont encore à jour"""
+        from project_file import (ProjectFile, StitchArrays, PROJECT_EXTENSION, encode_project,
+                                  write_project, shapes_digest)
+        filename = self.project_path
+        if save_as or filename is None:
+            filename = filedialog.asksaveasfilename(
+                title="Enregistrer le projet",
+                defaultextension=PROJECT_EXTENSION,
+                filetypes=[("Projet Créabroderie", "*" + PROJECT_EXTENSION)]
+            )
+            if not filename:
+                return
 
+        shapes = self.capture_state()
+        digest = shapes_digest(shapes)
+        design, settings = None, None
+        if self.stitch_cache is not None and self.stitch_cache[0] == digest:
+            _, settings, design = self.stitch_cache
+        try:
+            data = encode_project(shapes, design, settings)
+            # Les points en cache peuvent être lus dans le fichier remplacé :
+            # il n'est fermé qu'une fois le nouveau contenu encodé
+            self.close_project()
+            write_project(filename, data)
+        except OSError as e:
+            messagebox.showerror("Erreur", f"Impossible d'enregistrer le projet : {e}")
+            return
+
+        self.project_path = filename
+        if design is not None and isinstance(design.points, StitchArrays):
+            # Reprendre les points depuis le nouveau fichier plutôt que l'ancien, fermé
+            self.project_file = ProjectFile(filename)
+            self.stitch_cache = (digest, settings, self.project_file.design())
+        self.root.title(f"Créateur de Motifs de Broderie - {os.path.basename(filename)}")
+
+    def close_project(self):
+        """Ferme le fichier du projet ouvert (et oublie les points qui en viennent)"""
+        if self.project_file is not None:
+            from project_file import StitchArrays
+            if self.stitch_cache is not None and isinstance(self.stitch_cache[2].points, StitchArrays):
+                self.stitch_cache = None
+            self.project_file.close()
+            self.project_file = None
+
+    def import_raster_image(self):
+        """Importe une image (logo PNG, JPEG...) sous forme de zones de couleur"""
+        path = filedialog.askopenfilename(
+            parent=self.root,
+            title="Importer une image",
+            filetypes=[("Images", "*.png *.jpg *.jpeg *.bmp *.gif *.tif *.tiff"),
+                       ("Tous les fichiers", "*.*")]
+        )
+        if not path:
+            return
+        width_mm = simpledialog.askfloat("Largeur", "Largeur du motif (mm) :",
+                                         initialvalue=80.0, minvalue=5.0, maxvalue=400.0,
+                                         parent=self.root)
+        if width_mm is None:
+            return
+        max_colors = simpledialog.askinteger("Couleurs", "Nombre de fils maximum :",
+                                             initialvalue=8, minvalue=1, maxvalue=64,
+                                             parent=self.root)
+        if max_colors is None:
+            return
+
+        from image_import import import_image, format_timings
+        self.root.config(cursor="watch")
+        self.root.update_idletasks()
+        try:
+            result = import_image(path, width_mm=width_mm, max_colors=max_colors)
+        except Exception as e:
+            messagebox.showerror("Erreur", f"Erreur lors de l'import de l'image : {str(e)}",
+                                 parent=self.root)
+            return
+        finally:
+            self.root.config(cursor="")
+
+        # Les zones deviennent des rectangles du dessin, placés en haut à
+        # gauche de la vue et convertis ensuite comme les autres formes
+        start = time.perf_counter()
+        origin_x, origin_y, _, _ = self.viewport.visible_world_rect(
+            self.canvas.winfo_width(), self.canvas.winfo_height())
+        origin_x += 10 * PIXELS_PER_MM
+        origin_y += 10 * PIXELS_PER_MM
+        for rect in result.rects:
+            x1, y1, x2, y2 = result.rect_mm(rect)
+            coords = [origin_x + x1 * PIXELS_PER_MM, origin_y + y1 * PIXELS_PER_MM,
+                      origin_x + x2 * PIXELS_PER_MM, origin_y + y2 * PIXELS_PER_MM]
+            self.canvas.create_rectangle(*self.viewport.coords_to_screen(coords),
+                                         fill=result.palette[rect[0]], outline="", width=0)
+        result.timings["création des formes"] = time.perf_counter() - start
+        self.update_level_of_detail(full=True)
+        self.save_state()
+
+        summary = (f"{len(result.rects)} zones, {len(result.palette)} couleurs "
+                   f"({result.size[0]} x {result.size[1]} cellules)")
+        messagebox.showinfo("Import terminé",
+                            f"{summary}\n{format_timings(result.timings)}", parent=self.root)
+
+    def import_thread_catalog(self):
+        """Importe un catalogue de fils (CSV, JSON) dans la base"""
+        path = filedialog.askopenfilename(
+            parent=self.root,
+            title="Importer un catalogue de fils",
+            filetypes=[("Catalogues de fils", "*.csv *.json *.jsonl"), ("Tous les fichiers", "*.*")]
+        )
+        if not path:
+            return
+
+        default_brand = os.path.splitext(os.path.basename(path))[0]
+        brand = simpledialog.askstring(
+            "Marque",
+            "Marque à utiliser si le fichier n'a pas de colonne marque :",
+            initialvalue=default_brand,
+            parent=self.root
+        )
+        if brand is None:
+            return
 
+        # Fenêtre de progression
+        progress_window = tk.Toplevel(self.root)
+        progress_window.title("Import du catalogue")
+        progress_window.transient(self.root)
+        progress_label = ttk.Label(progress_window, text="Import en cours...")
+        progress_label.pack(padx=10, pady=5)
+        progress_bar = ttk.Progressbar(progress_window, length=300, maximum=100)
+        progress_bar.pack(padx=10, pady=10)
+
+        def on_progress(rows, fraction):
+            progress_bar['value'] = fraction * 100
+            progress_label.config(text=f"{rows} fils importés...")
+            progress_window.update_idletasks()
+
+        try:
+            count = self.ensure_thread_panel().db.import_catalog(path, brand or None, on_progress)
+        except Exception as e:
+            messagebox.showerror("Erreur", f"Erreur lors de l'import : {str(e)}", parent=self.root)
+            return
+        finally:
+            progress_window.destroy()
+
+        self.ensure_thread_panel().reload()
+        messagebox.showinfo("Import terminé", f"{count} fils importés.", parent=self.root)
+
+    def toggle_profiling(self):
+        """Active ou désactive la mesure des étapes de conversion et d'export"""
+        if self.profiling_var.get():
+            PROFILER.reset()
+            PROFILER.enable()
+        else:
+            PROFILER.disable()
+
+    def save_profiling_trace(self):
+        """Enregistre les mesures au format Chrome trace-event, et leur résumé texte à côté
+
+        Le résumé va dans <trace>.txt ; une boîte de dialogue indique les
+        deux fichiers.
+        """
+        filename = filedialog.asksaveasfilename(
+            title="Enregistrer la trace",
+            defaultextension=".json",
+            filetypes=[("Trace Chrome", "*.json")]
+        )
+        if not filename:
+            return
+        summary_path = os.path.splitext(filename)[0] + ".txt"
+        try:
+            PROFILER.write_chrome_trace(filename)
+            PROFILER.write_summary(summary_path)
+        except OSError as e:
+            messagebox.showerror("Erreur", f"Impossible d'enregistrer la trace : {e}")
+            return
+        messagebox.showinfo("Trace enregistrée",
+                            f"Trace : {os.path.basename(filename)}\n"
+                            f"Résumé : {os.path.basename(summary_path)}", parent=self.root)
 
     def toggle_thread_panel(self):
         """Affiche ou masque le panneau des fils"""
+        self.ensure_thread_panel()
         pane_pos = self.main_paned.sash_coord(0)
         if pane_pos[0] == 0:  # Si le panneau est masqué
             self.main_paned.sash_place(0, 200, 0)  # Afficher
@@ -347,6 +919,62 @@ class EmbroideryDesigner:
             self.current_outline_width = 1
             self.outline_width.set("1")
 
+    def capture_state(self):
+        """Retourne les éléments du dessin sous forme (type, coordonnées du monde, config)"""
+        # Ne pas sauvegarder la grille, l'aperçu ni les cadres et poignées de sélection
+        return [self.describe_item(item) for item in self.canvas.find_all()
+                if not self.is_overlay_item(item) and not self.is_selection_item(item)]
+
+    def describe_item(self, item):
+        """(type, coordonnées du monde, config) d'un élément du dessin"""
+        item_type = self.canvas.type(item)
+        coords = self.viewport.coords_to_world(self.canvas.coords(item))
+        config = {}
+        
+        # Sauvegarder les propriétés en fonction du type
+        if item_type == 'text':
+            config['fill'] = self.canvas.itemcget(item, 'fill')
+            config['text'] = self.canvas.itemcget(item, 'text')
+            config['font'] = self.world_fonts.get(item, self.canvas.itemcget(item, 'font'))
+            config['anchor'] = self.canvas.itemcget(item, 'anchor')
+        elif item_type == 'line':  # Pour le soulignement du texte
+            config['fill'] = self.canvas.itemcget(item, 'fill')
+            config['width'] = self.canvas.itemcget(item, 'width')
+        else:  # Pour les formes (rectangle, oval)
+            config['fill'] = self.canvas.itemcget(item, 'fill')
+            config['outline'] = self.canvas.itemcget(item, 'outline')
+            config['width'] = self.canvas.itemcget(item, 'width')
+
+        # Copie liée (instance) et groupe
+        config.update(self.item_links(item))
+        return item_type, coords, config
+
+    def item_links(self, item) -> dict:
+        """Instance et groupe d'un élément, lus dans ses tags ("instance:3", "group:1")"""
+        links = {}
+        for tag in self.canvas.gettags(item):
+            key, _, value = tag.partition(":")
+            if key in ("instance", "group") and value.isdigit():
+                links[key] = int(value)
+        return links
+
+    def link_tags(self, config: dict):
+        """Sépare d'une config l'instance et le groupe ; retourne (config, tags)"""
+        tags = []
+        for key in ("instance", "group"):
+            if key in config:
+                tags.append(f"{key}:{config[key]}")
+                self.next_link_id = max(self.next_link_id, int(config[key]) + 1)
+        if not tags:
+            return config, ()
+        return {key: value for key, value in config.items()
+                if key not in ("instance", "group")}, tuple(tags)
+
+    def new_link_id(self) -> int:
+        link_id = self.next_link_id
+        self.next_link_id += 1
+        return link_id
+
     def save_state(self):
         """Sauvegarde l'état actuel du canvas dans l'historique"""
         # Supprimer les états après la position actuelle si on a fait des undo
@@ -354,126 +982,182 @@ class EmbroideryDesigner:
             self.history = self.history[:self.current_step + 1]
         
         # Sauvegarder l'état actuel
-        state = []
-        for item in self.canvas.find_all():
-            if item not in self.grid_lines:  # Ne pas sauvegarder les lignes de la grille
-                item_type = self.canvas.type(item)
-                coords = self.canvas.coords(item)
-                config = {}
-                
-                # Sauvegarder les propriétés en fonction du type
-                if item_type == 'text':
-                    config['fill'] = self.canvas.itemcget(item, 'fill')
-                    config['text'] = self.canvas.itemcget(item, 'text')
-                    config['font'] = self.canvas.itemcget(item, 'font')
-                    config['anchor'] = self.canvas.itemcget(item, 'anchor')
-                elif item_type == 'line':  # Pour le soulignement du texte
-                    config['fill'] = self.canvas.itemcget(item, 'fill')
-                    config['width'] = self.canvas.itemcget(item, 'width')
-                else:  # Pour les formes (rectangle, oval)
-                    config['fill'] = self.canvas.itemcget(item, 'fill')
-                    config['outline'] = self.canvas.itemcget(item, 'outline')
-                    config['width'] = self.canvas.itemcget(item, 'width')
-                
-                state.append((item_type, coords, config))
-        
-        self.history.append(state)
+        self.history.append(self.capture_state())
         self.current_step += 1
+        self.record_autosave(self.history[-1])
         
         # Limiter la taille de l'historique
         if len(self.history) > self.max_history:
             self.history.pop(0)
             self.current_step -= 1
 
+        self.schedule_stitch_preview()
+
     def restore_state(self, state):
         """Restaure un état sauvegardé du canvas"""
-        # Effacer tous les éléments sauf la grille
+        # Effacer tous les éléments sauf la grille et l'aperçu
+        self.reset_level_of_detail()
         for item in self.canvas.find_all():
-            if item not in self.grid_lines:
+            if not self.is_overlay_item(item):
                 self.canvas.delete(item)
+        self.world_fonts.clear()
         
-        # Recréer les éléments
+        # Recréer les éléments (coordonnées du monde -> écran)
         for item_type, coords, config in state:
+            coords = self.viewport.coords_to_screen(coords)
+            config, tags = self.link_tags(config)
             if item_type == 'text':
-                self.canvas.create_text(
+                self.create_text_item(
                     coords[0], coords[1],
                     text=config.get('text', ''),
                     fill=config.get('fill', 'black'),
                     font=config.get('font', ('Arial', 12)),
-                    anchor=config.get('anchor', 'nw')
+                    anchor=config.get('anchor', 'nw'),
+                    tags=tags
                 )
             else:
                 create_method = getattr(self.canvas, f'create_{item_type}')
-                create_method(*coords, **config)
+                create_method(*coords, tags=tags, **config)
+
+        self.schedule_stitch_preview()
 
     def undo(self):
         """Annule la dernière action"""
         if self.current_step > 0:
             self.current_step -= 1
             self.restore_state(self.history[self.current_step])
+            self.record_autosave(self.history[self.current_step])
 
     def redo(self):
         """Rétablit la dernière action annulée"""
         if self.current_step < len(self.history) - 1:
             self.current_step += 1
             self.restore_state(self.history[self.current_step])
+            self.record_autosave(self.history[self.current_step])
 
     def copy(self, event=None):
-        """Copier l'élément sélectionné"""
-        if not self.selected_item:
+        """Copier les éléments sélectionnés"""
+        items = self.get_selection()
+        if not items:
             return
             
-        # Récupérer le type et les propriétés de l'élément
-        item_type = self.canvas.type(self.selected_item)
-        coords = self.canvas.coords(self.selected_item)
-        config = {}
-        
-        if item_type == 'text':
-            config['text'] = self.canvas.itemcget(self.selected_item, 'text')
-            config['fill'] = self.canvas.itemcget(self.selected_item, 'fill')
-            config['font'] = self.canvas.itemcget(self.selected_item, 'font')
-            config['anchor'] = self.canvas.itemcget(self.selected_item, 'anchor')
-        else:  # Pour les formes (rectangle, oval)
-            config['fill'] = self.canvas.itemcget(self.selected_item, 'fill')
-            config['outline'] = self.canvas.itemcget(self.selected_item, 'outline')
-            config['width'] = self.canvas.itemcget(self.selected_item, 'width')
-        
-        # Sauvegarder dans le presse-papier
-        self.clipboard = {
-            'type': item_type,
-            'coords': coords,
-            'config': config
-        }
+        # Sauvegarder dans le presse-papier le type et les propriétés de chaque élément
+        self.clipboard = []
+        for item in items:
+            item_type, coords, config = self.describe_item(item)
+            self.clipboard.append({
+                'type': item_type,
+                'coords': coords,
+                'config': config,
+                'source': item
+            })
 
     def paste(self, event=None):
-        """Coller l'élément copié"""
+        """Coller les éléments copiés, en copies liées à l'original
+
+        Les copies partagent l'instance de l'original (ses points ne sont
+        calculés qu'une fois à l'export) ; plusieurs éléments collés ensemble
+        forment un groupe qui se sélectionne et se déplace d'un bloc.
+        """
         if not self.clipboard:
             return
             
         # Calculer le décalage pour la nouvelle position
         offset = 20  # Décalage en pixels
-        new_coords = []
-        for i, coord in enumerate(self.clipboard['coords']):
-            new_coords.append(coord + offset)
+        group = self.new_link_id() if len(self.clipboard) > 1 else None
+        new_items = []
+        for entry in self.clipboard:
+            config = dict(entry['config'])
+            config.pop('group', None)
+            if 'instance' not in config:
+                # Premier collage : l'original devient le modèle de l'instance
+                config['instance'] = entry['config']['instance'] = self.new_link_id()
+                if self.canvas.type(entry['source']) == entry['type']:
+                    self.canvas.addtag_withtag(f"instance:{config['instance']}", entry['source'])
+            if group is not None:
+                config['group'] = group
+            config, tags = self.link_tags(config)
+            new_coords = self.viewport.coords_to_screen([coord + offset for coord in entry['coords']])
         
-        # Créer le nouvel élément
-        if self.clipboard['type'] == 'text':
-            new_item = self.canvas.create_text(
-                new_coords[0], new_coords[1],
-                **self.clipboard['config']
-            )
-        else:
-            create_method = getattr(self.canvas, f'create_{self.clipboard["type"]}')
-            new_item = create_method(*new_coords, **self.clipboard['config'])
+            # Créer le nouvel élément
+            if entry['type'] == 'text':
+                new_item = self.create_text_item(new_coords[0], new_coords[1], tags=tags, **config)
+            else:
+                create_method = getattr(self.canvas, f'create_{entry["type"]}')
+                new_item = create_method(*new_coords, tags=tags, **config)
+            new_items.append(new_item)
         
-        # Sélectionner le nouvel élément
+        # Sélectionner les nouveaux éléments
         self.clear_selection()
-        self.selected_item = new_item
+        self.selected_item = new_items[0]
         self.show_selection_handles()
+        for item in new_items[1:]:
+            self.add_to_selection(item)
         
         # Sauvegarder l'état
         self.save_state()        
 
+    def unlink_selected(self):
+        """Rend les éléments sélectionnés indépendants (ni instance, ni groupe)"""
+        items = self.get_selection()
+        for item in items:
+            for tag in self.canvas.gettags(item):
+                if tag.startswith(("instance:", "group:")):
+                    self.canvas.dtag(item, tag)
+        if items:
+            self.save_state()
+
+    def get_selection(self) -> list:
+        """Éléments sélectionnés : selected_item puis selected_items"""
+        return ([self.selected_item] if self.selected_item else []) + self.selected_items
+
+    def is_selection_item(self, item) -> bool:
+        return (item == self.selection_rect or item in self.selection_handles
+                or item in self.selection_marks.values())
+
+    def add_to_selection(self, item):
+        """Ajoute un élément à la sélection, encadré sans poignées"""
+        if item == self.selected_item or item in self.selected_items:
+            return
+        self.selected_items.append(item)
+        bbox = self.canvas.bbox(item)
+        if bbox:
+            self.selection_marks[item] = self.canvas.create_rectangle(
+                bbox[0]-1, bbox[1]-1, bbox[2]+1, bbox[3]+1,
+                outline='#0078D7', dash=(2, 2), fill=""
+            )
+
+    def remove_from_selection(self, item):
+        if item in self.selected_items:
+            self.selected_items.remove(item)
+            mark = self.selection_marks.pop(item, None)
+            if mark:
+                self.canvas.delete(mark)
+
+    def item_at(self, x, y):
+        """Élément du dessin le plus haut sous le point (x, y), ou None"""
+        items = self.canvas.find_overlapping(x-1, y-1, x+1, y+1)
+        # Une boîte englobante du niveau de détail désigne l'élément qu'elle remplace
+        items = [self.lod_proxies.get(item, item) for item in items]
+        # Filtrer les éléments de l'interface (grille, poignées, rectangles de sélection)
+        items = [item for item in items 
+                if not self.is_overlay_item(item)
+                and not self.is_selection_item(item)]
+        return items[-1] if items else None
+
+    def canvas_shift_click(self, event):
+        """Maj+clic : ajoute l'élément à la sélection ou l'en retire"""
+        if self.current_tool != "select" or not self.selected_item:
+            self.canvas_click(event)
+            return
+        item = self.item_at(event.x, event.y)
+        if item is None or item == self.selected_item:
+            return
+        if item in self.selected_items:
+            self.remove_from_selection(item)
+        else:
+            self.add_to_selection(item)
+
     def select_item(self, event):
         """Gérer la sélection d'un élément"""
         x, y = event.x, event.y
@@ -486,20 +1170,19 @@ class EmbroideryDesigner:
             return
             
         # Chercher un élément sous le curseur
-        items = self.canvas.find_overlapping(x-1, y-1, x+1, y+1)
-        # Filtrer les éléments de l'interface (grille, poignées, rectangle de sélection)
-        items = [item for item in items 
-                if item not in self.grid_lines 
-                and item != self.selection_rect 
-                and item not in self.selection_handles]
+        item = self.item_at(x, y)
         
         # Effacer toujours la sélection actuelle
         self.clear_selection()
         
-        # Si on a trouvé un élément, le sélectionner
-        if items:
-            self.selected_item = items[-1]
+        # Si on a trouvé un élément, le sélectionner (avec le reste de son groupe)
+        if item is not None:
+            self.selected_item = item
             self.show_selection_handles()
+            group = self.item_links(item).get('group')
+            if group is not None:
+                for member in self.canvas.find_withtag(f"group:{group}"):
+                    self.add_to_selection(member)
             self.last_click_x = x
             self.last_click_y = y
             self.dragging = True
@@ -569,14 +1252,30 @@ class EmbroideryDesigner:
         self.canvas.coords(self.selected_item, *bbox)
         self.update_selection_position()  # Nouvelle méthode
 
+    def sync_instances(self, item):
+        """Reporte la taille d'un élément sur ses copies liées (chacune garde sa position)"""
+        instance = self.item_links(item).get('instance')
+        coords = self.canvas.coords(item)
+        if instance is None or len(coords) != 4:
+            return
+        width, height = coords[2] - coords[0], coords[3] - coords[1]
+        for other in self.canvas.find_withtag(f"instance:{instance}"):
+            if other != item and self.canvas.type(other) == self.canvas.type(item):
+                x, y = self.canvas.coords(other)[:2]
+                self.canvas.coords(other, x, y, x + width, y + height)
+        for other, mark in self.selection_marks.items():
+            bbox = self.canvas.bbox(other)
+            if bbox:
+                self.canvas.coords(mark, bbox[0]-1, bbox[1]-1, bbox[2]+1, bbox[3]+1)
+
     def bring_to_front(self, event=None):
         """Mettre l'élément sélectionné au premier plan"""
         if self.selected_item:
             # Trouver l'élément le plus haut (sans compter la sélection)
             all_items = self.canvas.find_all()
             top_item = max(i for i in all_items 
-                         if i not in self.selection_handles 
-                         and i != self.selection_rect)
+                         if not self.is_selection_item(i)
+                         and not self.is_overlay_item(i))
             
             if self.selected_item != top_item:
                 self.canvas.tag_raise(self.selected_item, top_item)
@@ -588,7 +1287,7 @@ class EmbroideryDesigner:
         if self.selected_item:
             # Trouver l'élément le plus bas (sans compter la grille)
             bottom_item = min(i for i in self.canvas.find_all() 
-                            if i not in self.grid_lines)
+                            if not self.is_overlay_item(i))
             
             if self.selected_item != bottom_item:
                 self.canvas.tag_lower(self.selected_item, bottom_item)
@@ -599,7 +1298,8 @@ class EmbroideryDesigner:
         """Avancer l'élément sélectionné d'un niveau"""
         if self.selected_item:
             next_item = self.canvas.find_above(self.selected_item)
-            if next_item and next_item not in self.selection_handles and next_item != self.selection_rect:
+            if (next_item and not self.is_selection_item(next_item)
+                    and not self.is_overlay_item(next_item)):
                 self.canvas.tag_raise(self.selected_item, next_item)
                 self.show_selection_handles()  # Mettre à jour la sélection
                 self.save_state()
@@ -608,7 +1308,7 @@ class EmbroideryDesigner:
         """Reculer l'élément sélectionné d'un niveau"""
         if self.selected_item:
             prev_item = self.canvas.find_below(self.selected_item)
-            if prev_item and prev_item not in self.grid_lines:
+            if prev_item and not self.is_overlay_item(prev_item):
                 self.canvas.tag_lower(self.selected_item, prev_item)
                 self.show_selection_handles()  # Mettre à jour la sélection
                 self.save_state()    
@@ -705,6 +1405,11 @@ class EmbroideryDesigner:
         for handle in self.selection_handles:
             self.canvas.delete(handle)
         self.selection_handles.clear()
+
+        for mark in self.selection_marks.values():
+            self.canvas.delete(mark)
+        self.selection_marks.clear()
+        self.selected_items = []
         
         self.selected_item = None
         self.dragging = False
@@ -712,10 +1417,12 @@ class EmbroideryDesigner:
         self.current_handle = None         
 
     def delete_selected(self, event=None):
-        """Supprimer l'élément sélectionné"""
+        """Supprimer les éléments sélectionnés"""
         if self.selected_item:
-            # Supprimer l'élément
-            self.canvas.delete(self.selected_item)
+            # Supprimer les éléments
+            for item in self.get_selection():
+                self.canvas.delete(item)
+                self.world_fonts.pop(item, None)
             # Nettoyer la sélection
             self.clear_selection()
             # Sauvegarder l'état pour le undo/redo
@@ -729,6 +1436,7 @@ class EmbroideryDesigner:
         x, y = event.x, event.y
         
         if self.current_tool == "text":
+            self.ensure_text_panel()
             try:
                 selected_indices = self.font_listbox.curselection()
                 if not selected_indices:
@@ -745,7 +1453,7 @@ class EmbroideryDesigner:
                 if not text:
                     text = "Texte"
                 
-                text_item = self.canvas.create_text(
+                text_item = self.create_text_item(
                     x, y,
                     text=text,
                     font=text_font,
@@ -789,14 +1497,17 @@ class EmbroideryDesigner:
             dx = x - self.last_click_x
             dy = y - self.last_click_y
             
-            # Déplacer l'élément
-            self.canvas.move(self.selected_item, dx, dy)
+            # Déplacer les éléments sélectionnés
+            for item in self.get_selection():
+                self.canvas.move(item, dx, dy)
             
-            # Déplacer le rectangle de sélection et les poignées
+            # Déplacer les rectangles de sélection et les poignées
             if self.selection_rect:
                 self.canvas.move(self.selection_rect, dx, dy)
             for handle in self.selection_handles:
                 self.canvas.move(handle, dx, dy)
+            for mark in self.selection_marks.values():
+                self.canvas.move(mark, dx, dy)
             
             # Mettre à jour la dernière position
             self.last_click_x = x
@@ -828,6 +1539,7 @@ class EmbroideryDesigner:
         if self.resizing:
             self.resizing = False
             self.current_handle = None
+            self.sync_instances(self.selected_item)
             self.save_state()
             return
             
@@ -862,131 +1574,141 @@ class EmbroideryDesigner:
         self.start_x = None
         self.start_y = None    
 
-    def convert_to_embroidery(self, density: float, hoop_size: tuple) -> EmbroideryDesign:
-        """Convertit le dessin en points de broderie"""
-        points = []
-        thread_colors = []
-    
-        # Parcourir les éléments dans l'ordre de dessin
-        for item in self.canvas.find_all():
-            if item in self.grid_lines:
-                continue
-            
-            # Récupérer les propriétés de l'élément
-            item_type = self.canvas.type(item)
-            coords = self.canvas.coords(item)
-            fill = self.canvas.itemcget(item, 'fill')
-        
-            # Si l'élément a une couleur de remplissage
-            if fill and fill != '':
-                # Ajouter la couleur à la palette si nécessaire
-                if fill not in thread_colors:
-                    thread_colors.append(fill)
-                color_index = thread_colors.index(fill)
-            
-                try:
-                    # Convertir selon le type d'élément
-                    if item_type == 'oval':
-                        points.extend(self._circle_to_stitches(coords, color_index, density))
-                    elif item_type == 'rectangle':
-                        points.extend(self._rectangle_to_stitches(coords, color_index, density))
-                    elif item_type == 'text':
-                        points.extend(self._text_to_stitches(coords, color_index, density))
-                except Exception as e:
-                    print(f"Erreur lors de la conversion de {item_type}: {str(e)}")
-                    continue
-    
-        # S'assurer qu'il y a au moins un point
-        if not points:
-            points.append(StitchPoint(0, 0, StitchType.NORMAL, 0))
-    
-        # Calculer la taille du motif
-        bbox = self.canvas.bbox('all')
-        if bbox:
-            width = (bbox[2] - bbox[0]) / 10  # Convertir en mm
-            height = (bbox[3] - bbox[1]) / 10
-        else:
-            width = height = 100
-    
-        # Créer le design
-        return EmbroideryDesign(
-            points=points,
-            thread_colors=thread_colors,
-            size_mm=(width, height),
-            hoop_size_mm=hoop_size
-        )
-
-    def _circle_to_stitches(self, coords: list, color_index: int, density: float) -> List[StitchPoint]:
-        """Convertit un cercle en points de broderie"""
-        x1, y1, x2, y2 = coords
-        center_x = (x1 + x2) / 2
-        center_y = (y1 + y2) / 2
-        radius_x = (x2 - x1) / 2
-        radius_y = (y2 - y1) / 2
-        
-        points = []
-        num_points = int(max(radius_x, radius_y) * density)
-        
-        for i in range(num_points):
-            angle = 2 * math.pi * i / num_points
-            x = center_x + radius_x * math.cos(angle)
-            y = center_y + radius_y * math.sin(angle)
-            points.append(StitchPoint(x/10, y/10, StitchType.NORMAL, color_index))
-        
-        # Ajouter un point de fin
-        points.append(StitchPoint(
-            points[0].x, points[0].y, 
-            StitchType.END, color_index
-        ))
-        
-        return points
-
-    def _rectangle_to_stitches(self, coords: list, color_index: int, density: float) -> List[StitchPoint]:
-        """Convertit un rectangle en points de broderie"""
-        x1, y1, x2, y2 = coords
-        points = []
-        
-        # Calculer l'espacement entre les lignes
-        spacing = 1.0 / density  # en pixels
-        
-        # Créer des lignes horizontales
-        y = y1
-        direction = 1
-        while y <= y2:
-            if direction > 0:
-                # Gauche à droite
-                points.append(StitchPoint(x1/10, y/10, StitchType.NORMAL, color_index))
-                points.append(StitchPoint(x2/10, y/10, StitchType.NORMAL, color_index))
+    def get_thread_index(self) -> "ThreadColorIndex":
+        """Index de correspondance couleur -> fil, créé au premier besoin"""
+        if self.thread_index is None:
+            from color_matching import ThreadColorIndex
+            self.thread_index = ThreadColorIndex(self.ensure_thread_panel().db)
+        return self.thread_index
+
+    def get_export_cache(self):
+        """Cache des fichiers machine exportés, ouvert au premier besoin"""
+        if self.export_cache is None:
+            from export_cache import ExportCache
+            self.export_cache = ExportCache()
+        return self.export_cache
+
+    def format_thread(self, thread) -> str:
+        return f"{thread.brand} {thread.reference} ({thread.name})"
+
+    def convert_to_embroidery(self, density: float, hoop_size: tuple,
+                              thread_filter: tuple = None, max_colors: int = 0,
+                              tolerance: float = 0.0, shape_cache: dict = None) -> "EmbroideryDesign":
+        """Convertit le dessin en points de broderie
+
+        Les couleurs proches sont regroupées si max_colors (nombre de fils)
+        ou tolerance (ΔE2000) est donné, et un changement de couleur est
+        ajouté à chaque changement de fil. Si thread_filter (marque, favoris
+        uniquement) est donné, chaque couleur de la palette est associée au
+        fil le plus proche du catalogue. Avec shape_cache, seules les formes
+        modifiées depuis la conversion précédente sont converties.
+        """
+        with span("convert_to_embroidery", density=density):
+            # Calculer la taille du motif (sans la grille ni l'aperçu)
+            with span("design_bbox"):
+                design_items = [item for item in self.canvas.find_all()
+                                if not self.is_overlay_item(item)]
+                bbox = self.canvas.bbox(*design_items) if design_items else None
+            if bbox:
+                x1, y1, x2, y2 = self.viewport.coords_to_world(bbox)
+                size_mm = ((x2 - x1) / PIXELS_PER_MM, (y2 - y1) / PIXELS_PER_MM)
             else:
-                # Droite à gauche
-                points.append(StitchPoint(x2/10, y/10, StitchType.NORMAL, color_index))
-                points.append(StitchPoint(x1/10, y/10, StitchType.NORMAL, color_index))
-            
-            y += spacing
-            direction *= -1
-        
-        return points
-
-    def _text_to_stitches(self, coords: list, color_index: int, density: float) -> List[StitchPoint]:
-        """Convertit du texte en points de broderie"""
-        x, y = coords
-        points = []
-        # Pour l'instant, on crée juste un point au début du texte
-        # Cette méthode devrait être améliorée pour vraiment convertir le texte en points
-        points.append(StitchPoint(x/10, y/10, StitchType.NORMAL, color_index))
-        return points
-
-    def export_to_format(self, design: EmbroideryDesign, filename: str, format_type: str) -> bool:
-        """Exporte le design dans le format spécifié"""
+                size_mm = (100, 100)
+
+            # Convertir les éléments dans l'ordre de dessin (coordonnées du monde)
+            with span("capture_state"):
+                shapes = self.capture_state()
+            from stitch_conversion import convert_shapes
+            design = convert_shapes(shapes, density, hoop_size, max_colors, tolerance, size_mm,
+                                    shape_cache)
+            thread_colors = design.thread_colors
+
+            # Associer toute la palette aux fils du catalogue en un seul appel
+            thread_references = []
+            if thread_filter is not None:
+                brand, favorites_only = thread_filter
+                with span("match_palette", colors=len(thread_colors)):
+                    matches = self.get_thread_index().match_palette(thread_colors, 1, brand,
+                                                                    favorites_only)
+                thread_references = [self.format_thread(match[0][0]) if match else ""
+                                     for match in matches]
+
+            design.thread_references = thread_references
+        return design
+
+    def get_export_key(self, format_type: str, settings: dict) -> str:
+        """Clé du cache d'export pour le dessin courant"""
+        # La correspondance avec les fils du catalogue n'entre pas dans le fichier machine
+        export_settings = {name: value for name, value in settings.items()
+                           if name != "thread_filter"}
+        from export_cache import export_key
+        from project_file import shapes_digest
+        return export_key(shapes_digest(self.capture_state()), format_type, export_settings)
+
+    def draw_validation_overlay(self, canvas, report):
+        """Dessine le tambour, la densité des piqûres et les points fautifs d'un rapport
+
+        Les cellules de l'histogramme sont regroupées en blocs de quelques
+        pixels (densité maximale du bloc) pour garder peu d'éléments.
+        """
+        from validator import MAX_DENSITY
+        canvas.delete("all")
+        width, height = int(canvas["width"]), int(canvas["height"])
+        cell = report.cell_mm
+        hx1, hy1, hx2, hy2 = report.hoop_box
+        x1, y1, x2, y2 = hx1, hy1, hx2, hy2
+        if report.density:
+            columns = [column for column, _ in report.density]
+            rows = [row for _, row in report.density]
+            x1, x2 = min(x1, min(columns) * cell), max(x2, (max(columns) + 1) * cell)
+            y1, y2 = min(y1, min(rows) * cell), max(y2, (max(rows) + 1) * cell)
+        scale = min((width - 10) / max(x2 - x1, 1e-6), (height - 10) / max(y2 - y1, 1e-6))
+
+        def to_canvas(x, y):
+            return 5 + (x - x1) * scale, 5 + (y - y1) * scale
+
+        # Densité : du vert (faible) au rouge (au-delà de la limite)
+        block = max(1, math.ceil(3 / (cell * scale)))  # Cellules par bloc de ~3 pixels
+        blocks = {}
+        for (column, row), density in report.density.items():
+            key = (column // block, row // block)
+            blocks[key] = max(blocks.get(key, 0.0), density)
+        for (column, row), density in blocks.items():
+            ratio = min(density / MAX_DENSITY, 1.0)
+            color = "#%02x%02x40" % (int(255 * ratio), int(200 * (1 - ratio) + 55))
+            bx, by = to_canvas(column * block * cell, row * block * cell)
+            size = block * cell * scale
+            canvas.create_rectangle(bx, by, bx + size, by + size, fill=color, outline="")
+
+        # Tambour, puis points fautifs
+        canvas.create_rectangle(*to_canvas(hx1, hy1), *to_canvas(hx2, hy2),
+                                outline="#404040", dash=(4, 2))
+        for kind, color in (("out_of_hoop", "#ff0000"), ("long", "#0060ff"), ("short", "#ff9900")):
+            for x, y in report.markers.get(kind, ()):
+                px, py = to_canvas(x, y)
+                canvas.create_oval(px - 2, py - 2, px + 2, py + 2, outline=color)
+
+    def export_to_format(self, build_design, filename: str, format_type: str,
+                         settings: dict, problems: list, entry=None) -> bool:
+        """Exporte le design dans le format spécifié
+
+        entry est l'entrée du cache d'export déjà relue pour ce dessin et ces
+        paramètres, (contenu, métadonnées) ou None ; sans elle,
+        build_design() construit le motif, qui est encodé puis mis en cache.
+        problems (résultat de la vérification) est gardé avec l'entrée.
+        """
         try:
-            if format_type == "pes":
-                exporter = PesExporter()
-            elif format_type == "dst":
-                exporter = DstExporter()
-            else:  # jef
-                exporter = JefExporter()
-            
-            return exporter.export(design, filename)
+            if entry is None:
+                from embroidery_export import EXPORTERS
+                data = EXPORTERS[format_type]().to_bytes(build_design())
+            else:
+                data = entry[0]
+            if entry is None or entry[1] is None:
+                key = self.get_export_key(format_type, settings)
+                self.get_export_cache().put(key, data, {"problems": list(problems)})
+            with open(filename, 'wb') as f:
+                f.write(data)
+            return True
         except Exception as e:
             print(f"Erreur lors de l'export : {str(e)}")
             return False                   
@@ -999,8 +1721,23 @@ class EmbroideryDesigner:
         self.canvas.pack(fill=tk.BOTH, expand=True, padx=2, pady=2)
 
         self.canvas.bind('<Button-1>', self.canvas_click)
+        self.canvas.bind('<Shift-Button-1>', self.canvas_shift_click)  # Ajouter à la sélection
         self.canvas.bind('<B1-Motion>', self.canvas_drag)
         self.canvas.bind('<ButtonRelease-1>', self.canvas_release)
+        self.canvas.bind('<Configure>', self.on_canvas_resize)
+
+        # Zoom (Ctrl + molette) et déplacement de la vue (molette, clic du milieu ou droit)
+        self.canvas.bind('<MouseWheel>', self.on_mouse_wheel)
+        self.canvas.bind('<Shift-MouseWheel>', self.on_mouse_wheel)
+        self.canvas.bind('<Control-MouseWheel>', self.on_mouse_wheel)
+        self.canvas.bind('<Button-4>', self.on_mouse_wheel)  # Molette sous X11
+        self.canvas.bind('<Button-5>', self.on_mouse_wheel)
+        self.canvas.bind('<Control-Button-4>', self.on_mouse_wheel)
+        self.canvas.bind('<Control-Button-5>', self.on_mouse_wheel)
+        for button in (2, 3):
+            self.canvas.bind(f'<Button-{button}>', self.start_pan)
+            self.canvas.bind(f'<B{button}-Motion>', self.do_pan)
+            self.canvas.bind(f'<ButtonRelease-{button}>', self.end_pan)
 
          # Sauvegarder l'état initial (canvas vide)
         self.save_state()
@@ -1011,14 +1748,13 @@ class EmbroideryDesigner:
 
         # Liste des polices avec aperçu
         ttk.Label(text_panel, text="Police :").pack(pady=5)
-        self.font_listbox = tk.Listbox(text_panel, width=30, height=10)
+        self.font_listbox = VirtualListbox(text_panel, width=30, height=10,
+                                           placeholder="Chargement des polices...")
         self.font_listbox.pack(pady=5, padx=5)
         
-        # Remplir la liste des polices
-        available_fonts = sorted(font.families())
-        for f in available_fonts:
-            self.font_listbox.insert(tk.END, f)
-        self.font_listbox.select_set(0)
+        # Les polices sont chargées après le premier affichage de la fenêtre
+        # (ou dès la sélection de l'outil texte)
+        self.font_catalog = FontCatalog()
         
         self.font_listbox.bind('<<ListboxSelect>>', self.update_font_preview)
 
@@ -1054,8 +1790,31 @@ class EmbroideryDesigner:
         self.preview_canvas = tk.Canvas(preview_frame, width=200, height=100, bg='white')
         self.preview_canvas.pack(fill=tk.BOTH, expand=True, pady=5)
 
+        # Les éléments de l'aperçu sont créés une fois puis reconfigurés
+        self.preview_text_item = self.preview_canvas.create_text(100, 50, text="", anchor="center")
+        self.preview_underline_item = self.preview_canvas.create_line(0, 0, 0, 0, state="hidden")
+
+    def ensure_font_list(self, deferred=False):
+        """Remplit la liste des polices si ce n'est pas déjà fait
+
+        deferred (au démarrage) : le cache des polices est lu hors du thread
+        de l'interface ; sinon (outil texte choisi) la liste est remplie tout
+        de suite.
+        """
+        self.ensure_text_panel()
+        load_font_list(self.font_catalog, self.font_listbox, self.root,
+                       callback=self.update_font_preview, deferred=deferred)
+
     def update_font_preview(self, event=None):
-        self.preview_canvas.delete("all")
+        """Programme la mise à jour de l'aperçu (au plus une par image affichée)"""
+        if self.font_listbox is None:
+            return  # Panneau du texte pas encore construit
+        if self.font_preview_pending is None:
+            self.font_preview_pending = self.root.after(16, self.render_font_preview)
+
+    def render_font_preview(self):
+        """Affiche l'aperçu de police à partir du cache de mises en page"""
+        self.font_preview_pending = None
         
         try:
             selected_indices = self.font_listbox.curselection()
@@ -1072,26 +1831,48 @@ class EmbroideryDesigner:
             preview_text = self.preview_entry.get()
             if not preview_text:
                 preview_text = "Exemple de texte"
+
+            underline = self.font_underline.get()
+            key = (preview_font, underline, preview_text, self.current_fill_color)
+            if key == self.font_preview_key:
+                return  # Rien n'a changé depuis le dernier rendu
+
+            tk_font, bbox = self.preview_layouts.get(
+                key, lambda: self.layout_font_preview(preview_font, preview_text))
             
-            self.preview_canvas.create_text(
-                100, 50,
+            self.preview_canvas.itemconfigure(
+                self.preview_text_item,
                 text=preview_text,
-                font=preview_font,
-                fill=self.current_fill_color,
-                anchor="center"
+                font=tk_font,
+                fill=self.current_fill_color
             )
             
-            if self.font_underline.get():
-                bbox = self.preview_canvas.bbox("all")
-                if bbox:
-                    self.preview_canvas.create_line(
-                        bbox[0], bbox[3] + 2,
-                        bbox[2], bbox[3] + 2,
-                        fill=self.current_fill_color
-                    )
+            if underline:
+                self.preview_canvas.coords(
+                    self.preview_underline_item,
+                    bbox[0], bbox[3] + 2,
+                    bbox[2], bbox[3] + 2
+                )
+                self.preview_canvas.itemconfigure(
+                    self.preview_underline_item, state="normal", fill=self.current_fill_color)
+            else:
+                self.preview_canvas.itemconfigure(self.preview_underline_item, state="hidden")
+
+            self.font_preview_key = key
         except Exception as e:
             print(f"Erreur lors de la prévisualisation : {str(e)}")
 
+    def layout_font_preview(self, preview_font, preview_text):
+        """Calcule la police Tk et la boîte englobante du texte centré de l'aperçu"""
+        family, size, weight, slant = preview_font
+        tk_font = self.preview_fonts.get(preview_font, lambda: font.Font(
+            root=self.root, family=family, size=size, weight=weight, slant=slant))
+        width = tk_font.measure(preview_text)
+        height = tk_font.metrics("linespace")
+        x, y = 100, 50  # Centre du texte dans l'aperçu
+        bbox = (x - width / 2, y - height / 2, x + width / 2, y + height / 2)
+        return tk_font, bbox
+
     def choose_fill_color(self):
         color = colorchooser.askcolor(title="Choisir la couleur du texte")[1]
         if color:
@@ -1101,8 +1882,19 @@ class EmbroideryDesigner:
     def new_design(self):
         if messagebox.askyesno("Nouveau", "Voulez-vous créer un nouveau design ?\nLes modifications non sauvegardées seront perdues."):
             self.canvas.delete("all")
+            self.grid_items.clear()
+            self.clear_stitch_preview()
+            self.lod_proxies.clear()
+            self.lod_hidden.clear()
+            self.lod_checked.clear()
+            self.world_fonts.clear()
             self.history.clear()
             self.current_step = -1
+            self.record_autosave([])
+            self.close_project()
+            self.project_path = None
+            self.stitch_cache = None
+            self.root.title("Créateur de Motifs de Broderie")
             self.draw_grid() if self.show_grid else None
 
     def toggle_grid(self):
@@ -1110,31 +1902,363 @@ class EmbroideryDesigner:
         if self.show_grid:
             self.draw_grid()
         else:
-            for line in self.grid_lines:
-                self.canvas.delete(line)
-            self.grid_lines.clear()
+            self.clear_grid()
 
     def toggle_snap(self):
         self.snap_to_grid = not self.snap_to_grid
 
     def set_tool(self, tool):
         self.current_tool = tool
+        if tool == "text":
+            self.ensure_font_list()
+
+    def on_canvas_resize(self, event):
+        """Régénère la grille et le voile de l'aperçu quand la taille du canvas change"""
+        if self.show_grid:
+            self.draw_grid()
+        if self.show_stitch_preview:
+            self.draw_preview_veil()
+
+    def is_overlay_item(self, item):
+        """Indique si l'élément appartient à la grille, à l'aperçu ou au niveau de détail"""
+        return item in self.grid_items or item in self.preview_layer or item in self.lod_proxies
+
+    def create_text_item(self, x, y, font, **config):
+        """Crée un texte dont la police (définie à 100 %) suit le zoom de la vue"""
+        item = self.canvas.create_text(
+            x, y,
+            font=scale_font(font, self.viewport.zoom, self.root.tk.splitlist),
+            **config
+        )
+        self.world_fonts[item] = font
+        return item
+
+    def on_mouse_wheel(self, event):
+        """Molette : déplacement vertical, Maj : horizontal, Ctrl : zoom"""
+        if event.num == 4:
+            delta = 1
+        elif event.num == 5:
+            delta = -1
+        else:
+            delta = 1 if event.delta > 0 else -1
+
+        if event.state & 0x4:  # Ctrl enfoncé
+            self.zoom_view(1.1 if delta > 0 else 1 / 1.1, event.x, event.y)
+        elif event.state & 0x1:  # Maj enfoncé
+            self.pan_view(delta * 40, 0)
+        else:
+            self.pan_view(0, delta * 40)
+
+    def start_pan(self, event):
+        self.pan_last = (event.x, event.y)
+
+    def do_pan(self, event):
+        if self.pan_last is None:
+            return
+        dx = event.x - self.pan_last[0]
+        dy = event.y - self.pan_last[1]
+        self.pan_last = (event.x, event.y)
+        self.pan_view(dx, dy)
+
+    def end_pan(self, event):
+        self.pan_last = None
+
+    def pan_view(self, dx, dy):
+        """Déplace la vue de (dx, dy) pixels"""
+        if not dx and not dy:
+            return
+        self.viewport.pan(dx, dy)
+        self.canvas.move("all", dx, dy)
+        self.update_view()
+
+    def zoom_view(self, factor, x=None, y=None):
+        """Zoome d'un facteur autour du point (x, y), le centre du canvas par défaut"""
+        if x is None or y is None:
+            x = self.canvas.winfo_width() / 2
+            y = self.canvas.winfo_height() / 2
+
+        level = self.viewport.lod_level()
+        applied = self.viewport.zoom_at(factor, x, y)
+        if applied == 1.0:
+            return
+
+        selected = self.get_selection()
+        self.clear_selection()
+        # Les formes simplifiées sont mises à l'échelle avec le reste, sauf si
+        # le niveau change ou dépend de la taille à l'écran (petites formes)
+        if self.viewport.lod_level() != level or level == LOD_COARSE:
+            self.reset_level_of_detail()
+
+        # Les formes sont mises à l'échelle par Tk, les polices à la main
+        self.canvas.scale("all", x, y, applied, applied)
+        for item, world_font in self.world_fonts.items():
+            self.canvas.itemconfigure(
+                item, font=scale_font(world_font, self.viewport.zoom, self.root.tk.splitlist))
+
+        # Les tuiles de l'aperçu sont à refaire à la nouvelle échelle
+        self.remove_preview_tiles()
+        self.update_view()
+
+        if selected:
+            self.selected_item = selected[0]
+            self.show_selection_handles()
+            for item in selected[1:]:
+                self.add_to_selection(item)
+
+    def reset_view(self):
+        """Revient au zoom 100 % sans déplacement"""
+        if self.viewport.zoom != 1.0:
+            self.zoom_view(1.0 / self.viewport.zoom, 0, 0)
+        self.pan_view(-self.viewport.offset_x, -self.viewport.offset_y)
+
+    def update_view(self):
+        """Met à jour la grille, le niveau de détail et l'aperçu après un changement de vue"""
+        if self.show_grid:
+            self.draw_grid()
+        if self.preview_veil is not None:
+            self.canvas.coords(self.preview_veil, 0, 0)
+        self.update_level_of_detail()
+        if self.show_stitch_preview:
+            self.refresh_stitch_preview(reconvert=False)
+
+    def reset_level_of_detail(self):
+        """Réaffiche les éléments simplifiés et retire les formes qui les remplaçaient"""
+        for proxy in self.lod_proxies:
+            self.canvas.delete(proxy)
+        self.lod_proxies.clear()
+        for item in self.lod_hidden:
+            self.canvas.itemconfigure(item, state="normal")
+        self.lod_hidden.clear()
+        self.lod_checked.clear()
+        self.lod_level = LOD_FULL
+
+    def update_level_of_detail(self, full=False):
+        """Remplace les éléments visibles par des formes simplifiées en vue dézoomée
+
+        En vue dézoomée les textes sont remplacés par leur boîte englobante
+        et les ovales par un polygone de quelques côtés, sans contour ; en
+        vue très dézoomée les formes de moins de quelques pixels deviennent
+        aussi leur boîte englobante. Seuls les éléments de la zone visible
+        qui n'ont pas encore été examinés à ce niveau le sont : un
+        déplacement de la vue ne traite que les éléments qui y entrent.
+        full (après une modification du dessin) réexamine tout.
+        """
+        level = self.viewport.lod_level()
+        if full or level != self.lod_level:
+            self.reset_level_of_detail()
+            self.lod_level = level
+        if level == LOD_FULL:
+            return
+
+        min_size = 4  # Taille écran (pixels) sous laquelle une forme est simplifiée
+        width = self.canvas.winfo_width()
+        height = self.canvas.winfo_height()
+        checked = self.lod_checked
+        for item in self.canvas.find_overlapping(0, 0, width, height):
+            if item in checked or self.is_overlay_item(item) or self.is_selection_item(item):
+                continue
+            checked.add(item)
+            item_type = self.canvas.type(item)
+            bbox = self.canvas.bbox(item)
+            if not bbox:
+                continue
+            small = bbox[2] - bbox[0] < min_size and bbox[3] - bbox[1] < min_size
+            if item_type == 'text' or (level > LOD_SIMPLIFIED and small):
+                color = self.canvas.itemcget(item, 'fill') or '#999999'
+                proxy = self.canvas.create_rectangle(*bbox, fill=color, outline='')
+            elif item_type == 'oval':
+                fill = self.canvas.itemcget(item, 'fill')
+                proxy = self.canvas.create_polygon(
+                    *oval_outline(self.canvas.coords(item)), fill=fill,
+                    outline='' if fill else self.canvas.itemcget(item, 'outline'))
+            else:
+                continue
+            self.canvas.tag_raise(proxy, item)
+            self.canvas.itemconfigure(item, state="hidden")
+            self.lod_proxies[proxy] = item
+            self.lod_hidden.add(item)
+
+    def clear_grid(self):
+        """Retire la grille du canvas (l'image reste en cache)"""
+        for item in self.grid_items:
+            self.canvas.delete(item)
+        self.grid_items.clear()
+
+    def render_grid_image(self, width, height, step, phase_x, phase_y):
+        """Dessine la grille dans une image transparente"""
+        from PIL import Image, ImageDraw, ImageTk
+        image = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+        color = (0xCC, 0xCC, 0xCC, 255)
+
+        # Une ligne horizontale et une ligne verticale en pointillés,
+        # recopiées à chaque pas de la grille
+        row = Image.new("RGBA", (width, 1), (0, 0, 0, 0))
+        ImageDraw.Draw(row).point([(x, 0) for x in range(0, width, 2)], fill=color)
+        column = Image.new("RGBA", (1, height), (0, 0, 0, 0))
+        ImageDraw.Draw(column).point([(0, y) for y in range(0, height, 2)], fill=color)
+
+        x = phase_x
+        while x < width:
+            image.paste(column, (round(x), 0))
+            x += step
+        y = phase_y
+        while y < height:
+            image.paste(row, (0, round(y)))
+            y += step
+
+        return ImageTk.PhotoImage(image)
 
     def draw_grid(self):
-        for line in self.grid_lines:
-            self.canvas.delete(line)
-        self.grid_lines.clear()
-        
         width = self.canvas.winfo_width()
         height = self.canvas.winfo_height()
-        
-        for x in range(0, width, self.grid_size):
-            line = self.canvas.create_line(x, 0, x, height, fill="#CCCCCC", dash=(1,))
-            self.grid_lines.append(line)
-        
-        for y in range(0, height, self.grid_size):
-            line = self.canvas.create_line(0, y, width, y, fill="#CCCCCC", dash=(1,))
-            self.grid_lines.append(line)
+        if width <= 1 or height <= 1:  # Canvas pas encore affiché
+            return
+
+        # La grille suit le zoom et le déplacement de la vue
+        step = self.viewport.grid_step(self.grid_size)
+        phase_x = round(self.viewport.offset_x % step, 1)
+        phase_y = round(self.viewport.offset_y % step, 1)
+
+        # Ne régénérer l'image que si la taille, le pas ou le décalage ont changé
+        key = (width, height, round(step, 3), phase_x, phase_y)
+        if key != self.grid_image_key:
+            self.grid_image = self.render_grid_image(width, height, step, phase_x, phase_y)
+            self.grid_image_key = key
+        elif self.grid_items:
+            for item in self.grid_items:
+                self.canvas.coords(item, 0, 0)
+            return
+
+        self.clear_grid()
+        item = self.canvas.create_image(0, 0, image=self.grid_image, anchor="nw")
+        self.canvas.tag_lower(item)
+        self.grid_items.add(item)
+
+    def toggle_stitch_preview(self):
+        """Affiche ou masque l'aperçu des points de broderie"""
+        self.show_stitch_preview = not self.show_stitch_preview
+        if self.show_stitch_preview:
+            self.refresh_stitch_preview()
+        else:
+            self.clear_stitch_preview()
+
+    def schedule_stitch_preview(self):
+        """Programme un rafraîchissement de l'aperçu (regroupe les modifications)
+
+        Le niveau de détail est aussi recalculé pour les éléments modifiés.
+        """
+        if self.viewport.lod_level() != LOD_FULL:
+            self.root.after_idle(self.update_level_of_detail, True)
+        if self.show_stitch_preview and self.preview_pending is None:
+            self.preview_pending = self.root.after_idle(self.refresh_stitch_preview)
+
+    def clear_stitch_preview(self):
+        """Retire l'aperçu du canvas et vide le cache de tuiles"""
+        if self.preview_pending is not None:
+            self.root.after_cancel(self.preview_pending)
+            self.preview_pending = None
+        for item in self.preview_layer:
+            self.canvas.delete(item)
+        self.preview_layer.clear()
+        self.preview_tile_items.clear()
+        self.preview_photos.clear()
+        self.preview_veil = None
+        self.preview_design = None
+        self.preview_shapes.clear()
+        if self.stitch_preview is not None:
+            self.stitch_preview.clear()
+
+    def remove_preview_tiles(self):
+        """Retire les tuiles de l'aperçu du canvas et vide leur cache"""
+        for item in self.preview_tile_items.values():
+            self.canvas.delete(item)
+            self.preview_layer.discard(item)
+        self.preview_tile_items.clear()
+        self.preview_photos.clear()
+        if self.stitch_preview is not None:
+            self.stitch_preview.clear()
+
+    def refresh_stitch_preview(self, reconvert=True):
+        """Redessine uniquement les tuiles visibles de l'aperçu touchées par une modification
+
+        Seules les formes modifiées depuis le rafraîchissement précédent sont
+        reconverties ; les autres reprennent leurs points (preview_shapes).
+        """
+        self.preview_pending = None
+        if not self.show_stitch_preview:
+            return
+
+        from PIL import ImageTk
+        if self.stitch_preview is None:
+            from stitch_preview import StitchPreviewRenderer
+            self.stitch_preview = StitchPreviewRenderer()
+        if reconvert or self.preview_design is None:
+            self.preview_design = self.convert_to_embroidery(self.preview_density, (100, 100),
+                                                             shape_cache=self.preview_shapes)
+
+        # Échelle de rendu suivant le zoom ; en vue dézoomée les points
+        # tombant sur le même pixel sont fusionnés
+        viewport = self.viewport
+        merge = 1.0 if viewport.lod_level() != LOD_FULL else 0.0
+        self.stitch_preview.set_scale(PIXELS_PER_MM * viewport.zoom, merge)
+        if not self.stitch_preview.tiles:
+            self.remove_preview_tiles()
+
+        view = (-viewport.offset_x, -viewport.offset_y,
+                self.canvas.winfo_width() - viewport.offset_x,
+                self.canvas.winfo_height() - viewport.offset_y)
+        changed, removed = self.stitch_preview.update(self.preview_design, view)
+
+        for tile in removed:
+            item = self.preview_tile_items.pop(tile)
+            self.canvas.delete(item)
+            self.preview_layer.discard(item)
+            del self.preview_photos[tile]
+
+        for tile in changed:
+            photo = ImageTk.PhotoImage(self.stitch_preview.tiles[tile])
+            self.preview_photos[tile] = photo
+            if tile in self.preview_tile_items:
+                self.canvas.itemconfigure(self.preview_tile_items[tile], image=photo)
+            else:
+                x, y = self.stitch_preview.tile_origin(tile)
+                item = self.canvas.create_image(x + viewport.offset_x, y + viewport.offset_y,
+                                                image=photo, anchor="nw",
+                                                tags=("stitch_preview",))
+                self.preview_tile_items[tile] = item
+                self.preview_layer.add(item)
+
+        self.draw_preview_veil()
+
+        # L'aperçu reste au-dessus des formes, la sélection au-dessus de l'aperçu
+        self.canvas.tag_raise("stitch_preview")
+        if self.selection_rect:
+            self.canvas.tag_raise(self.selection_rect)
+        for handle in list(self.selection_handles) + list(self.selection_marks.values()):
+            self.canvas.tag_raise(handle)
+
+    def draw_preview_veil(self):
+        """Place un voile blanc semi-transparent entre les formes et l'aperçu"""
+        width = self.canvas.winfo_width()
+        height = self.canvas.winfo_height()
+        if width <= 1 or height <= 1:
+            return
+
+        key = (width, height)
+        if key != self.preview_veil_key:
+            from PIL import Image, ImageTk
+            veil = Image.new("RGBA", key, (255, 255, 255, 180))
+            self.preview_veil_image = ImageTk.PhotoImage(veil)
+            self.preview_veil_key = key
+            if self.preview_veil is not None:
+                self.canvas.itemconfigure(self.preview_veil, image=self.preview_veil_image)
+
+        if self.preview_veil is None:
+            self.preview_veil = self.canvas.create_image(
+                0, 0, image=self.preview_veil_image, anchor="nw",
+                tags=("stitch_preview",))
+            self.preview_layer.add(self.preview_veil)
+        self.canvas.tag_lower(self.preview_veil, "stitch_preview")
 
 if __name__ == "__main__":
     try:
@@ -1,9 +1,11 @@
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
-from typing import List, Tuple
+from dataclasses import dataclass, field
+from typing import BinaryIO, Iterator, List, Sequence, Tuple
+import io
 import math
 import struct
 import os
+from profiling import count, span
 
 @dataclass
 class StitchPoint:
@@ -21,21 +23,136 @@ class StitchType:
     COLOR_CHANGE = 3
     END = 4
 
+class StitchColumns(Sequence):
+    """Points de broderie rangés en colonnes (x, y, couleur, type)
+
+    Se comporte comme une liste de StitchPoint, mais ne crée les objets
+    qu'au moment où on les parcourt. Les étapes qui connaissent les
+    colonnes (palette, changements de couleur, export, vérification) y
+    travaillent directement, sans objet par point.
+    """
+
+    def __init__(self, xs, ys, colors, types):
+        self.xs, self.ys, self.colors, self.types = xs, ys, colors, types
+
+    def __len__(self) -> int:
+        return len(self.xs)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return StitchPoint(self.xs[index], self.ys[index], self.types[index], self.colors[index])
+
+    def __iter__(self) -> Iterator[StitchPoint]:
+        return map(StitchPoint, self.xs, self.ys, self.types, self.colors)
+
 @dataclass
 class EmbroideryDesign:
     """Contient toutes les informations d'un motif de broderie"""
-    points: List[StitchPoint]
+    points: List[StitchPoint]  # Ou StitchColumns (mêmes points, rangés en colonnes)
     thread_colors: List[str]  # Liste des couleurs hex
     size_mm: Tuple[float, float]  # Taille en mm (largeur, hauteur)
     hoop_size_mm: Tuple[float, float]  # Taille du tambour (largeur, hauteur)
+    thread_references: List[str] = field(default_factory=list)  # Fil associé à chaque couleur
+
+Moves = Tuple[List[int], List[int], List[int]]  # (dx, dy, type) en 0.1 mm
+
+def split_long_moves(points: Sequence[StitchPoint], max_delta: int,
+                     commands: Tuple[int, ...] = ()) -> Moves:
+    """Déplacements relatifs (0.1 mm) des points, sans dépasser max_delta par axe
+
+    Les positions absolues sont calculées en une fois, donc un déplacement
+    coupé ne décale pas la suite du motif. Chaque déplacement trop long est
+    remplacé par le plus petit nombre de segments valides du même type
+    (points ou sauts). Les types de commands ne portent pas de
+    déplacement dans le format : un déplacement qui les précède devient
+    une suite de sauts.
+
+    Seuls les déplacements à couper passent par une boucle Python ; les
+    autres sont recopiés par tranches. Des points en colonnes
+    (StitchColumns) sont lus sans créer de StitchPoint.
+    """
+    if hasattr(points, "xs"):
+        xs = [int(x * 10) for x in points.xs]
+        ys = [int(y * 10) for y in points.ys]
+        types = list(points.types)
+    else:
+        xs = [int(point.x * 10) for point in points]
+        ys = [int(point.y * 10) for point in points]
+        types = [point.stitch_type for point in points]
+    dxs = [x - previous for x, previous in zip(xs, [0] + xs[:-1])]
+    dys = [y - previous for y, previous in zip(ys, [0] + ys[:-1])]
+
+    # Index des déplacements à couper
+    long_moves = [i for i, (dx, dy) in enumerate(zip(dxs, dys))
+                  if dx > max_delta or dx < -max_delta or dy > max_delta or dy < -max_delta]
+    if commands:
+        long_moves = sorted(set(long_moves).union(
+            i for i, stitch_type in enumerate(types)
+            if stitch_type in commands and (dxs[i] or dys[i])))
+    if not long_moves:
+        return dxs, dys, types
+
+    # Nombre de segments de chaque déplacement coupé, puis remplissage
+    out_dx: List[int] = []
+    out_dy: List[int] = []
+    out_types: List[int] = []
+    start = 0
+    for i in long_moves:
+        out_dx.extend(dxs[start:i])
+        out_dy.extend(dys[start:i])
+        out_types.extend(types[start:i])
+        dx, dy, stitch_type = dxs[i], dys[i], types[i]
+        segments = max(1, -(-max(abs(dx), abs(dy)) // max_delta))
+        segment_type = StitchType.JUMP if stitch_type in commands else stitch_type
+        last_x = last_y = 0
+        for k in range(1, segments + 1):
+            x, y = dx * k // segments, dy * k // segments
+            out_dx.append(x - last_x)
+            out_dy.append(y - last_y)
+            out_types.append(segment_type)
+            last_x, last_y = x, y
+        if stitch_type in commands:
+            out_dx.append(0)
+            out_dy.append(0)
+            out_types.append(stitch_type)
+        start = i + 1
+    out_dx.extend(dxs[start:])
+    out_dy.extend(dys[start:])
+    out_types.extend(types[start:])
+    count("split_moves", len(long_moves))
+    return out_dx, out_dy, out_types
 
 class EmbroideryExporter(ABC):
     """Classe abstraite pour l'export de motifs"""
+    FORMAT_NAME = ""
+    MAX_DELTA = 127        # Déplacement maximal par axe d'un point ou d'un saut (0.1 mm)
+    COMMANDS: Tuple[int, ...] = ()  # Types de points écrits sans déplacement
     
     @abstractmethod
+    def write(self, design: EmbroideryDesign, f: BinaryIO):
+        """Écrit le motif dans un flux binaire (fichier ou mémoire)"""
+        pass
+
     def export(self, design: EmbroideryDesign, filepath: str) -> bool:
         """Exporte le motif dans un fichier"""
-        pass
+        try:
+            with open(filepath, 'wb') as f:
+                with span(f"{type(self).__name__}.write", stitches=len(design.points)):
+                    self.write(design, f)
+                count("bytes", f.tell())
+            return True
+        except Exception as e:
+            print(f"Erreur lors de l'export {self.FORMAT_NAME} : {str(e)}")
+            return False
+
+    def to_bytes(self, design: EmbroideryDesign) -> bytes:
+        """Retourne le fichier machine en mémoire, sans passer par le disque"""
+        buffer = io.BytesIO()
+        with span(f"{type(self).__name__}.write", stitches=len(design.points)):
+            self.write(design, buffer)
+        count("bytes", buffer.tell())
+        return buffer.getvalue()
 
     def _convert_to_machine_units(self, mm: float) -> int:
         """Convertit les millimètres en unités machine (0.1mm)"""
@@ -43,189 +160,152 @@ class EmbroideryExporter(ABC):
 
 class PesExporter(EmbroideryExporter):
     """Exporteur au format PES (Brother)"""
+    FORMAT_NAME = "PES"
+    COMMANDS = (StitchType.TRIM, StitchType.COLOR_CHANGE, StitchType.END)
     
-    def export(self, design: EmbroideryDesign, filepath: str) -> bool:
-        try:
-            with open(filepath, 'wb') as f:
-                # En-tête PES
-                f.write(b'#PES0001')
-                
-                # Réserver la place pour l'offset PEC (nous le mettrons à jour plus tard)
-                pec_offset_pos = f.tell()
-                f.write(struct.pack('<I', 0))  # Placeholder pour l'offset PEC
-                
-                # Section PES
-                f.write(struct.pack('<III', 
-                    int(design.size_mm[0] * 10),  # Largeur en 0.1mm
-                    int(design.size_mm[1] * 10),  # Hauteur en 0.1mm
-                    len(design.thread_colors)      # Nombre de couleurs
-                ))
-                
-                # Ajouter les informations de couleurs
-                for color in design.thread_colors:
-                    # Convertir la couleur hex en RGB
-                    r = int(color[1:3], 16)
-                    g = int(color[3:5], 16)
-                    b = int(color[5:7], 16)
-                    f.write(struct.pack('BBB', r, g, b))
-                
-                # Noter la position du début du segment PEC
-                pec_offset = f.tell()
-                
-                # Revenir en arrière et écrire l'offset PEC correct
-                f.seek(pec_offset_pos)
-                f.write(struct.pack('<I', pec_offset))
-                f.seek(pec_offset)
-                
-                # Section PEC
-                f.write(b'#PEC0001')
-                
-                # Table des couleurs PEC
-                f.write(bytes([len(design.thread_colors)]))
-                for i in range(len(design.thread_colors)):
-                    f.write(bytes([i + 1]))
-                
-                # Points de broderie
-                last_x = last_y = 0
-                for point in design.points:
-                    dx = int(point.x * 10) - last_x
-                    dy = int(point.y * 10) - last_y
-                    
-                    # Limiter les déplacements à la plage valide
-                    dx = max(min(dx, 127), -127)
-                    dy = max(min(dy, 127), -127)
-                    
-                    if point.stitch_type == StitchType.NORMAL:
-                        f.write(bytes([dx & 0xff, dy & 0xff]))
-                    elif point.stitch_type == StitchType.JUMP:
-                        f.write(bytes([0x80 | 0x40, dx & 0xff, dy & 0xff]))
-                    elif point.stitch_type == StitchType.COLOR_CHANGE:
-                        f.write(bytes([0xfe]))
-                    
-                    last_x += dx
-                    last_y += dy
-                
-                # Marquer la fin
-                f.write(bytes([0xff]))
-                
-                return True
-                
-        except Exception as e:
-            print(f"Erreur lors de l'export PES : {str(e)}")
-            return False
+    def write(self, design: EmbroideryDesign, f: BinaryIO):
+        # En-tête PES
+        f.write(b'#PES0001')
+        
+        # Réserver la place pour l'offset PEC (nous le mettrons à jour plus tard)
+        pec_offset_pos = f.tell()
+        f.write(struct.pack('<I', 0))  # Placeholder pour l'offset PEC
+        
+        # Section PES
+        f.write(struct.pack('<III', 
+            int(design.size_mm[0] * 10),  # Largeur en 0.1mm
+            int(design.size_mm[1] * 10),  # Hauteur en 0.1mm
+            len(design.thread_colors)      # Nombre de couleurs
+        ))
+        
+        # Ajouter les informations de couleurs
+        for color in design.thread_colors:
+            # Convertir la couleur hex en RGB
+            r = int(color[1:3], 16)
+            g = int(color[3:5], 16)
+            b = int(color[5:7], 16)
+            f.write(struct.pack('BBB', r, g, b))
+        
+        # Noter la position du début du segment PEC
+        pec_offset = f.tell()
+        
+        # Revenir en arrière et écrire l'offset PEC correct
+        f.seek(pec_offset_pos)
+        f.write(struct.pack('<I', pec_offset))
+        f.seek(pec_offset)
+        
+        # Section PEC
+        f.write(b'#PEC0001')
+        
+        # Table des couleurs PEC
+        f.write(bytes([len(design.thread_colors)]))
+        for i in range(len(design.thread_colors)):
+            f.write(bytes([i + 1]))
+        
+        # Points de broderie (déplacements trop longs coupés)
+        for dx, dy, stitch_type in zip(*split_long_moves(design.points, self.MAX_DELTA,
+                                                         self.COMMANDS)):
+            if stitch_type == StitchType.NORMAL:
+                f.write(bytes([dx & 0xff, dy & 0xff]))
+            elif stitch_type == StitchType.JUMP:
+                f.write(bytes([0x80 | 0x40, dx & 0xff, dy & 0xff]))
+            elif stitch_type == StitchType.COLOR_CHANGE:
+                f.write(bytes([0xfe]))
+        
+        # Marquer la fin
+        f.write(bytes([0xff]))
 
 class DstExporter(EmbroideryExporter):
     """Exporteur au format DST (Tajima)"""
+    FORMAT_NAME = "DST"
+    MAX_DELTA = 121
     
-    def export(self, design: EmbroideryDesign, filepath: str) -> bool:
-        try:
-            with open(filepath, 'wb') as f:
-                # En-tête DST standard
-                header = bytearray(512)
-                header[0:13] = b'LA:Desktop   '
-                header[14:42] = f"ST:{len(design.points):6d}".encode()
-                header[42:48] = b"+   0"
-                header[48:54] = b"+   0"
-                header[54:60] = b"+   0"
-                header[60:66] = b"+   0"
-                f.write(header)
+    def write(self, design: EmbroideryDesign, f: BinaryIO):
+        # En-tête DST standard
+        dxs, dys, types = split_long_moves(design.points, self.MAX_DELTA)
+        header = bytearray(512)
+        header[0:13] = b'LA:Desktop   '
+        header[14:42] = f"ST:{len(types):6d}".encode()
+        header[42:48] = b"+   0"
+        header[48:54] = b"+   0"
+        header[54:60] = b"+   0"
+        header[60:66] = b"+   0"
+        f.write(header)
+        
+        # Coordonnées relatives en 0.1mm (déplacements trop longs coupés)
+        for x_dst, y_dst, stitch_type in zip(dxs, dys, types):
+            # Calcul des bytes DST
+            byte1 = byte2 = byte3 = 0
+            
+            if x_dst > 40:
+                byte1 |= 0x04
+            elif x_dst < -40:
+                byte1 |= 0x08
+            if y_dst > 40:
+                byte1 |= 0x20
+            elif y_dst < -40:
+                byte1 |= 0x10
                 
-                last_x = last_y = 0
-                for point in design.points:
-                    # Conversion en coordonnées relatives en 0.1mm
-                    dx = int(point.x * 10) - last_x
-                    dy = int(point.y * 10) - last_y
-                    
-                    # Calcul des bytes DST
-                    x_dst = min(max(dx, -121), 121)
-                    y_dst = min(max(dy, -121), 121)
-                    
-                    byte1 = byte2 = byte3 = 0
-                    
-                    if x_dst > 40:
-                        byte1 |= 0x04
-                    elif x_dst < -40:
-                        byte1 |= 0x08
-                    if y_dst > 40:
-                        byte1 |= 0x20
-                    elif y_dst < -40:
-                        byte1 |= 0x10
-                        
-                    if point.stitch_type == StitchType.JUMP:
-                        byte1 |= 0x83
-                    elif point.stitch_type == StitchType.COLOR_CHANGE:
-                        byte1 |= 0xc3
-                        
-                    byte2 |= abs(x_dst) % 41
-                    byte3 |= abs(y_dst) % 41
-                    
-                    f.write(bytes([byte1, byte2, byte3]))
-                    
-                    last_x += dx
-                    last_y += dy
+            if stitch_type == StitchType.JUMP:
+                byte1 |= 0x83
+            elif stitch_type == StitchType.COLOR_CHANGE:
+                byte1 |= 0xc3
                 
-                # Fin du fichier
-                f.write(bytes([0x03, 0x00, 0x00]))
-                return True
-                
-        except Exception as e:
-            print(f"Erreur lors de l'export DST : {str(e)}")
-            return False
+            byte2 |= abs(x_dst) % 41
+            byte3 |= abs(y_dst) % 41
+            
+            f.write(bytes([byte1, byte2, byte3]))
+        
+        # Fin du fichier
+        f.write(bytes([0x03, 0x00, 0x00]))
 
 class JefExporter(EmbroideryExporter):
     """Exporteur au format JEF (Janome)"""
+    FORMAT_NAME = "JEF"
+    COMMANDS = (StitchType.TRIM, StitchType.COLOR_CHANGE, StitchType.END)
+    RECORDS = (StitchType.NORMAL, StitchType.JUMP, StitchType.COLOR_CHANGE)  # Types écrits
     
-    def export(self, design: EmbroideryDesign, filepath: str) -> bool:
-        try:
-            with open(filepath, 'wb') as f:
-                num_colors = len(design.thread_colors)
-                num_points = len(design.points)
-                
-                # En-tête JEF
-                f.write(struct.pack('<I', num_colors))    # Nombre de couleurs
-                f.write(struct.pack('<I', num_points))    # Nombre de points
-                
-                # Offset des données de points (après l'en-tête)
-                data_offset = 128 + (num_colors * 4)
-                f.write(struct.pack('<I', data_offset))
-                
-                # Dimensions
-                size_x = self._convert_to_machine_units(design.size_mm[0])
-                size_y = self._convert_to_machine_units(design.size_mm[1])
-                f.write(struct.pack('<iiii', size_x, size_y, size_x, size_y))
-                
-                # Remplir l'en-tête jusqu'à 128 bytes
-                f.write(b'\x00' * (116 - f.tell()))
-                
-                # Liste des couleurs
-                for i in range(num_colors):
-                    f.write(struct.pack('<I', i + 1))
-                
-                # Points de broderie
-                last_x = last_y = 0
-                for point in design.points:
-                    dx = int(point.x * 10) - last_x
-                    dy = int(point.y * 10) - last_y
-                    
-                    # Limiter les déplacements
-                    dx = max(min(dx, 127), -127)
-                    dy = max(min(dy, 127), -127)
-                    
-                    if point.stitch_type == StitchType.NORMAL:
-                        f.write(struct.pack('<bb', dx, dy))
-                    elif point.stitch_type == StitchType.JUMP:
-                        f.write(bytes([0x80, dx, dy]))
-                    elif point.stitch_type == StitchType.COLOR_CHANGE:
-                        f.write(bytes([0x7c]))
-                    
-                    last_x += dx
-                    last_y += dy
-                
-                # Fin du fichier
-                f.write(bytes([0x7f]))
-                
-                return True
-                
-        except Exception as e:
-            print(f"Erreur lors de l'export JEF : {str(e)}")
-            return False
\ No newline at end of file
+    def write(self, design: EmbroideryDesign, f: BinaryIO):
+        num_colors = len(design.thread_colors)
+        # Nombre d'enregistrements réellement écrits, après coupure des déplacements
+        dxs, dys, types = split_long_moves(design.points, self.MAX_DELTA, self.COMMANDS)
+        num_points = sum(1 for stitch_type in types if stitch_type in self.RECORDS)
+        
+        # En-tête JEF
+        f.write(struct.pack('<I', num_colors))    # Nombre de couleurs
+        f.write(struct.pack('<I', num_points))    # Nombre de points
+        
+        # Offset des données de points (après l'en-tête)
+        data_offset = 128 + (num_colors * 4)
+        f.write(struct.pack('<I', data_offset))
+        
+        # Dimensions
+        size_x = self._convert_to_machine_units(design.size_mm[0])
+        size_y = self._convert_to_machine_units(design.size_mm[1])
+        f.write(struct.pack('<iiii', size_x, size_y, size_x, size_y))
+        
+        # Remplir l'en-tête jusqu'à 128 bytes
+        f.write(b'\x00' * (116 - f.tell()))
+        
+        # Liste des couleurs
+        for i in range(num_colors):
+            f.write(struct.pack('<I', i + 1))
+        
+        # Points de broderie (déplacements trop longs coupés)
+        for dx, dy, stitch_type in zip(dxs, dys, types):
+            if stitch_type == StitchType.NORMAL:
+                f.write(struct.pack('<bb', dx, dy))
+            elif stitch_type == StitchType.JUMP:
+                f.write(bytes([0x80, dx & 0xff, dy & 0xff]))
+            elif stitch_type == StitchType.COLOR_CHANGE:
+                f.write(bytes([0x7c]))
+        
+        # Fin du fichier
+        f.write(bytes([0x7f]))
+
+# Format (extension) -> exporteur
+EXPORTERS = {
+    "pes": PesExporter,
+    "dst": DstExporter,
+    "jef": JefExporter,
+}
@@ -0,0 +1,198 @@
+# export_cache.py
+"""Cache disque des fichiers machine exportés
+
+Chaque export est rangé sous une clé calculée à partir du contenu du
+dessin (formes canoniques) et des paramètres d'export (format, densité,
+tambour, réduction de la palette) : réexporter un motif inchangé avec les
+mêmes paramètres relit le fichier au lieu de le reconvertir.
+
+Fichiers : <répertoire>/<2 premiers caractères de la clé>/<clé>.bin,
+contenant "CBEC", l'empreinte du contenu (16 octets) puis le contenu ; ou,
+pour une entrée accompagnée de métadonnées (résultat de la vérification
+du motif, par exemple), "CBEM", l'empreinte, la longueur des métadonnées
+(4 octets), les métadonnées en JSON puis le contenu, l'empreinte couvrant
+les deux. L'empreinte est vérifiée à chaque lecture ; une entrée abîmée
+est effacée et traitée comme absente. Au-delà de max_bytes, les entrées les moins
+récemment utilisées sont effacées.
+"""
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+import hashlib
+import json
+import os
+import struct
+import threading
+from embroidery_export import EXPORTERS, EmbroideryDesign
+from profiling import span
+
+EXPORT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".creabroderie", "export-cache")
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+CACHE_VERSION = 2  # À changer quand les convertisseurs ou les exporteurs changent de résultat
+
+MAGIC = b"CBEC"
+MAGIC_META = b"CBEM"
+DIGEST_SIZE = 16
+META_LENGTH = struct.Struct("<I")
+
+def export_key(shapes_digest: str, format_type: str, settings: Dict[str, Any]) -> str:
+    """Clé d'un export : empreinte des formes, format et paramètres de conversion"""
+    data = json.dumps([CACHE_VERSION, shapes_digest, format_type, settings],
+                      sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=20).hexdigest()
+
+class ExportCache:
+    """Cache LRU borné des fichiers machine, adressé par le contenu"""
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = MAX_CACHE_BYTES):
+        self.directory = directory or EXPORT_CACHE_DIR
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: Optional[OrderedDict] = None  # Clé -> taille, du moins au plus récent
+        self._total = 0
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "corrupted": 0}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".bin")
+
+    def _load_entries(self):
+        """Inventaire des entrées existantes, ordonnées par dernière utilisation"""
+        if self._entries is not None:
+            return
+        found = []
+        if os.path.isdir(self.directory):
+            for root, _, names in os.walk(self.directory):
+                for name in names:
+                    if name.endswith(".bin"):
+                        try:
+                            info = os.stat(os.path.join(root, name))
+                        except OSError:
+                            continue
+                        found.append((info.st_mtime, name[:-4], info.st_size))
+        found.sort()
+        self._entries = OrderedDict((key, size) for _, key, size in found)
+        self._total = sum(self._entries.values())
+
+    def _forget(self, key: str):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._total -= size
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Contenu en cache pour cette clé, ou None (absent ou abîmé)"""
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key: str) -> Optional[Tuple[bytes, Optional[Dict[str, Any]]]]:
+        """(contenu, métadonnées ou None) en cache pour cette clé, ou None (absent ou abîmé)"""
+        with self._lock:
+            self._load_entries()
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                self._forget(key)  # Effacée hors du cache : sa taille ne compte plus
+                self.stats["misses"] += 1
+                return None
+
+            header = len(MAGIC) + DIGEST_SIZE
+            magic, digest, payload = data[:len(MAGIC)], data[len(MAGIC):header], data[header:]
+            content, meta = payload, None
+            valid = (magic in (MAGIC, MAGIC_META)
+                     and digest == hashlib.blake2b(payload, digest_size=DIGEST_SIZE).digest())
+            if valid and magic == MAGIC_META:
+                try:
+                    (length,) = META_LENGTH.unpack_from(payload)
+                    start = META_LENGTH.size
+                    meta = json.loads(payload[start:start + length].decode("utf-8"))
+                    content = payload[start + length:]
+                except (struct.error, ValueError):
+                    valid = False
+            if not valid:
+                print(f"Entrée du cache d'export abîmée, effacée : {os.path.basename(path)}")
+                self._forget(key)
+                self.stats["corrupted"] += 1
+                self.stats["misses"] += 1
+                return None
+
+            # Utilisation récente : en fin de liste et date de modification à jour
+            if key not in self._entries:
+                self._entries[key] = len(data)
+                self._total += len(data)
+            self._entries.move_to_end(key)
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            self.stats["hits"] += 1
+            return content, meta
+
+    def put(self, key: str, content: bytes, meta: Optional[Dict[str, Any]] = None):
+        """Ajoute (ou remplace) une entrée, puis efface les moins récentes si le cache est trop gros
+
+        meta (JSON) est gardé avec le contenu et rendu par get_entry().
+        """
+        magic, payload = MAGIC, content
+        if meta is not None:
+            encoded = json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            magic, payload = MAGIC_META, META_LENGTH.pack(len(encoded)) + encoded + content
+        data = magic + hashlib.blake2b(payload, digest_size=DIGEST_SIZE).digest() + payload
+        with self._lock:
+            self._load_entries()
+            path = self._path(key)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Erreur lors de l'écriture du cache d'export : {str(e)}")
+                return
+            self._total += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self.stats["writes"] += 1
+
+            while self._total > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self._forget(oldest)
+                self.stats["evictions"] += 1
+
+    def export(self, key: str, format_type: str,
+               build_design: Callable[[], EmbroideryDesign]) -> bytes:
+        """Fichier machine pour cette clé : relu du cache, ou construit puis mis en cache
+
+        build_design n'est appelé qu'en cas d'absence du cache.
+        """
+        with span("export_cache.get"):
+            content = self.get(key)
+        if content is None:
+            content = EXPORTERS[format_type]().to_bytes(build_design())
+            self.put(key, content)
+        return content
+
+    def _hit_rate(self) -> float:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def hit_rate(self) -> float:
+        with self._lock:
+            return self._hit_rate()
+
+    def report(self) -> Dict[str, Any]:
+        """Compteurs, taux de succès et taille du cache"""
+        with self._lock:
+            self._load_entries()
+            return dict(self.stats, hit_rate=self._hit_rate(), entries=len(self._entries),
+                        bytes=self._total, max_bytes=self.max_bytes)
+
+    def clear(self):
+        with self._lock:
+            self._load_entries()
+            for key in list(self._entries):
+                self._forget(key)
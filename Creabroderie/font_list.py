@@ -0,0 +1,365 @@
+# font_list.py
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+import hashlib
+import json
+import os
+import sys
+import time
+import tkinter as tk
+from tkinter import ttk, font as tkfont
+from profiling import count, span
+
+# Dossiers de polices surveillés pour invalider le cache
+FONT_DIRECTORIES = [
+    "/usr/share/fonts",
+    "/usr/local/share/fonts",
+    "~/.fonts",
+    "~/.local/share/fonts",
+    "/Library/Fonts",
+    "/System/Library/Fonts",
+    "/System/Library/Fonts/Supplemental",
+    "~/Library/Fonts",
+    os.path.join(os.environ.get("WINDIR", "C:\\Windows"), "Fonts"),
+    os.path.join(os.environ.get("LOCALAPPDATA", ""), "Microsoft", "Windows", "Fonts"),
+]
+# Niveaux de sous-dossiers surveillés (ex. /usr/share/fonts/truetype/dejavu)
+FONT_DIRECTORY_DEPTH = 2
+
+class FontCatalog:
+    """Liste des familles de polices, chargée à la demande et mise en cache sur disque
+
+    L'énumération des polices par Tk peut prendre plusieurs secondes sur une
+    machine qui en a des milliers : elle n'est faite qu'au premier besoin, et
+    le résultat est conservé sur disque tant que les dossiers de polices
+    (et leurs sous-dossiers) n'ont pas changé.
+
+    load_async lit le cache et calcule l'empreinte des dossiers hors du
+    thread de l'interface. L'énumération elle-même, quand le cache est
+    périmé, reste sur le thread de Tk (Tk n'est pas utilisable depuis un
+    autre thread) : elle est seulement différée.
+    """
+
+    def __init__(self, cache_path: Optional[str] = None):
+        self.cache_path = cache_path or os.path.join(
+            os.path.expanduser("~"), ".creabroderie", "fonts.json")
+        self.families: Optional[List[str]] = None
+        self.load_time = 0.0      # Durée du dernier chargement (secondes)
+        self.from_cache = False   # Le dernier chargement vient-il du cache disque ?
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.families is not None
+
+    def tk_info(self, root: tk.Misc) -> dict:
+        """Version de Tk et système de fenêtrage (thread de l'interface seulement)"""
+        return {
+            "platform": sys.platform,
+            "tk": root.tk.call("info", "patchlevel"),
+            "windowing": root.tk.call("tk", "windowingsystem"),
+        }
+
+    def fingerprint(self, root: tk.Misc) -> dict:
+        """Empreinte de l'installation de polices (version de Tk et dates des dossiers)"""
+        return self._fingerprint(self.tk_info(root))
+
+    def _fingerprint(self, tk_info: dict) -> dict:
+        """Empreinte : tk_info et condensé des dates des dossiers de polices
+
+        Les sous-dossiers sont parcourus sur FONT_DIRECTORY_DEPTH niveaux :
+        une police installée dans ~/.local/share/fonts/<famille>/ ne change
+        que la date de ce sous-dossier.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        pending = [(os.path.expanduser(directory), 0) for directory in FONT_DIRECTORIES]
+        while pending:
+            path, depth = pending.pop()
+            try:
+                digest.update(f"{path}\0{os.stat(path).st_mtime}\n".encode("utf-8", "replace"))
+                if depth < FONT_DIRECTORY_DEPTH:
+                    with os.scandir(path) as entries:
+                        pending.extend(sorted((entry.path, depth + 1) for entry in entries
+                                              if entry.is_dir(follow_symlinks=False)))
+            except OSError:
+                continue
+        return dict(tk_info, directories=digest.hexdigest())
+
+    def read_cache(self, tk_info: dict) -> Tuple[dict, Optional[List[str]]]:
+        """(empreinte, familles du cache disque ou None) ; sans appel à Tk"""
+        fingerprint = self._fingerprint(tk_info)
+        return fingerprint, self._read_cache(fingerprint)
+
+    def load(self, root: tk.Misc) -> List[str]:
+        """Charge les familles depuis le cache disque, ou les énumère avec Tk"""
+        if self.families is not None:
+            return self.families
+        start = time.perf_counter()
+        return self._finish(root, *self.read_cache(self.tk_info(root)), start)
+
+    def load_async(self, root: tk.Misc, on_loaded: Callable[[List[str]], None]):
+        """Charge les familles sans bloquer l'interface, puis appelle on_loaded(familles)"""
+        if self.families is not None:
+            on_loaded(self.families)
+            return
+        start = time.perf_counter()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        future = self._executor.submit(self.read_cache, self.tk_info(root))
+
+        def poll():
+            if not future.done():
+                root.after(10, poll)
+                return
+            if self.families is None:  # Pas déjà chargées par load() entre-temps
+                self._finish(root, *future.result(), start)
+            on_loaded(self.families)
+        poll()
+
+    def _finish(self, root: tk.Misc, fingerprint: dict, families: Optional[List[str]],
+                start: float) -> List[str]:
+        """Termine un chargement ; énumère les polices avec Tk si le cache est périmé"""
+        self.from_cache = families is not None
+        if families is None:
+            with span("enumerate_fonts"):
+                families = sorted(set(tkfont.families(root)))
+            self._write_cache(fingerprint, families)
+        self.families = families
+        self.load_time = time.perf_counter() - start
+        return families
+
+    def _read_cache(self, fingerprint: dict) -> Optional[List[str]]:
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("fingerprint") != fingerprint:
+            return None
+        return data.get("families")
+
+    def _write_cache(self, fingerprint: dict, families: List[str]):
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = self.cache_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"fingerprint": fingerprint, "families": families}, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"Impossible d'écrire le cache des polices : {str(e)}")
+
+class LRUCache:
+    """Cache borné qui oublie les entrées les moins récemment utilisées"""
+
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = maxsize
+        self.data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Retourne la valeur en cache, ou la calcule avec factory()"""
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            value = factory()
+            self.data[key] = value
+            if len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+            return value
+        self.hits += 1
+        self.data.move_to_end(key)
+        return value
+
+    def clear(self):
+        self.data.clear()
+
+class VirtualListbox(ttk.Frame):
+    """Liste déroulante qui ne crée que les lignes visibles
+
+    Reprend l'interface de tk.Listbox utilisée par l'application
+    (curselection, get, select_set, see, <<ListboxSelect>>) mais garde un
+    nombre constant d'éléments sur son canvas, quel que soit le nombre de
+    lignes.
+    """
+
+    def __init__(self, parent, width: int = 30, height: int = 10, placeholder: str = ""):
+        super().__init__(parent)
+        self.items: List[str] = []
+        self.selected: Optional[int] = None
+        self.first = 0  # Index de la première ligne visible
+        self.placeholder = placeholder
+
+        self.font = tkfont.nametofont("TkDefaultFont")
+        self.row_height = self.font.metrics("linespace") + 2
+        char_width = self.font.measure("0")
+
+        self.canvas = tk.Canvas(self, width=width * char_width, height=height * self.row_height,
+                                bg="white", highlightthickness=1, takefocus=1)
+        self.scrollbar = ttk.Scrollbar(self, command=self.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.rows = []  # Éléments (fond, texte) recyclés d'un affichage à l'autre
+
+        self.canvas.bind("<Configure>", lambda e: self.redraw())
+        self.canvas.bind("<Button-1>", self.on_click)
+        self.canvas.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.canvas.bind("<Button-4>", lambda e: self.scroll(-3))
+        self.canvas.bind("<Button-5>", lambda e: self.scroll(3))
+        self.canvas.bind("<Up>", lambda e: self.move_selection(-1))
+        self.canvas.bind("<Down>", lambda e: self.move_selection(1))
+
+    # Interface compatible avec tk.Listbox
+
+    def set_items(self, items: List[str]):
+        """Remplace le contenu de la liste"""
+        self.items = list(items)
+        self.selected = None
+        self.first = 0
+        self.redraw()
+
+    def size(self) -> int:
+        return len(self.items)
+
+    def get(self, index: int) -> str:
+        return self.items[index]
+
+    def curselection(self) -> tuple:
+        return (self.selected,) if self.selected is not None else ()
+
+    def select_set(self, index: int):
+        if 0 <= index < len(self.items):
+            self.selected = index
+            self.redraw()
+
+    def see(self, index: int):
+        """Fait défiler la liste pour rendre la ligne visible"""
+        visible = self.visible_rows()
+        if index < self.first:
+            self.first = index
+        elif index >= self.first + visible:
+            self.first = index - visible + 1
+        self.first = self.clamp_first(self.first)
+        self.redraw()
+
+    # Défilement
+
+    def visible_rows(self) -> int:
+        """Nombre de lignes entièrement visibles"""
+        height = self.canvas.winfo_height()
+        if height <= 1:  # Pas encore affiché : hauteur demandée
+            height = int(self.canvas["height"])
+        return max(1, height // self.row_height)
+
+    def clamp_first(self, first: int) -> int:
+        return max(0, min(first, len(self.items) - self.visible_rows()))
+
+    def yview(self, *args):
+        """Commande de la barre de défilement (moveto / scroll)"""
+        if args[0] == "moveto":
+            self.first = int(float(args[1]) * len(self.items))
+        elif args[0] == "scroll":
+            amount = int(args[1])
+            if args[2] == "pages":
+                amount *= self.visible_rows()
+            self.first += amount
+        self.first = self.clamp_first(self.first)
+        self.redraw()
+
+    def scroll(self, rows: int):
+        self.first = self.clamp_first(self.first + rows)
+        self.redraw()
+
+    def on_mouse_wheel(self, event):
+        self.scroll(-3 if event.delta > 0 else 3)
+
+    # Sélection
+
+    def on_click(self, event):
+        self.canvas.focus_set()
+        index = self.first + event.y // self.row_height
+        if 0 <= index < len(self.items):
+            self.selected = index
+            self.redraw()
+            self.event_generate("<<ListboxSelect>>")
+
+    def move_selection(self, step: int):
+        if not self.items:
+            return
+        index = 0 if self.selected is None else self.selected + step
+        index = max(0, min(index, len(self.items) - 1))
+        self.selected = index
+        self.see(index)
+        self.event_generate("<<ListboxSelect>>")
+
+    # Affichage
+
+    def redraw(self):
+        """Met à jour les seules lignes visibles"""
+        visible = self.visible_rows() + 1  # Avec la ligne partiellement visible
+        width = max(self.canvas.winfo_width(), int(self.canvas["width"]))
+
+        # Agrandir le réservoir de lignes si la liste est plus haute
+        while len(self.rows) < visible:
+            y = len(self.rows) * self.row_height
+            background = self.canvas.create_rectangle(0, y, width, y + self.row_height,
+                                                      outline="", fill="")
+            text = self.canvas.create_text(4, y + 1, anchor="nw", font=self.font)
+            self.rows.append((background, text))
+
+        if not self.items:
+            for i, (background, text) in enumerate(self.rows):
+                self.canvas.itemconfigure(background, fill="")
+                self.canvas.itemconfigure(text, text=self.placeholder if i == 0 else "",
+                                          fill="#888888")
+            self.scrollbar.set(0, 1)
+            return
+
+        for i, (background, text) in enumerate(self.rows):
+            index = self.first + i
+            y = i * self.row_height
+            self.canvas.coords(background, 0, y, width, y + self.row_height)
+            if index < len(self.items):
+                selected = index == self.selected
+                self.canvas.itemconfigure(background, fill="#0078D7" if selected else "")
+                self.canvas.itemconfigure(text, text=self.items[index],
+                                          fill="white" if selected else "black")
+            else:
+                self.canvas.itemconfigure(background, fill="")
+                self.canvas.itemconfigure(text, text="")
+
+        total = len(self.items)
+        self.scrollbar.set(self.first / total, min(1.0, (self.first + visible - 1) / total))
+
+def load_font_list(catalog: FontCatalog, listbox: VirtualListbox, root: tk.Misc,
+                   default: str = "Arial", callback: Optional[Callable[[], None]] = None,
+                   deferred: bool = False):
+    """Charge les polices dans la liste et sélectionne la police par défaut
+
+    Si deferred, le cache est lu hors du thread de l'interface et la liste
+    est remplie plus tard (voir FontCatalog.load_async).
+    """
+    if listbox.size():
+        return
+
+    def fill(families: List[str]):
+        if listbox.size():
+            return  # Déjà remplie par un chargement immédiat
+        with span("load_font_list"):
+            listbox.set_items(families)
+        count("font_families", len(families))
+        count("font_list_from_cache", int(catalog.from_cache))
+        index = families.index(default) if default in families else 0
+        listbox.select_set(index)
+        listbox.see(index)
+        if callback:
+            callback()
+
+    if deferred:
+        catalog.load_async(root, fill)
+    else:
+        fill(catalog.load(root))
@@ -0,0 +1,179 @@
+# image_import.py
+
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import compress, groupby
+from typing import Dict, List, Optional, Tuple
+import time
+from PIL import Image, ImageChops, ImageFilter
+
+# Rectangle en cellules : (index de couleur, x1, y1, x2, y2), x2 et y2 exclus
+Rect = Tuple[int, int, int, int, int]
+
+TRANSPARENT = 255      # Index réservé aux pixels transparents (jamais brodés)
+BAND_HEIGHT = 64       # Hauteur (en cellules) des bandes traitées séparément
+POOL_MIN_CELLS = 250_000  # En dessous, le pool de processus coûte plus qu'il ne rapporte
+BACKGROUND_DISTANCE = 32  # Écart maximal par canal (0-255) entre un pixel de fond et le fond
+
+@dataclass
+class RasterImport:
+    """Résultat de l'import d'une image : palette et rectangles de couleur"""
+    palette: List[str]                      # Couleurs hex des zones
+    rects: List[Rect]                       # Zones de couleur en cellules
+    size: Tuple[int, int]                   # Taille de l'image en cellules
+    cell_mm: float                          # Taille d'une cellule en mm
+    timings: Dict[str, float] = field(default_factory=OrderedDict)  # Étape -> secondes
+
+    def rect_mm(self, rect: Rect) -> Tuple[float, float, float, float]:
+        """Coordonnées d'un rectangle en mm"""
+        _, x1, y1, x2, y2 = rect
+        cell = self.cell_mm
+        return x1 * cell, y1 * cell, x2 * cell, y2 * cell
+
+def _vectorize_band(args) -> List[Rect]:
+    """Nettoie une bande d'image indexée et la découpe en rectangles de couleur unie
+
+    La bande est reçue avec une ligne de voisinage au-dessus et au-dessous
+    pour le filtre de nettoyage (couleur majoritaire sur 3 x 3). Chaque
+    ligne est ensuite découpée en segments d'une même couleur ; un segment
+    identique (mêmes bornes, même couleur) sur la ligne suivante prolonge le
+    rectangle au lieu d'en ouvrir un nouveau.
+    """
+    data, width, height, top, margin_top = args
+    band = Image.frombytes("L", (width, len(data) // width), data)
+    band = band.filter(ImageFilter.ModeFilter(3))
+    data = band.tobytes()[margin_top * width:(margin_top + height) * width]
+
+    rects = []
+    open_runs: Dict[Tuple[int, int, int], int] = {}  # (x1, x2, couleur) -> première ligne
+    for y in range(height):
+        row = data[y * width:(y + 1) * width]
+        runs = set()
+        x = 0
+        for color, group in groupby(row):
+            length = sum(1 for _ in group)
+            if color != TRANSPARENT:
+                runs.add((x, x + length, color))
+            x += length
+        # Fermer les rectangles qui ne continuent pas sur cette ligne
+        for run in [run for run in open_runs if run not in runs]:
+            rects.append((run[2], run[0], top + open_runs.pop(run), run[1], top + y))
+        for run in runs:
+            if run not in open_runs:
+                open_runs[run] = y
+    for run, start in open_runs.items():
+        rects.append((run[2], run[0], top + start, run[1], top + height))
+    return rects
+
+def import_image(path: str, width_mm: float = 80.0, cell_mm: float = 0.5,
+                 max_colors: int = 8, tolerance: float = 6.0, remove_background: bool = True,
+                 workers: Optional[int] = None) -> RasterImport:
+    """Transforme une image (PNG, JPEG...) en zones de couleur à broder
+
+    L'image est ramenée à une cellule par cell_mm, réduite à max_colors
+    couleurs, débarrassée des pixels isolés puis découpée en rectangles ;
+    les couleurs à moins de tolerance (ΔE2000) l'une de l'autre, typiquement
+    les nuances de l'anticrénelage, sont fusionnées.
+    Les pixels transparents, et le fond (couleur dominante du bord) si
+    remove_background, ne sont pas brodés : ils sont écartés avant la
+    réduction des couleurs, qui ne garde ses max_colors couleurs que pour
+    les zones brodées. Les grandes images sont
+    découpées en bandes nettoyées et vectorisées en parallèle dans un pool
+    de processus.
+    """
+    result = RasterImport(palette=[], rects=[], size=(0, 0), cell_mm=cell_mm)
+    timings = result.timings
+    start = time.perf_counter()
+
+    def lap(stage):
+        nonlocal start
+        now = time.perf_counter()
+        timings[stage] = now - start
+        start = now
+
+    # Chargement et mise à l'échelle
+    with Image.open(path) as source:
+        image = source.convert("RGBA")
+    columns = max(1, round(width_mm / cell_mm))
+    rows = max(1, round(image.height * columns / image.width))
+    # reducing_gap : réduction entière rapide avant le filtre de Lanczos
+    image = image.resize((columns, rows), Image.LANCZOS, reducing_gap=2.0)
+    alpha = image.getchannel("A")
+    # Les bords semi-transparents sont mélangés au blanc plutôt qu'au noir
+    image = Image.alpha_composite(Image.new("RGBA", image.size, (255, 255, 255, 255)), image)
+    lap("chargement")
+
+    # Pixels exclus : transparents, et fond = couleur dominante du bord
+    image = image.convert("RGB")
+    excluded = alpha.point(lambda a: 255 if a < 128 else 0)
+    if remove_background:
+        border = ([(x, 0) for x in range(columns)] + [(x, rows - 1) for x in range(columns)]
+                  + [(0, y) for y in range(rows)] + [(columns - 1, y) for y in range(rows)])
+        border = [image.getpixel(xy) for xy in border if alpha.getpixel(xy) >= 128]
+        if border:
+            # Nuances du fond regroupées par 16 niveaux, fond = moyenne du groupe dominant
+            groups = Counter((r >> 4, g >> 4, b >> 4) for r, g, b in border)
+            dominant = max(groups, key=groups.get)
+            shades = [pixel for pixel in border
+                      if (pixel[0] >> 4, pixel[1] >> 4, pixel[2] >> 4) == dominant]
+            background = tuple(sum(channel) // len(shades) for channel in zip(*shades))
+            difference = ImageChops.difference(image, Image.new("RGB", image.size, background))
+            distance = ImageChops.lighter(ImageChops.lighter(*difference.split()[:2]),
+                                          difference.getchannel("B"))
+            excluded = ImageChops.lighter(
+                excluded, distance.point(lambda d: 255 if d <= BACKGROUND_DISTANCE else 0))
+
+    # Réduction aux couleurs des fils, d'après les seuls pixels brodés
+    kept = list(compress(image.getdata(), (value == 0 for value in excluded.getdata())))
+    if kept:
+        sample = Image.new("RGB", (len(kept), 1))
+        sample.putdata(kept)
+        sample = sample.quantize(colors=max(1, min(max_colors, 254)), method=Image.MEDIANCUT)
+        quantized = image.quantize(palette=sample, dither=Image.Dither.NONE)
+        quantized.paste(TRANSPARENT, mask=excluded)
+    else:
+        quantized = Image.new("P", image.size, TRANSPARENT)
+    if tolerance > 0 and kept:
+        # Import local : les processus du pool n'ont pas besoin de la base des fils
+        from palette import reduce_palette
+        raw_palette = quantized.getpalette()
+        counts = quantized.histogram()
+        indices = [i for i in range(len(raw_palette) // 3) if counts[i] and i != TRANSPARENT]
+        colors = ["#%02x%02x%02x" % tuple(raw_palette[i * 3:i * 3 + 3]) for i in indices]
+        merged, mapping = reduce_palette(colors, [counts[i] for i in indices], tolerance=tolerance)
+        if len(merged) < len(colors):
+            lut = list(range(256))
+            for i, new_index in zip(indices, mapping):
+                lut[i] = indices[colors.index(merged[new_index])]
+            quantized = quantized.point(lut)
+    lap("quantification")
+
+    # Nettoyage et vectorisation par bandes, en parallèle pour les grandes images
+    data = quantized.tobytes()
+    bands = []
+    for top in range(0, rows, BAND_HEIGHT):
+        height = min(BAND_HEIGHT, rows - top)
+        first, last = max(0, top - 1), min(rows, top + height + 1)  # Lignes voisines
+        bands.append((data[first * columns:last * columns], columns, height, top, top - first))
+    if columns * rows >= POOL_MIN_CELLS and len(bands) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            band_rects = list(pool.map(_vectorize_band, bands))
+    else:
+        band_rects = [_vectorize_band(band) for band in bands]
+    lap("nettoyage et vectorisation")
+
+    # Palette réduite aux couleurs réellement utilisées
+    raw_palette = quantized.getpalette() or []
+    used = sorted({rect[0] for rects in band_rects for rect in rects})
+    remap = {index: new for new, index in enumerate(used)}
+    result.palette = ["#%02x%02x%02x" % tuple(raw_palette[index * 3:index * 3 + 3])
+                      for index in used]
+    result.rects = [(remap[rect[0]],) + rect[1:] for rects in band_rects for rect in rects]
+    result.size = (columns, rows)
+    lap("palette")
+    return result
+
+def format_timings(timings: Dict[str, float]) -> str:
+    """Durées des étapes, pour affichage"""
+    return ", ".join(f"{stage} {duration * 1000:.0f} ms" for stage, duration in timings.items())
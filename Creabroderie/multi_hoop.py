@@ -0,0 +1,258 @@
+# multi_hoop.py
+"""Découpage d'un motif plus grand que le tambour en plusieurs passages
+
+Le motif est partagé en une grille de cellules de (tambour - chevauchement)
+mm ; chaque passage de tambour brode une cellule et couvre en plus
+chevauchement / 2 mm de chaque côté, où sont brodées les marques de
+repérage (petites croix aux coins des cellules, communes aux passages
+voisins) qui servent à replacer le tissu.
+
+Les points sont répartis en un seul parcours : un point reste dans le
+passage en cours tant qu'il tient dans son tambour (la cellule et sa
+marge), sinon il va au passage de la cellule qui le contient ; seuls les
+points trop longs pour tenir dans un tambour sont coupés sur les limites de
+cellule. Le coût ne dépend donc pas du nombre de cellules, même pour une
+très grande bannière.
+
+Les passages sont encodés en parallèle, un fichier machine par passage.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Sequence, Tuple
+import os
+from embroidery_export import EXPORTERS, EmbroideryDesign, StitchPoint, StitchType
+from palette import insert_color_changes
+from profiling import count, span
+
+DEFAULT_OVERLAP_MM = 10.0
+REGISTRATION_COLOR = "#ff0000"  # Fil de repérage, à retirer après la pose
+REGISTRATION_ARM_MM = 2.0       # Demi-longueur des branches des croix de repérage
+
+@dataclass
+class Hooping:
+    """Un passage de tambour"""
+    row: int
+    column: int
+    origin_mm: Tuple[float, float]  # Coin du tambour dans les coordonnées du motif
+    design: EmbroideryDesign        # Points relatifs au coin du tambour, hoop_size_mm orienté
+    rotated: bool = False           # Tambour posé tourné d'un quart de tour
+
+def design_extent(points: Sequence[StitchPoint]) -> Tuple[float, float, float, float]:
+    """Boîte englobant les points (x1, y1, x2, y2), en mm"""
+    positions = [point for point in points if point.stitch_type != StitchType.COLOR_CHANGE]
+    if not positions:
+        return 0.0, 0.0, 0.0, 0.0
+    xs = [point.x for point in positions]
+    ys = [point.y for point in positions]
+    return min(xs), min(ys), max(xs), max(ys)
+
+def fits_hoop(design: EmbroideryDesign) -> bool:
+    """Vrai si les points du motif tiennent dans le tambour (dans un sens ou dans l'autre)"""
+    x1, y1, x2, y2 = design_extent(design.points)
+    width, height = x2 - x1, y2 - y1
+    hoop_w, hoop_h = design.hoop_size_mm
+    return (width <= hoop_w and height <= hoop_h) or (width <= hoop_h and height <= hoop_w)
+
+def _cells(length: float, hoop: float, overlap: float) -> int:
+    """Nombre de cellules de (hoop - overlap) mm couvrant length mm"""
+    return max(1, int(-(-length // (hoop - overlap))))
+
+def plan_hoopings(design: EmbroideryDesign,
+                  overlap_mm: float = DEFAULT_OVERLAP_MM) -> Tuple[Tuple[float, float], Tuple[float, float], int, int, bool]:
+    """Grille des passages : (origine, (pas x, pas y), lignes, colonnes, tambour tourné)
+
+    Le tambour est tourné d'un quart de tour si cela réduit le nombre de
+    passages. Lève ValueError si le chevauchement ne laisse pas de place
+    dans le tambour.
+    """
+    hoop_w, hoop_h = design.hoop_size_mm
+    if overlap_mm < 2 * REGISTRATION_ARM_MM or overlap_mm >= min(hoop_w, hoop_h):
+        raise ValueError(f"Chevauchement invalide : {overlap_mm} mm pour un tambour de "
+                         f"{hoop_w}x{hoop_h} mm")
+
+    x1, y1, x2, y2 = design_extent(design.points)
+    best = None
+    for rotated, hoop in ((False, (hoop_w, hoop_h)), (True, (hoop_h, hoop_w))):
+        columns = _cells(x2 - x1, hoop[0], overlap_mm)
+        rows = _cells(y2 - y1, hoop[1], overlap_mm)
+        if best is None or rows * columns < best[2] * best[3]:
+            best = ((x1, y1), (hoop[0] - overlap_mm, hoop[1] - overlap_mm), rows, columns, rotated)
+    return best
+
+def _registration_marks(corners: Sequence[Tuple[float, float]], color_index: int) -> List[StitchPoint]:
+    """Croix de repérage aux coins donnés (coordonnées du tambour)"""
+    arm = REGISTRATION_ARM_MM
+    points = []
+    for x, y in corners:
+        points.append(StitchPoint(x - arm, y, StitchType.JUMP, color_index))
+        points.append(StitchPoint(x + arm, y, StitchType.NORMAL, color_index))
+        points.append(StitchPoint(x, y - arm, StitchType.JUMP, color_index))
+        points.append(StitchPoint(x, y + arm, StitchType.NORMAL, color_index))
+    return points
+
+def split_design(design: EmbroideryDesign, overlap_mm: float = DEFAULT_OVERLAP_MM,
+                 registration_marks: bool = True) -> List[Hooping]:
+    """Découpe le motif en passages de tambour, dans l'ordre de lecture de la grille
+
+    Un point qui franchit une limite de cellule mais finit dans la marge
+    reste entier dans le passage en cours : le chevauchement évite ainsi de
+    couper les points (des morceaux de quelques centièmes de mm casseraient
+    le fil à chaque raccord). Seul un point qui ne tient dans le tambour
+    d'aucune de ses deux extrémités est coupé sur les limites franchies, les
+    morceaux allant dans leurs cellules respectives. Chaque passage reprend
+    par un saut là où il s'était arrêté. Les sauts et fins de forme ne sont
+    que des déplacements : ils ne sont pas reportés, le saut nécessaire est
+    ajouté au point brodé suivant. Chaque passage ne garde que les fils
+    qu'il utilise.
+
+    Si le tambour doit être tourné, hoop_size_mm de chaque passage est la
+    taille du tambour dans ce sens et Hooping.rotated le signale.
+    """
+    (x0, y0), (step_x, step_y), rows, columns, rotated = plan_hoopings(design, overlap_mm)
+    hoop_size = tuple(reversed(design.hoop_size_mm)) if rotated else tuple(design.hoop_size_mm)
+    if rows * columns == 1:
+        x1, y1, _, _ = design_extent(design.points)
+        return [Hooping(0, 0, (x1, y1), replace(design, hoop_size_mm=hoop_size), rotated)]
+
+    margin = overlap_mm / 2
+
+    def cell_of(x: float, y: float) -> Tuple[int, int]:
+        row = min(max(int((y - y0) // step_y), 0), rows - 1)
+        column = min(max(int((x - x0) // step_x), 0), columns - 1)
+        return row, column
+
+    def in_hoop(cell: Tuple[int, int], x: float, y: float) -> bool:
+        """Vrai si (x, y) est dans le tambour du passage de la cellule (marge comprise)"""
+        row, column = cell
+        left, top = x0 + column * step_x - margin, y0 + row * step_y - margin
+        return left <= x <= left + step_x + overlap_mm and top <= y <= top + step_y + overlap_mm
+
+    buckets: Dict[Tuple[int, int], List[StitchPoint]] = {}
+    pens: Dict[Tuple[int, int], Tuple[float, float]] = {}  # Dernière position de chaque passage
+
+    def emit(cell, ax, ay, bx, by, color_index):
+        """Ajoute le point (ax, ay) -> (bx, by) au passage de la cellule"""
+        bucket = buckets.get(cell)
+        if bucket is None:
+            bucket = buckets[cell] = []
+        if pens.get(cell) != (ax, ay):
+            bucket.append(StitchPoint(ax, ay, StitchType.JUMP, color_index))
+        bucket.append(StitchPoint(bx, by, StitchType.NORMAL, color_index))
+        pens[cell] = (bx, by)
+
+    clipped = 0
+    with span("split_design", stitches=len(design.points), hoopings=rows * columns):
+        previous = None
+        current = None  # Passage en cours
+        for point in design.points:
+            if point.stitch_type == StitchType.COLOR_CHANGE:
+                continue  # Recalculés pour chaque passage
+            bx, by = point.x, point.y
+            if point.stitch_type != StitchType.NORMAL or previous is None:
+                # Simple déplacement (un premier point brodé seul serait de longueur nulle)
+                previous = (bx, by)
+                continue
+
+            ax, ay = previous
+            previous = (bx, by)
+            if current is not None and in_hoop(current, ax, ay) and in_hoop(current, bx, by):
+                emit(current, ax, ay, bx, by, point.color_index)
+                continue
+            start_cell = cell_of(ax, ay)
+            end_cell = cell_of(bx, by)
+            whole = [cell for cell in (start_cell, end_cell)
+                     if in_hoop(cell, ax, ay) and in_hoop(cell, bx, by)]
+            if whole:
+                current = whole[0]
+                emit(current, ax, ay, bx, by, point.color_index)
+                continue
+            current = end_cell
+
+            # Coupures sur les limites franchies (verticales puis horizontales)
+            cuts = [0.0, 1.0]
+            low, high = sorted((start_cell[1], end_cell[1]))
+            for column in range(low + 1, high + 1):
+                cuts.append((x0 + column * step_x - ax) / (bx - ax))
+            low, high = sorted((start_cell[0], end_cell[0]))
+            for row in range(low + 1, high + 1):
+                cuts.append((y0 + row * step_y - ay) / (by - ay))
+            cuts.sort()
+            clipped += 1
+
+            px, py = ax, ay
+            for t0, t1 in zip(cuts, cuts[1:]):
+                if t1 <= t0:
+                    continue
+                qx, qy = (bx, by) if t1 == 1.0 else (ax + (bx - ax) * t1, ay + (by - ay) * t1)
+                middle = (t0 + t1) / 2
+                emit(cell_of(ax + (bx - ax) * middle, ay + (by - ay) * middle),
+                     px, py, qx, qy, point.color_index)
+                px, py = qx, qy
+    count("clipped_stitches", clipped)
+
+    hoopings = []
+    for (row, column), bucket in sorted(buckets.items()):
+        origin_x = x0 + column * step_x - margin
+        origin_y = y0 + row * step_y - margin
+
+        # Palette du passage : fils utilisés, dans l'ordre de la palette d'origine
+        used = sorted({point.color_index for point in bucket})
+        mapping = {index: new_index for new_index, index in enumerate(used)}
+        thread_colors = [design.thread_colors[index] if index < len(design.thread_colors)
+                         else "#000000" for index in used]
+        thread_references = [design.thread_references[index] if index < len(design.thread_references)
+                             else "" for index in used] if design.thread_references else []
+
+        points = []
+        if registration_marks:
+            mark_color = len(thread_colors)
+            thread_colors.append(REGISTRATION_COLOR)
+            if thread_references:
+                thread_references.append("")
+            corners = [(margin + dx * step_x, margin + dy * step_y) for dy in (0, 1) for dx in (0, 1)]
+            points.extend(_registration_marks(corners, mark_color))
+        for point in bucket:
+            points.append(StitchPoint(point.x - origin_x, point.y - origin_y,
+                                      point.stitch_type, mapping[point.color_index]))
+
+        x1, y1, x2, y2 = design_extent(points)
+        hoopings.append(Hooping(row, column, (origin_x, origin_y), EmbroideryDesign(
+            points=insert_color_changes(points), thread_colors=thread_colors,
+            size_mm=(x2 - x1, y2 - y1), hoop_size_mm=hoop_size,
+            thread_references=thread_references), rotated))
+    return hoopings
+
+def hooping_label(hooping: Hooping) -> str:
+    """Nom court d'un passage : L<ligne>C<colonne>"""
+    return f"L{hooping.row + 1}C{hooping.column + 1}"
+
+def hooping_path(filepath: str, hooping: Hooping) -> str:
+    """Fichier d'un passage : motif-L<ligne>C<colonne>.ext"""
+    stem, extension = os.path.splitext(filepath)
+    return f"{stem}-{hooping_label(hooping)}{extension}"
+
+def _encode(format_type: str, design: EmbroideryDesign) -> bytes:
+    return EXPORTERS[format_type]().to_bytes(design)
+
+def export_hoopings(hoopings: Sequence[Hooping], filepath: str, format_type: str,
+                    max_workers: Optional[int] = None) -> List[str]:
+    """Encode les passages en parallèle et écrit un fichier par passage
+
+    Retourne les chemins écrits, dans l'ordre des passages.
+    """
+    designs = [hooping.design for hooping in hoopings]
+    with span("export_hoopings", hoopings=len(hoopings)):
+        if len(designs) == 1 or max_workers == 1:
+            contents = [_encode(format_type, design) for design in designs]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                contents = list(executor.map(_encode, [format_type] * len(designs), designs))
+
+        paths = []
+        for hooping, content in zip(hoopings, contents):
+            path = hooping_path(filepath, hooping)
+            with open(path, "wb") as f:
+                f.write(content)
+            paths.append(path)
+    return paths
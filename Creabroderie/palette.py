@@ -0,0 +1,185 @@
+# palette.py
+
+from itertools import compress
+from typing import Dict, List, Optional, Sequence, Tuple
+from color_matching import Lab, delta_e_2000, hex_to_lab
+from embroidery_export import EmbroideryDesign, StitchColumns, StitchPoint, StitchType
+
+KMEANS_ITERATIONS = 20
+
+def _distance2(a: Lab, b: Lab) -> float:
+    return (a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2 + (a[2] - b[2]) ** 2
+
+def _kmeans(labs: List[Lab], weights: List[float], k: int) -> List[int]:
+    """k-moyennes pondérées dans l'espace Lab ; retourne le groupe de chaque point
+
+    L'initialisation est déterministe (k-means++ sans hasard) : le point le
+    plus lourd d'abord, puis à chaque fois celui qui maximise poids x
+    distance au carré au centre le plus proche.
+    """
+    centers = [labs[max(range(len(labs)), key=lambda i: weights[i])]]
+    nearest = [_distance2(lab, centers[0]) for lab in labs]
+    while len(centers) < k:
+        index = max(range(len(labs)), key=lambda i: weights[i] * nearest[i])
+        centers.append(labs[index])
+        nearest = [min(d, _distance2(lab, labs[index])) for d, lab in zip(nearest, labs)]
+
+    assignment: List[int] = []
+    for _ in range(KMEANS_ITERATIONS):
+        new_assignment = [min(range(k), key=lambda c: _distance2(lab, centers[c])) for lab in labs]
+        if new_assignment == assignment:
+            break
+        assignment = new_assignment
+
+        # Nouveaux centres : moyenne pondérée des points de chaque groupe
+        sums = [[0.0, 0.0, 0.0, 0.0] for _ in range(k)]
+        for lab, weight, group in zip(labs, weights, assignment):
+            total = sums[group]
+            total[0] += lab[0] * weight
+            total[1] += lab[1] * weight
+            total[2] += lab[2] * weight
+            total[3] += weight
+        centers = [(s[0] / s[3], s[1] / s[3], s[2] / s[3]) if s[3] else centers[c]
+                   for c, s in enumerate(sums)]
+    return assignment
+
+def reduce_palette(colors: Sequence[str], weights: Optional[Sequence[float]] = None,
+                   max_colors: int = 0, tolerance: float = 0.0) -> Tuple[List[str], List[int]]:
+    """Regroupe les couleurs proches d'une palette
+
+    Les couleurs à moins de tolerance (ΔE2000) l'une de l'autre sont d'abord
+    fusionnées, puis, s'il reste plus de max_colors couleurs, les groupes
+    sont réunis par k-moyennes dans l'espace Lab. Chaque groupe est
+    représenté par sa couleur la plus utilisée (weights : nombre de points
+    par couleur), pour que les couleurs dominantes restent exactes.
+
+    Retourne (palette réduite, index dans la palette réduite de chaque
+    couleur d'origine) ; la palette réduite garde l'ordre d'apparition.
+    """
+    if weights is None:
+        weights = [1.0] * len(colors)
+
+    labs: List[Optional[Lab]] = []
+    for color in colors:
+        try:
+            labs.append(hex_to_lab(color))
+        except ValueError:  # Couleur Tk inconnue de PIL : jamais fusionnée
+            labs.append(None)
+
+    # Fusion par tolérance, des couleurs les plus utilisées vers les moins utilisées
+    order = sorted(range(len(colors)), key=lambda i: -weights[i])
+    groups: List[List[int]] = []  # Le premier index de chaque groupe est son représentant
+    for i in order:
+        best = None
+        if tolerance > 0 and labs[i] is not None:
+            candidates = [(delta_e_2000(labs[i], labs[group[0]]), g)
+                          for g, group in enumerate(groups) if labs[group[0]] is not None]
+            candidates = [c for c in candidates if c[0] <= tolerance]
+            if candidates:
+                best = min(candidates)[1]
+        if best is None:
+            groups.append([i])
+        else:
+            groups[best].append(i)
+
+    # Réduction au nombre de fils demandé
+    if max_colors and len(groups) > max_colors:
+        fixed = [group for group in groups if labs[group[0]] is None]
+        mergeable = [group for group in groups if labs[group[0]] is not None]
+        k = max(1, max_colors - len(fixed))
+        if len(mergeable) > k:
+            assignment = _kmeans([labs[group[0]] for group in mergeable],
+                                 [sum(weights[i] for i in group) for group in mergeable], k)
+            merged: Dict[int, List[int]] = {}
+            for group, cluster in zip(mergeable, assignment):
+                merged.setdefault(cluster, []).extend(group)
+            mergeable = [sorted(members, key=lambda i: -weights[i]) for members in merged.values()]
+        groups = mergeable + fixed
+
+    # Palette dans l'ordre d'apparition des couleurs d'origine
+    groups.sort(key=min)
+    palette = []
+    mapping = [0] * len(colors)
+    for new_index, group in enumerate(groups):
+        representative = max(group, key=lambda i: (weights[i], -i))
+        palette.append(colors[representative])
+        for i in group:
+            mapping[i] = new_index
+    return palette, mapping
+
+def reduce_design_palette(design: EmbroideryDesign, max_colors: int = 0,
+                          tolerance: float = 0.0) -> EmbroideryDesign:
+    """Réduit la palette d'un motif et réécrit l'index de couleur de ses points"""
+    if not design.thread_colors or (not max_colors and tolerance <= 0):
+        return design
+
+    points = design.points
+    columns = hasattr(points, "colors")  # StitchColumns : colonne des couleurs réécrite
+    weights = [0.0] * len(design.thread_colors)
+    for color_index in (points.colors if columns else (point.color_index for point in points)):
+        if 0 <= color_index < len(weights):
+            weights[color_index] += 1
+
+    palette, mapping = reduce_palette(design.thread_colors, weights, max_colors, tolerance)
+    if columns:
+        points.colors = [mapping[color_index] if 0 <= color_index < len(mapping) else color_index
+                         for color_index in points.colors]
+    else:
+        for point in points:
+            if 0 <= point.color_index < len(mapping):
+                point.color_index = mapping[point.color_index]
+    design.thread_colors = palette
+    return design
+
+def insert_color_changes(points: Sequence[StitchPoint]) -> Sequence[StitchPoint]:
+    """Ajoute un changement de couleur (arrêt machine) à chaque changement de fil
+
+    Le point de changement reprend la position du point précédent : la
+    machine s'arrête là où elle est, sans déplacement. Des points en
+    colonnes (StitchColumns) donnent des colonnes, recopiées par tranches.
+    """
+    if hasattr(points, "xs"):
+        return _insert_color_changes_columns(points)
+    result = []
+    current = None
+    for point in points:
+        if point.stitch_type == StitchType.COLOR_CHANGE:
+            continue  # Recalculés ci-dessous
+        if current is not None and point.color_index != current and result:
+            previous = result[-1]
+            result.append(StitchPoint(previous.x, previous.y, StitchType.COLOR_CHANGE,
+                                      point.color_index))
+        current = point.color_index
+        result.append(point)
+    return result
+
+def _insert_color_changes_columns(points: StitchColumns) -> StitchColumns:
+    xs, ys, colors, types = points.xs, points.ys, points.colors, points.types
+    if StitchType.COLOR_CHANGE in types:  # Recalculés ci-dessous
+        kept = [stitch_type != StitchType.COLOR_CHANGE for stitch_type in types]
+        xs, ys = list(compress(xs, kept)), list(compress(ys, kept))
+        colors, types = list(compress(colors, kept)), list(compress(types, kept))
+    changes = [i for i in range(1, len(colors)) if colors[i] != colors[i - 1]]
+    if not changes:
+        return StitchColumns(list(xs), list(ys), list(colors), list(types))
+
+    out_x, out_y, out_colors, out_types = [], [], [], []
+    start = 0
+    for i in changes:
+        out_x.extend(xs[start:i])
+        out_y.extend(ys[start:i])
+        out_colors.extend(colors[start:i])
+        out_types.extend(types[start:i])
+        out_x.append(xs[i - 1])
+        out_y.append(ys[i - 1])
+        out_colors.append(colors[i])
+        out_types.append(StitchType.COLOR_CHANGE)
+        start = i
+    out_x.extend(xs[start:])
+    out_y.extend(ys[start:])
+    out_colors.extend(colors[start:])
+    out_types.extend(types[start:])
+    return StitchColumns(out_x, out_y, out_colors, out_types)
+
+def count_color_changes(points: Sequence[StitchPoint]) -> int:
+    return sum(1 for point in points if point.stitch_type == StitchType.COLOR_CHANGE)
@@ -0,0 +1,147 @@
+# profiling.py
+"""Instrumentation de la conversion et de l'export
+
+    with span("rectangle_to_stitches", shape=3):
+        ...
+    count("stitches", len(points))
+
+Désactivé par défaut (ou activé au démarrage par la variable
+d'environnement CREABRODERIE_PROFILE=1), le profilage se met en marche ou
+s'arrête à tout moment avec enable() / disable(). Désactivé, span()
+retourne un contexte vide partagé et count() ne fait rien : le coût se
+limite à un test.
+
+Les mesures s'exportent au format Chrome trace-event (chrome://tracing,
+Perfetto) avec write_chrome_trace(), ou en résumé texte avec summary() /
+write_summary().
+"""
+
+from collections import defaultdict
+from typing import Any, Dict, List
+import json
+import os
+import threading
+import time
+
+class _NullSpan:
+    """Contexte vide utilisé quand le profilage est désactivé"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ("profiler", "name", "args", "start")
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler._add_span(self.name, self.start, time.perf_counter(), self.args)
+        return False
+
+class Profiler:
+    """Enregistre des intervalles nommés et des compteurs"""
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._events: List[Dict[str, Any]] = []
+        self._counters: Dict[str, float] = defaultdict(float)
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        """Oublie les mesures déjà enregistrées"""
+        with self._lock:
+            self._origin = time.perf_counter()
+            self._events.clear()
+            self._counters.clear()
+
+    def span(self, name: str, **args):
+        """Contexte mesurant la durée d'une étape"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def add_span(self, name: str, start: float, end: float, **args):
+        """Enregistre une étape mesurée ailleurs (instants time.perf_counter())"""
+        if self.enabled:
+            self._add_span(name, start, end, args)
+
+    def count(self, name: str, value: float = 1):
+        """Ajoute value au compteur name"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] += value
+            self._events.append({
+                "name": name, "ph": "C", "pid": os.getpid(),
+                "ts": (time.perf_counter() - self._origin) * 1e6,
+                "args": {name: self._counters[name]},
+            })
+
+    def _add_span(self, name: str, start: float, end: float, args: Dict[str, Any]):
+        event = {
+            "name": name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+            "ts": (start - self._origin) * 1e6, "dur": (end - start) * 1e6,
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            self._events.append(event)
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """Mesures au format Chrome trace-event"""
+        with self._lock:
+            return {"traceEvents": list(self._events), "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f, ensure_ascii=False)
+
+    def write_summary(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.summary() + "\n")
+
+    def summary(self) -> str:
+        """Résumé texte : par étape, nombre d'appels et durées ; puis les compteurs"""
+        stats: Dict[str, List[float]] = {}
+        with self._lock:
+            for event in self._events:
+                if event["ph"] == "X":
+                    stats.setdefault(event["name"], []).append(event["dur"] / 1000)
+            counters = dict(self._counters)
+
+        lines = [f"{'étape':<32} {'appels':>7} {'total ms':>10} {'moy. ms':>9} {'max ms':>9}"]
+        for name, durations in sorted(stats.items(), key=lambda item: -sum(item[1])):
+            total = sum(durations)
+            lines.append(f"{name:<32} {len(durations):7d} {total:10.2f} "
+                         f"{total / len(durations):9.3f} {max(durations):9.2f}")
+        for name, value in sorted(counters.items()):
+            lines.append(f"{name:<32} {value:>7g}")
+        return "\n".join(lines)
+
+PROFILER = Profiler()
+if os.environ.get("CREABRODERIE_PROFILE"):
+    PROFILER.enable()
+
+# Raccourcis vers le profileur global
+span = PROFILER.span
+count = PROFILER.count
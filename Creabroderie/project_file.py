@@ -0,0 +1,261 @@
+# project_file.py
+"""Format de projet Créabroderie (.cbrd)
+
+Fichier binaire petit-boutiste, découpé en sections contiguës :
+
+    en-tête   "CBRD", version (u16), nombre de sections (u16)
+    table     par section : étiquette (4 octets), position (u64), taille (u64)
+    META      JSON : paramètres et empreinte des formes des points en cache
+    STYL      JSON : styles distincts des formes [[type, config], ...]
+    SHPS      formes : nombre (u32) puis par forme style (u32), nombre de
+              coordonnées (u16) et coordonnées du monde (f32)
+    PALT      JSON : couleurs et fils de la palette des points
+    STCH      points : nombre (u32), puis tableaux x (f32), y (f32),
+              couleur (u16) et type (u8)
+
+Le fichier est ouvert avec mmap et seules les sections demandées sont
+décodées ; les tableaux de points sont lus sur place, sans copie.
+"""
+
+from array import array
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from embroidery_export import EmbroideryDesign, StitchColumns
+
+MAGIC = b"CBRD"
+FORMAT_VERSION = 1
+PROJECT_EXTENSION = ".cbrd"
+
+HEADER = struct.Struct("<4sHH")
+SECTION = struct.Struct("<4sQQ")
+SHAPE = struct.Struct("<IH")
+
+Shape = Tuple[str, List[float], Dict[str, Any]]  # Comme capture_state()
+
+def encode_shapes(shapes: Sequence[Shape]) -> Tuple[bytes, bytes]:
+    """Encode les formes en (STYL, SHPS) ; les styles identiques sont partagés"""
+    styles: Dict[str, int] = {}
+    parts = [struct.pack("<I", len(shapes))]
+    for item_type, coords, config in shapes:
+        key = json.dumps([item_type, config], sort_keys=True, ensure_ascii=False)
+        index = styles.setdefault(key, len(styles))
+        parts.append(SHAPE.pack(index, len(coords)))
+        parts.append(struct.pack(f"<{len(coords)}f", *coords))
+    style_list = "[" + ",".join(styles) + "]"
+    return style_list.encode("utf-8"), b"".join(parts)
+
+def shapes_digest(shapes: Sequence[Shape]) -> str:
+    """Empreinte du contenu des formes, pour valider les points en cache"""
+    styles, data = encode_shapes(shapes)
+    return hashlib.blake2b(styles + data, digest_size=16).hexdigest()
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+def encode_project(shapes: Sequence[Shape], design: Optional[EmbroideryDesign] = None,
+                   stitch_settings: Optional[Dict[str, Any]] = None) -> bytes:
+    """Encode un projet ; design (optionnel) est mis en cache avec ses paramètres
+
+    stitch_settings doit être sérialisable en JSON : ce sont les paramètres
+    de conversion qui ont produit design.
+    """
+    styles, shape_data = encode_shapes(shapes)
+    meta: Dict[str, Any] = {"shapes": len(shapes)}
+    sections = [(b"STYL", styles), (b"SHPS", shape_data)]
+
+    if design is not None:
+        points = design.points
+        count = len(points)
+        meta["stitches"] = {
+            "digest": hashlib.blake2b(styles + shape_data, digest_size=16).hexdigest(),
+            "settings": stitch_settings or {},
+            "count": count,
+            "size_mm": list(design.size_mm),
+            "hoop_size_mm": list(design.hoop_size_mm),
+        }
+        palette = {"colors": design.thread_colors, "threads": design.thread_references}
+        sections.append((b"PALT", json.dumps(palette, ensure_ascii=False).encode("utf-8")))
+
+        if hasattr(points, "xs"):  # Points en colonnes
+            xs, ys = array("f", points.xs), array("f", points.ys)
+            colors, types = array("H", points.colors), array("B", points.types)
+        else:
+            xs = array("f", (point.x for point in points))
+            ys = array("f", (point.y for point in points))
+            colors = array("H", (point.color_index for point in points))
+            types = array("B", (point.stitch_type for point in points))
+        if sys.byteorder != "little":
+            for values in (xs, ys, colors):
+                values.byteswap()
+        # Chaque tableau commence sur une frontière de 8 octets
+        blob = bytearray(struct.pack("<I", count))
+        for values in (xs, ys, colors, types):
+            blob.extend(b"\0" * (_align(len(blob)) - len(blob)))
+            blob.extend(values.tobytes())
+        sections.append((b"STCH", bytes(blob)))
+
+    sections.insert(0, (b"META", json.dumps(meta).encode("utf-8")))
+
+    # Table des sections, puis sections alignées sur 8 octets
+    offset = _align(HEADER.size + SECTION.size * len(sections))
+    table = []
+    for tag, data in sections:
+        table.append((tag, offset, len(data)))
+        offset = _align(offset + len(data))
+
+    out = bytearray(HEADER.pack(MAGIC, FORMAT_VERSION, len(sections)))
+    for entry in table:
+        out.extend(SECTION.pack(*entry))
+    for (tag, data), (_, position, _) in zip(sections, table):
+        out.extend(b"\0" * (position - len(out)))
+        out.extend(data)
+    return bytes(out)
+
+def write_project(path: str, data: bytes):
+    """Écrit un projet encodé (fichier temporaire puis remplacement)"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def save_project(path: str, shapes: Sequence[Shape], design: Optional[EmbroideryDesign] = None,
+                 stitch_settings: Optional[Dict[str, Any]] = None):
+    """Enregistre un projet (voir encode_project)"""
+    write_project(path, encode_project(shapes, design, stitch_settings))
+
+class StitchArrays(StitchColumns):
+    """Points de broderie lus directement dans les tableaux du fichier
+
+    Se comporte comme la liste de StitchPoint d'un EmbroideryDesign, mais
+    ne crée les objets qu'au moment où on les parcourt.
+    """
+
+    def release(self):
+        for view in (self.xs, self.ys, self.colors, self.types):
+            if isinstance(view, memoryview):
+                view.release()
+
+class ProjectFile:
+    """Projet ouvert en lecture, décodé section par section à la demande"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Fichier vide
+            self._file.close()
+            raise ValueError(f"Fichier de projet vide : {path}")
+        self._views: List[StitchArrays] = []
+
+        magic, version, count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"Ce fichier n'est pas un projet Créabroderie : {path}")
+        if version > FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"Projet enregistré par une version plus récente (format {version})")
+        self.version = version
+        self.sections: Dict[str, Tuple[int, int]] = {}
+        for i in range(count):
+            tag, offset, length = SECTION.unpack_from(self._map, HEADER.size + i * SECTION.size)
+            self.sections[tag.decode("ascii")] = (offset, length)
+        self.meta = self._json("META") or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Libère les tableaux de points puis le fichier"""
+        for view in self._views:
+            view.release()
+        self._views.clear()
+        if not self._map.closed:
+            self._map.close()
+        self._file.close()
+
+    def _section(self, tag: str) -> Optional[memoryview]:
+        if tag not in self.sections:
+            return None
+        offset, length = self.sections[tag]
+        return memoryview(self._map)[offset:offset + length]
+
+    def _json(self, tag: str):
+        view = self._section(tag)
+        if view is None:
+            return None
+        with view:
+            return json.loads(bytes(view).decode("utf-8"))
+
+    def shapes(self) -> List[Shape]:
+        """Décode la liste des formes (type, coordonnées du monde, config)"""
+        styles = self._json("STYL") or []
+        for item_type, config in styles:
+            if isinstance(config.get("font"), list):
+                config["font"] = tuple(config["font"])
+        view = self._section("SHPS")
+        if view is None:
+            return []
+        shapes = []
+        with view:
+            count, = struct.unpack_from("<I", view, 0)
+            position = 4
+            for _ in range(count):
+                style, length = SHAPE.unpack_from(view, position)
+                position += SHAPE.size
+                coords = list(struct.unpack_from(f"<{length}f", view, position))
+                position += 4 * length
+                item_type, config = styles[style]
+                shapes.append((item_type, coords, dict(config)))
+        return shapes
+
+    def stitch_settings(self) -> Optional[Dict[str, Any]]:
+        """Paramètres de conversion des points en cache, s'il y en a"""
+        stitches = self.meta.get("stitches")
+        return stitches["settings"] if stitches else None
+
+    def stitch_digest(self) -> Optional[str]:
+        """Empreinte des formes dont les points en cache sont issus"""
+        stitches = self.meta.get("stitches")
+        return stitches["digest"] if stitches else None
+
+    def design(self) -> Optional[EmbroideryDesign]:
+        """Motif en cache, avec ses points lus sans copie depuis le fichier"""
+        settings = self.meta.get("stitches")
+        view = self._section("STCH")
+        if settings is None or view is None:
+            return None
+        count, = struct.unpack_from("<I", view, 0)
+        arrays = []
+        position = 4
+        for code, size in (("f", 4), ("f", 4), ("H", 2), ("B", 1)):
+            position = _align(position)
+            data = view[position:position + count * size]
+            if sys.byteorder != "little" and size > 1:
+                values = array(code, bytes(data))
+                values.byteswap()
+                data.release()
+            else:
+                values = data.cast(code)
+            arrays.append(values)
+            position += count * size
+        view.release()
+
+        points = StitchArrays(*arrays)
+        self._views.append(points)
+        palette = self._json("PALT") or {}
+        return EmbroideryDesign(
+            points=points,
+            thread_colors=palette.get("colors", []),
+            size_mm=tuple(settings.get("size_mm", (100, 100))),
+            hoop_size_mm=tuple(settings.get("hoop_size_mm", (100, 100))),
+            thread_references=palette.get("threads", []),
+        )
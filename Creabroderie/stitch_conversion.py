@@ -0,0 +1,365 @@
+# stitch_conversion.py
+"""Conversion des formes du dessin en points de broderie
+
+Indépendant de l'interface : les formes sont décrites comme dans
+capture_state(), (type, coordonnées du monde, config), ce qui permet de
+convertir un dessin sans canvas (service de conversion, traitements par
+lots).
+"""
+
+from functools import lru_cache
+from itertools import groupby
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import math
+import re
+from embroidery_export import EmbroideryDesign, StitchColumns, StitchPoint, StitchType
+from palette import reduce_design_palette, insert_color_changes
+from profiling import count, span
+from viewport import PIXELS_PER_MM
+
+Shape = Tuple[str, List[float], Dict[str, Any]]  # Comme capture_state()
+
+TEXT_ROW_MM = 0.4        # Écart entre les rangs du remplissage des lettres
+TEXT_STITCH_MM = 3.5     # Longueur maximale d'un point de remplissage
+TEXT_MIN_RUN_MM = 0.4    # Segments plus courts ignorés (l'aiguille repiquerait au même endroit)
+TK_POINT_PIXELS = 96 / 72  # Pixels par point typographique (taille Tk positive)
+
+def oval_to_stitches(coords: list, color_index: int, density: float,
+                     config: Optional[Dict[str, Any]] = None) -> List[StitchPoint]:
+    """Convertit un cercle en points de broderie"""
+    x1, y1, x2, y2 = coords
+    center_x = (x1 + x2) / 2
+    center_y = (y1 + y2) / 2
+    radius_x = (x2 - x1) / 2
+    radius_y = (y2 - y1) / 2
+
+    points = []
+    num_points = int(max(radius_x, radius_y) * density)
+
+    for i in range(num_points):
+        angle = 2 * math.pi * i / num_points
+        x = center_x + radius_x * math.cos(angle)
+        y = center_y + radius_y * math.sin(angle)
+        points.append(StitchPoint(x/PIXELS_PER_MM, y/PIXELS_PER_MM, StitchType.NORMAL, color_index))
+
+    # Ajouter un point de fin
+    points.append(StitchPoint(
+        points[0].x, points[0].y,
+        StitchType.END, color_index
+    ))
+
+    return points
+
+def rectangle_to_stitches(coords: list, color_index: int, density: float,
+                          config: Optional[Dict[str, Any]] = None) -> List[StitchPoint]:
+    """Convertit un rectangle en points de broderie"""
+    x1, y1, x2, y2 = coords
+    points = []
+
+    # Calculer l'espacement entre les lignes
+    spacing = 1.0 / density  # en pixels
+
+    # Créer des lignes horizontales
+    y = y1
+    direction = 1
+    while y <= y2:
+        if direction > 0:
+            # Gauche à droite
+            points.append(StitchPoint(x1/PIXELS_PER_MM, y/PIXELS_PER_MM, StitchType.NORMAL, color_index))
+            points.append(StitchPoint(x2/PIXELS_PER_MM, y/PIXELS_PER_MM, StitchType.NORMAL, color_index))
+        else:
+            # Droite à gauche
+            points.append(StitchPoint(x2/PIXELS_PER_MM, y/PIXELS_PER_MM, StitchType.NORMAL, color_index))
+            points.append(StitchPoint(x1/PIXELS_PER_MM, y/PIXELS_PER_MM, StitchType.NORMAL, color_index))
+
+        y += spacing
+        direction *= -1
+
+    return points
+
+def parse_font(font) -> Tuple[str, int, bool, bool]:
+    """(famille, taille, gras, italique) d'une police Tk (tuple ou chaîne)"""
+    if isinstance(font, str):
+        parts = [braced or word for braced, word in re.findall(r'\{([^}]*)\}|(\S+)', font)]
+    else:
+        parts = [str(part) for part in font or ()]
+    family = parts[0] if parts else 'Arial'
+    try:
+        size = int(parts[1]) if len(parts) > 1 else 12
+    except ValueError:
+        size = 12
+    styles = {part.lower() for part in parts[2:]}
+    return family, size, 'bold' in styles, 'italic' in styles
+
+@lru_cache(maxsize=64)
+def _load_font(family: str, size_px: int, bold: bool, italic: bool):
+    """Police PIL la plus proche ; retourne (police, gras à simuler)
+
+    Les noms de fichiers essayés suivent les conventions courantes
+    (DejaVuSans-Bold.ttf, arialbd.ttf...). À défaut, la police par défaut
+    de PIL est utilisée.
+    """
+    from PIL import ImageFont
+    if bold and italic:
+        suffixes = ["-BoldItalic", "-BoldOblique", "bi", "z"]
+    elif bold:
+        suffixes = ["-Bold", "bd", "b"]
+    elif italic:
+        suffixes = ["-Italic", "-Oblique", "i"]
+    else:
+        suffixes = []
+    names = list(dict.fromkeys((family.replace(" ", ""), family, family.lower().replace(" ", ""))))
+    for suffix in suffixes + [""]:
+        for name in names:
+            try:
+                return ImageFont.truetype(name + suffix, size_px), bold and not suffix
+            except OSError:
+                continue
+    try:
+        return ImageFont.load_default(size=size_px), bold
+    except TypeError:  # PIL < 10.1 : police bitmap de taille fixe
+        return ImageFont.load_default(), bold
+
+def _text_offset(anchor: str, width: float, height: float) -> Tuple[float, float]:
+    """Décalage du coin haut gauche du bloc de texte par rapport au point d'ancrage Tk"""
+    anchor = anchor or 'center'
+    dx = 0.0 if 'w' in anchor else -width if 'e' in anchor else -width / 2
+    dy = 0.0 if 'n' in anchor else -height if 's' in anchor else -height / 2
+    return dx, dy
+
+def text_to_stitches(coords: list, color_index: int, density: float,
+                     config: Optional[Dict[str, Any]] = None) -> List[StitchPoint]:
+    """Convertit du texte en points de broderie
+
+    Les lettres sont dessinées avec la police du texte (à 100 %, un pixel
+    par pixel du monde) puis remplies par rangs horizontaux espacés de
+    TEXT_ROW_MM mm, parcourus en aller-retour ; les points ne dépassent pas
+    TEXT_STITCH_MM mm et un saut relie les segments éloignés. La densité
+    des formes géométriques ne s'applique pas : l'écart des rangs est celui
+    d'un remplissage de lettres.
+    """
+    from PIL import Image, ImageDraw
+    config = config or {}
+    text = str(config.get('text', ''))
+    x, y = coords[:2]
+    if not text.strip():
+        return []
+
+    family, size, bold, italic = parse_font(config.get('font', ('Arial', 12)))
+    size_px = max(1, round(size * TK_POINT_PIXELS if size > 0 else -size))
+    font, synthetic_bold = _load_font(family, size_px, bold, italic)
+    stroke = max(1, size_px // 20) if synthetic_bold else 0
+
+    # Bloc de texte tel que Tk l'ancre : largeur de la plus longue ligne,
+    # hauteur des lignes (hauteur de police + interligne de PIL)
+    lines = text.split("\n")
+    draw = ImageDraw.Draw(Image.new("L", (1, 1)))
+    ascent, descent = font.getmetrics() if hasattr(font, "getmetrics") else (size_px, 0)
+    block_w = max(draw.textlength(line, font=font) for line in lines)
+    block_h = len(lines) * (ascent + descent) + (len(lines) - 1) * 4
+    dx, dy = _text_offset(config.get('anchor', 'center'), block_w, block_h)
+
+    left, top, right, bottom = draw.textbbox((0, 0), text, font=font, stroke_width=stroke)
+    mask = Image.new("L", (right - left + 2, bottom - top + 2), 0)
+    ImageDraw.Draw(mask).text((1 - left, 1 - top), text, fill=255, font=font,
+                              stroke_width=stroke, stroke_fill=255)
+    origin_x, origin_y = x + dx + left - 1, y + dy + top - 1  # Pixel (0, 0) du masque
+
+    width, height = mask.size
+    data = mask.tobytes()
+    step = max(1, round(TEXT_ROW_MM * PIXELS_PER_MM))
+    max_px = TEXT_STITCH_MM * PIXELS_PER_MM
+    min_px = TEXT_MIN_RUN_MM * PIXELS_PER_MM
+
+    points: List[StitchPoint] = []
+    pen = None
+    direction = 1
+    for row in range(step // 2, height, step):
+        runs = []
+        start = 0
+        for inked, group in groupby(data[row * width:(row + 1) * width], lambda value: value >= 128):
+            length = sum(1 for _ in group)
+            if inked and length >= min_px:
+                runs.append((start, start + length))
+            start += length
+        if direction < 0:
+            runs = [(b, a) for a, b in reversed(runs)]
+        direction = -direction
+
+        world_y = origin_y + row + 0.5
+        for a, b in runs:
+            ax, bx = origin_x + a, origin_x + b
+            # Segment voisin : on y va en brodant, sinon par un saut ; un segment
+            # presque contigu est pris depuis la position de l'aiguille
+            gap = math.hypot(ax - pen[0], world_y - pen[1]) if pen is not None else math.inf
+            if gap >= min_px:
+                points.append(StitchPoint(ax / PIXELS_PER_MM, world_y / PIXELS_PER_MM,
+                                          StitchType.NORMAL if gap <= max_px else StitchType.JUMP,
+                                          color_index))
+            pieces = max(1, math.ceil(abs(bx - ax) / max_px))
+            for i in range(1, pieces + 1):
+                points.append(StitchPoint((ax + (bx - ax) * i / pieces) / PIXELS_PER_MM,
+                                          world_y / PIXELS_PER_MM, StitchType.NORMAL, color_index))
+            pen = (bx, world_y)
+
+    if points:
+        points.append(StitchPoint(points[-1].x, points[-1].y, StitchType.END, color_index))
+    return points
+
+CONVERTERS = {
+    'oval': oval_to_stitches,
+    'rectangle': rectangle_to_stitches,
+    'text': text_to_stitches,
+}
+
+def translate_stitches(points: StitchColumns, columns: Tuple[list, list, list, list],
+                       dx: float, dy: float):
+    """Ajoute à points les colonnes (x, y, couleurs, types) d'une forme, décalées de (dx, dy) mm
+
+    Les colonnes sont recopiées (map sur des listes de nombres), sans
+    créer de StitchPoint : une copie liée ne coûte que la recopie de ses
+    nombres.
+    """
+    xs, ys, colors, types = columns
+    if dx or dy:
+        points.xs.extend(map(dx.__add__, xs))
+        points.ys.extend(map(dy.__add__, ys))
+    else:
+        points.xs.extend(xs)
+        points.ys.extend(ys)
+    points.colors.extend(colors)
+    points.types.extend(types)
+
+def instance_shape_key(item_type: str, coords: List[float], color_index: int,
+                       config: Optional[Dict[str, Any]] = None) -> tuple:
+    """Géométrie d'une forme à une translation près (coordonnées relatives au premier point)
+
+    Pour un texte, le texte, la police et l'ancrage en font partie : deux
+    copies liées dont le texte diffère ne partagent pas leurs points.
+    """
+    x0, y0 = coords[0], coords[1]
+    key = (item_type, color_index,
+           tuple(round(value - (x0 if i % 2 == 0 else y0), 3) for i, value in enumerate(coords)))
+    if item_type == 'text':
+        config = config or {}
+        key += (str(config.get('text', '')), parse_font(config.get('font', ('Arial', 12))),
+                config.get('anchor', 'center'))
+    return key
+
+def _stitch_columns(points: List[StitchPoint]) -> Tuple[list, list, list, list]:
+    return ([point.x for point in points], [point.y for point in points],
+            [point.color_index for point in points], [point.stitch_type for point in points])
+
+def shapes_to_stitches(shapes: Sequence[Shape], density: float,
+                       shape_cache: Optional[Dict[tuple, tuple]] = None) -> Tuple[StitchColumns, List[str]]:
+    """Convertit les formes dans l'ordre de dessin ; retourne (points en colonnes, couleurs)
+
+    Les formes liées (même config['instance']) et de même géométrie à une
+    translation près ne sont converties qu'une fois : les suivantes
+    reprennent les colonnes de la première, décalées (voir
+    translate_stitches). Les points restent en colonnes jusqu'à l'export,
+    sans StitchPoint par copie.
+
+    shape_cache (dictionnaire gardé par l'appelant d'une conversion à
+    l'autre) garde les points de chaque forme, à sa place exacte : seules
+    les formes ajoutées ou modifiées depuis la conversion précédente sont
+    converties. Il ne garde ensuite que les formes de cette conversion.
+    """
+    points = StitchColumns([], [], [], [])
+    thread_colors = []
+    masters: Dict[Any, Tuple[tuple, Tuple[float, float], tuple]] = {}  # instance -> (clé, origine, colonnes)
+    converted: Dict[tuple, tuple] = {}  # Formes de cette conversion, pour shape_cache
+    reused = 0
+    cached = 0
+
+    for item_type, coords, config in shapes:
+        fill = config.get('fill')
+        converter = CONVERTERS.get(item_type)
+
+        # Seuls les éléments remplis sont brodés
+        if fill and converter is not None:
+            # Ajouter la couleur à la palette si nécessaire
+            if fill not in thread_colors:
+                thread_colors.append(fill)
+            color_index = thread_colors.index(fill)
+
+            instance = config.get('instance')
+            shape_key = None
+            if instance is not None or shape_cache is not None:
+                shape_key = instance_shape_key(item_type, coords, color_index, config)
+            if shape_cache is not None:
+                cache_key = (shape_key, coords[0], coords[1], density)
+                columns = shape_cache.get(cache_key)
+                if columns is not None:
+                    translate_stitches(points, columns, 0.0, 0.0)
+                    converted[cache_key] = columns
+                    if instance is not None and instance not in masters:
+                        masters[instance] = (shape_key, (coords[0], coords[1]), columns)
+                    cached += 1
+                    continue
+            if instance is not None:
+                master = masters.get(instance)
+                if master is not None and master[0] == shape_key:
+                    (x0, y0), columns = master[1], master[2]
+                    translate_stitches(points, columns, (coords[0] - x0) / PIXELS_PER_MM,
+                                       (coords[1] - y0) / PIXELS_PER_MM)
+                    reused += 1
+                    continue
+
+            try:
+                with span(converter.__name__):
+                    shape_points = converter(coords, color_index, density, config)
+            except Exception as e:
+                print(f"Erreur lors de la conversion de {item_type}: {str(e)}")
+                continue
+            columns = _stitch_columns(shape_points)
+            translate_stitches(points, columns, 0.0, 0.0)
+
+            if shape_cache is not None:
+                converted[cache_key] = columns
+            if instance is not None and instance not in masters:
+                masters[instance] = (shape_key, (coords[0], coords[1]), columns)
+
+    if shape_cache is not None:
+        shape_cache.clear()
+        shape_cache.update(converted)
+        count("shapes_cached", cached)
+    count("instances_reused", reused)
+    return points, thread_colors
+
+def shapes_size_mm(shapes: Sequence[Shape]) -> Tuple[float, float]:
+    """Taille (mm) de la boîte englobant les coordonnées des formes"""
+    xs = [x for _, coords, _ in shapes for x in coords[0::2]]
+    ys = [y for _, coords, _ in shapes for y in coords[1::2]]
+    if not xs:
+        return 100, 100
+    return (max(xs) - min(xs)) / PIXELS_PER_MM, (max(ys) - min(ys)) / PIXELS_PER_MM
+
+def convert_shapes(shapes: Sequence[Shape], density: float, hoop_size: tuple,
+                   max_colors: int = 0, tolerance: float = 0.0,
+                   size_mm: Optional[Tuple[float, float]] = None,
+                   shape_cache: Optional[Dict[tuple, tuple]] = None) -> EmbroideryDesign:
+    """Convertit des formes en motif de broderie
+
+    Les couleurs proches sont regroupées si max_colors (nombre de fils) ou
+    tolerance (ΔE2000) est donné, et un changement de couleur est ajouté à
+    chaque changement de fil. size_mm vaut par défaut la boîte englobant
+    les coordonnées des formes. shape_cache : voir shapes_to_stitches.
+    """
+    with span("shapes_to_stitches"):
+        points, thread_colors = shapes_to_stitches(shapes, density, shape_cache)
+    count("items", len(shapes))
+
+    # S'assurer qu'il y a au moins un point
+    if not len(points):
+        points = StitchColumns([0.0], [0.0], [0], [StitchType.NORMAL])
+
+    with span("reduce_design_palette", colors=len(thread_colors)):
+        design = reduce_design_palette(
+            EmbroideryDesign(points=points, thread_colors=thread_colors,
+                             size_mm=size_mm or shapes_size_mm(shapes), hoop_size_mm=hoop_size),
+            max_colors, tolerance)
+    with span("insert_color_changes"):
+        design.points = insert_color_changes(design.points)
+    count("stitches", len(design.points))
+    return design
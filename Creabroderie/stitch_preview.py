@@ -0,0 +1,163 @@
+# stitch_preview.py
+
+from typing import Dict, List, Optional, Set, Tuple
+from PIL import Image, ImageColor, ImageDraw
+from embroidery_export import EmbroideryDesign, StitchType
+from viewport import PIXELS_PER_MM, merge_close_points
+
+Tile = Tuple[int, int]
+
+class StitchRun:
+    """Suite continue de points cousus dans une même couleur"""
+    __slots__ = ("color", "points", "bbox", "key")
+
+    def __init__(self, color: str, points: List[Tuple[float, float]]):
+        self.color = color
+        self.points = points
+        xs = [p[0] for p in points]
+        ys = [p[1] for p in points]
+        self.bbox = (min(xs), min(ys), max(xs), max(ys))
+        # Clé de contenu : deux segments identiques donnent la même clé
+        self.key = (color, hash(tuple(points)))
+
+class StitchPreviewRenderer:
+    """Rendu des points de broderie dans des tuiles d'images mises en cache
+
+    Le flux de points est découpé en polylignes (une par suite de points
+    d'une même couleur), chaque polyligne étant tracée d'un seul appel
+    ImageDraw. Une tuile n'est redessinée que si l'ensemble des polylignes
+    qui la touchent a changé depuis le rendu précédent, et seules les
+    tuiles de la zone visible sont rendues.
+    """
+
+    def __init__(self, tile_size: int = 256, scale: float = PIXELS_PER_MM, line_width: int = 1):
+        self.tile_size = tile_size
+        self.scale = scale            # Pixels par millimètre
+        self.line_width = line_width
+        self.merge_distance = 0.0     # Distance (pixels) sous laquelle les points sont fusionnés
+        self.tiles: Dict[Tile, Image.Image] = {}
+        self.signatures: Dict[Tile, tuple] = {}
+        self._runs_design = None
+        self._runs: List[StitchRun] = []
+
+    def clear(self):
+        """Vide le cache de tuiles"""
+        self.tiles.clear()
+        self.signatures.clear()
+        self._runs_design = None
+        self._runs = []
+
+    def set_scale(self, scale: float, merge_distance: float = 0.0):
+        """Change l'échelle de rendu (invalide toutes les tuiles)"""
+        if scale != self.scale or merge_distance != self.merge_distance:
+            self.scale = scale
+            self.merge_distance = merge_distance
+            self.clear()
+
+    def update(self, design: EmbroideryDesign,
+               view: Optional[Tuple[float, float, float, float]] = None) -> Tuple[Set[Tile], Set[Tile]]:
+        """Met à jour les tuiles et retourne (tuiles redessinées, tuiles supprimées)
+
+        view est le rectangle visible en pixels de rendu ; les tuiles hors
+        de ce rectangle ne sont pas rendues.
+        """
+        if design is not self._runs_design:
+            self._runs = self._build_runs(design)
+            self._runs_design = design
+        runs = self._runs
+
+        # Répartir les polylignes dans les tuiles qu'elles touchent
+        margin = self.line_width
+        size = self.tile_size
+        if view is not None:
+            min_tx, min_ty = int(view[0] // size), int(view[1] // size)
+            max_tx, max_ty = int(view[2] // size), int(view[3] // size)
+        tile_runs: Dict[Tile, List[StitchRun]] = {}
+        for run in runs:
+            x1, y1, x2, y2 = run.bbox
+            tx1, tx2 = int((x1 - margin) // size), int((x2 + margin) // size)
+            ty1, ty2 = int((y1 - margin) // size), int((y2 + margin) // size)
+            if view is not None:
+                # Ne garder que les tuiles visibles
+                tx1, tx2 = max(tx1, min_tx), min(tx2, max_tx)
+                ty1, ty2 = max(ty1, min_ty), min(ty2, max_ty)
+            for tx in range(tx1, tx2 + 1):
+                for ty in range(ty1, ty2 + 1):
+                    tile_runs.setdefault((tx, ty), []).append(run)
+
+        changed = set()
+        for tile, tile_content in tile_runs.items():
+            signature = tuple(run.key for run in tile_content)
+            if self.signatures.get(tile) != signature:
+                self.tiles[tile] = self._render_tile(tile, tile_content)
+                self.signatures[tile] = signature
+                changed.add(tile)
+
+        removed = set(self.tiles) - set(tile_runs)
+        for tile in removed:
+            del self.tiles[tile]
+            del self.signatures[tile]
+
+        return changed, removed
+
+    def tile_origin(self, tile: Tile) -> Tuple[int, int]:
+        """Position en pixels du coin supérieur gauche d'une tuile"""
+        return tile[0] * self.tile_size, tile[1] * self.tile_size
+
+    def _build_runs(self, design: EmbroideryDesign) -> List[StitchRun]:
+        """Découpe le flux de points en polylignes par couleur"""
+        runs = []
+        current = []
+        current_color = None
+        scale = self.scale
+
+        def flush():
+            if current:
+                points = merge_close_points(current, self.merge_distance)
+                runs.append(StitchRun(self._color(design, current_color), list(points)))
+                current.clear()
+
+        for point in design.points:
+            stitch_type = point.stitch_type
+            if stitch_type == StitchType.NORMAL or stitch_type == StitchType.END:
+                if point.color_index != current_color:
+                    flush()
+                    current_color = point.color_index
+                current.append((point.x * scale, point.y * scale))
+                if stitch_type == StitchType.END:
+                    flush()
+            else:
+                # Saut, coupe ou changement de couleur : le fil n'est pas tendu
+                flush()
+                if stitch_type == StitchType.JUMP:
+                    current_color = point.color_index
+                    current.append((point.x * scale, point.y * scale))
+        flush()
+
+        return runs
+
+    def _color(self, design: EmbroideryDesign, color_index: int) -> str:
+        if 0 <= color_index < len(design.thread_colors):
+            return design.thread_colors[color_index]
+        return "#000000"
+
+    def _render_tile(self, tile: Tile, runs: List[StitchRun]) -> Image.Image:
+        """Dessine les polylignes d'une tuile"""
+        image = Image.new("RGBA", (self.tile_size, self.tile_size), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(image)
+        ox, oy = self.tile_origin(tile)
+
+        for run in runs:
+            try:
+                color = ImageColor.getrgb(run.color)
+            except ValueError:
+                color = (0, 0, 0)
+
+            points = [(x - ox, y - oy) for x, y in run.points]
+            if len(points) == 1:
+                x, y = points[0]
+                draw.ellipse((x - 1, y - 1, x + 1, y + 1), fill=color)
+            else:
+                draw.line(points, fill=color, width=self.line_width)
+
+        return image
@@ -1,12 +1,20 @@
 # thread_management.py
 
 from dataclasses import dataclass
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import atexit
+import csv
 import json
 import os
+import re
 import tkinter as tk
 from tkinter import ttk
 import sqlite3
+import threading
+import time
 
 @dataclass
 class ThreadColor:
@@ -17,159 +25,829 @@ class ThreadColor:
     hex_color: str
     is_favorite: bool = False
 
+# Noms de colonnes acceptés dans les catalogues importés
+CATALOG_COLUMNS = {
+    "brand": ("brand", "marque"),
+    "reference": ("reference", "référence", "ref", "réf", "code", "number"),
+    "name": ("name", "nom", "description"),
+    "hex_color": ("hex_color", "hex", "color", "couleur", "rgb"),
+}
+
+def normalize_hex(value: str) -> str:
+    """Normalise une couleur en #RRGGBB"""
+    value = value.strip().lstrip("#")
+    if len(value) == 3:
+        value = "".join(c * 2 for c in value)
+    if len(value) != 6:
+        raise ValueError(f"Couleur invalide : {value!r}")
+    int(value, 16)  # Vérifie que la couleur est bien hexadécimale
+    return "#" + value.upper()
+
+def _catalog_row(record: Dict[str, str], brand: Optional[str]) -> Tuple[str, str, str, str]:
+    """Extrait (marque, référence, nom, couleur) d'un enregistrement de catalogue"""
+    fields = {}
+    for field_name, aliases in CATALOG_COLUMNS.items():
+        for alias in aliases:
+            if record.get(alias) not in (None, ""):
+                fields[field_name] = str(record[alias]).strip()
+                break
+    row_brand = fields.get("brand") or brand
+    if not row_brand or "reference" not in fields or "hex_color" not in fields:
+        raise ValueError(f"Ligne de catalogue incomplète : {record!r}")
+    return (row_brand, fields["reference"], fields.get("name", ""),
+            normalize_hex(fields["hex_color"]))
+
+def read_catalog(path: str, brand: Optional[str] = None,
+                 progress: Optional[Callable[[int], None]] = None) -> Iterator[Tuple[str, str, str, str]]:
+    """Lit un catalogue de fils CSV, JSON ou JSON Lines au fil de l'eau
+
+    Les colonnes sont reconnues par leur nom (voir CATALOG_COLUMNS) ; brand
+    sert de marque par défaut quand le fichier n'a pas de colonne marque.
+    progress(caractères lus) est appelé au fur et à mesure de la lecture.
+    Les lignes invalides sont ignorées avec un message.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        def counted_lines():
+            read = 0
+            for line in f:
+                read += len(line)
+                if progress:
+                    progress(read)
+                yield line
+
+        if extension in (".jsonl", ".ndjson"):
+            records: Iterable[dict] = (json.loads(line) for line in counted_lines() if line.strip())
+        elif extension == ".json":
+            # Un document JSON est lu d'un bloc : liste de fils ou {"brand": ..., "threads": [...]}
+            data = json.load(f)
+            if isinstance(data, dict):
+                brand = data.get("brand", brand)
+                data = data.get("threads", [])
+            records = data
+        else:
+            sample = f.read(4096)
+            f.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+            except csv.Error:
+                dialect = csv.excel
+            records = csv.DictReader(counted_lines(), dialect=dialect)
+
+        for record in records:
+            if not isinstance(record, dict):
+                continue
+            record = {str(key).strip().lower(): value for key, value in record.items()}
+            try:
+                yield _catalog_row(record, brand)
+            except ValueError as e:
+                print(f"Import du catalogue : {str(e)}")
+
+# Catalogue de fils livré avec l'application (lecture seule, versionné) et
+# base de l'utilisateur (favoris, catalogues importés), indépendants du
+# dossier de lancement
+CATALOG_VERSION = 1
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            f"threads-catalog-v{CATALOG_VERSION}.db")
+USER_DATA_DIR = os.path.join(os.path.expanduser("~"), ".creabroderie")
+USER_DB_PATH = os.path.join(USER_DATA_DIR, "threads.db")
+# Anciennes bases (favoris et fils dans une seule table), relatives au dossier
+# de lancement ou à côté du code : reprises à la création de la base utilisateur
+LEGACY_DB_PATHS = ["threads.db", os.path.join(os.path.dirname(os.path.abspath(__file__)), "threads.db")]
+
+# Fils du catalogue de base
+DEFAULT_THREADS = [
+    ("DMC", "310", "Black", "#000000"),
+    ("DMC", "Blanc", "White", "#FFFFFF"),
+    ("DMC", "B5200", "Snow White", "#FFFFFF"),
+    ("DMC", "606", "Bright Orange-Red", "#FF3800"),
+    ("DMC", "699", "Christmas Green", "#115935"),
+    # Ajoutez d'autres couleurs DMC ici
+]
+
+THREADS_TABLE = '''
+    CREATE TABLE threads (
+        brand TEXT,
+        reference TEXT,
+        name TEXT,
+        hex_color TEXT,
+        PRIMARY KEY (brand, reference)
+    )
+'''
+REFERENCE_INDEX = "CREATE INDEX threads_reference ON threads (reference COLLATE NOCASE)"
+SEARCH_TABLE = '''
+    CREATE VIRTUAL TABLE threads_fts USING fts5 (
+        brand, reference, name,
+        content = 'threads', content_rowid = 'rowid',
+        tokenize = "unicode61 remove_diacritics 2",
+        prefix = '1 2 3'
+    )
+'''
+
+def build_catalog_snapshot(path: str, rows: Iterable[Tuple[str, str, str, str]]) -> int:
+    """Construit le catalogue en lecture seule livré avec l'application
+
+    Le fichier est entièrement préparé (index, index plein texte optimisé,
+    VACUUM) pour être ouvert tel quel, sans aucune écriture, au démarrage.
+    Retourne le nombre de fils.
+    """
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        with conn:
+            conn.execute(THREADS_TABLE)
+            conn.executemany("INSERT OR REPLACE INTO threads (brand, reference, name, hex_color) "
+                             "VALUES (?, ?, ?, ?)", rows)
+            conn.execute(REFERENCE_INDEX)
+            try:
+                conn.execute(SEARCH_TABLE)
+                conn.execute("INSERT INTO threads_fts (threads_fts) VALUES ('rebuild')")
+                conn.execute("INSERT INTO threads_fts (threads_fts) VALUES ('optimize')")
+            except sqlite3.OperationalError as e:
+                print(f"Recherche plein texte indisponible : {str(e)}")
+            conn.execute(f"PRAGMA user_version = {CATALOG_VERSION}")
+        count = conn.execute("SELECT COUNT(*) FROM threads").fetchone()[0]
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    return count
+
+def _threads_query(where: str, suffix: str = "") -> str:
+    """Requête sur les fils du catalogue et de l'utilisateur réunis
+
+    Un fil importé par l'utilisateur remplace le fil du catalogue de même
+    marque et référence. where porte sur l'alias t et est appliqué aux deux
+    bases : ses paramètres doivent donc être passés deux fois.
+    """
+    favorite = ("EXISTS (SELECT 1 FROM main.favorites f "
+                "WHERE f.brand = t.brand AND f.reference = t.reference)")
+    return (
+        f"SELECT t.brand, t.reference, COALESCE(u.name, t.name) AS name, "
+        f"COALESCE(u.hex_color, t.hex_color) AS hex_color, {favorite} AS is_favorite "
+        f"FROM catalog.threads t LEFT JOIN main.threads u "
+        f"ON u.brand = t.brand AND u.reference = t.reference WHERE {where} "
+        f"UNION ALL "
+        f"SELECT t.brand, t.reference, t.name, t.hex_color, {favorite} "
+        f"FROM main.threads t WHERE {where} AND NOT EXISTS ("
+        f"SELECT 1 FROM catalog.threads c WHERE c.brand = t.brand AND c.reference = t.reference)"
+        f"{suffix}"
+    )
+
 class ThreadDatabase:
-    """Gestionnaire de la base de données des fils"""
-    def __init__(self):
-        self.db_path = "threads.db"
-        self.init_database()
+    """Gestionnaire de la base de données des fils
+
+    Le catalogue livré avec l'application est ouvert en lecture seule
+    (immutable : SQLite ne pose aucun verrou et ne vérifie pas de journal)
+    et attaché à la base de l'utilisateur, qui ne contient que ses favoris
+    et les catalogues qu'il a importés. Au démarrage, aucun schéma n'est
+    créé ni vérifié, sauf à la toute première ouverture de la base
+    utilisateur (PRAGMA user_version).
+
+    Les connexions SQLite restent ouvertes (une par thread) : les requêtes
+    préparées sont réutilisées d'un appel à l'autre grâce au cache de
+    requêtes de chaque connexion, ce qui suppose des textes SQL identiques.
+
+    Les fils lus sont gardés en mémoire (une liste par marque, chargée à la
+    première lecture) et partagés : un même fil est toujours le même objet
+    ThreadColor. Les changements de favori sont appliqués tout de suite en
+    mémoire puis écrits par lots dans SQLite par un thread d'écriture ; la
+    liste des favoris, lue une fois, est tenue à jour en mémoire.
+    """
+    FAVORITES_WRITE_DELAY = 0.5  # Secondes d'attente pour regrouper les écritures
+    USER_SCHEMA_VERSION = 1
+
+    SQL_BRAND_THREADS_ORDERED = _threads_query("t.brand = ?", " ORDER BY reference")
+    SQL_FAVORITES_ORDERED = (
+        "SELECT f.brand, f.reference, COALESCE(u.name, c.name), "
+        "COALESCE(u.hex_color, c.hex_color), 1 FROM main.favorites f "
+        "LEFT JOIN main.threads u ON u.brand = f.brand AND u.reference = f.reference "
+        "LEFT JOIN catalog.threads c ON c.brand = f.brand AND c.reference = f.reference "
+        "WHERE COALESCE(u.hex_color, c.hex_color) IS NOT NULL ORDER BY f.brand, f.reference"
+    )
+    SQL_THREAD = _threads_query("t.brand = ? AND t.reference = ?")
+    SQL_ADD_FAVORITE = "INSERT OR IGNORE INTO main.favorites (brand, reference) VALUES (?, ?)"
+    SQL_REMOVE_FAVORITE = "DELETE FROM main.favorites WHERE brand = ? AND reference = ?"
+    SQL_BRANDS = (
+        "SELECT brand FROM catalog.threads UNION SELECT brand FROM main.threads ORDER BY brand"
+    )
+    SQL_SEARCH_REFERENCE = _threads_query(
+        "t.reference >= ? COLLATE NOCASE AND t.reference < ? COLLATE NOCASE",
+        " ORDER BY reference COLLATE NOCASE LIMIT ?")
+    # Fils de l'utilisateur, puis fils du catalogue qu'ils ne remplacent pas
+    SQL_SEARCH_TEXT = (
+        "SELECT t.brand, t.reference, t.name, t.hex_color, EXISTS (SELECT 1 FROM main.favorites f "
+        "WHERE f.brand = t.brand AND f.reference = t.reference) "
+        "FROM main.threads_fts JOIN main.threads t ON t.rowid = threads_fts.rowid "
+        "WHERE threads_fts MATCH ?1 "
+        "UNION ALL "
+        "SELECT t.brand, t.reference, t.name, t.hex_color, "
+        "EXISTS (SELECT 1 FROM main.favorites f WHERE f.brand = t.brand AND f.reference = t.reference) "
+        "FROM catalog.threads_fts JOIN catalog.threads t ON t.rowid = threads_fts.rowid "
+        "LEFT JOIN main.threads u ON u.brand = t.brand AND u.reference = t.reference "
+        "WHERE threads_fts MATCH ?1 AND u.brand IS NULL LIMIT ?2"
+    )
+    SQL_SEARCH_LIKE = _threads_query(
+        "t.brand || ' ' || t.reference || ' ' || t.name LIKE ?", " LIMIT ?")
+    SQL_UPSERT_THREAD = (
+        "INSERT INTO main.threads (brand, reference, name, hex_color) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (brand, reference) DO UPDATE SET "
+        "name = excluded.name, hex_color = excluded.hex_color"
+    )
+
+    # Triggers qui tiennent l'index plein texte de la base utilisateur à jour
+    SEARCH_TRIGGERS = (
+        "CREATE TRIGGER main.threads_fts_insert AFTER INSERT ON threads BEGIN "
+        "INSERT INTO threads_fts (rowid, brand, reference, name) "
+        "VALUES (new.rowid, new.brand, new.reference, new.name); END",
+        "CREATE TRIGGER main.threads_fts_delete AFTER DELETE ON threads BEGIN "
+        "INSERT INTO threads_fts (threads_fts, rowid, brand, reference, name) "
+        "VALUES ('delete', old.rowid, old.brand, old.reference, old.name); END",
+        "CREATE TRIGGER main.threads_fts_update AFTER UPDATE OF brand, reference, name ON threads BEGIN "
+        "INSERT INTO threads_fts (threads_fts, rowid, brand, reference, name) "
+        "VALUES ('delete', old.rowid, old.brand, old.reference, old.name); "
+        "INSERT INTO threads_fts (rowid, brand, reference, name) "
+        "VALUES (new.rowid, new.brand, new.reference, new.name); END",
+    )
+
+    def __init__(self, db_path: Optional[str] = None, catalog_path: Optional[str] = None):
+        self.db_path = db_path or USER_DB_PATH
+        self.catalog_path = catalog_path or CATALOG_PATH
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        # Compteurs de modifications, pour invalider les index construits sur la base
+        self.catalog_revision = 0
+        self.favorites_revision = 0
+        # Cache des fils : marque -> fils, et (marque, référence) -> fil
+        self._cache_lock = threading.RLock()
+        self._cache_revision = 0
+        self._brand_cache: Dict[str, List[ThreadColor]] = {}
+        self._threads: Dict[Tuple[str, str], ThreadColor] = {}
+        # Favoris (lus au premier besoin) et leur liste triée
+        self._favorites: Optional[Dict[Tuple[str, str], ThreadColor]] = None
+        self._favorites_list: Optional[List[ThreadColor]] = None
+        # Favoris modifiés en attente d'écriture : (marque, référence) -> état
+        self._pending_favorites: Dict[Tuple[str, str], bool] = {}
+        self._pending_condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self._closing = False
+
+        if not os.path.exists(self.catalog_path):
+            # Installation incomplète : catalogue de base reconstruit à côté de la base utilisateur
+            print(f"Catalogue de fils introuvable : {self.catalog_path}")
+            self.catalog_path = os.path.join(os.path.dirname(os.path.abspath(self.db_path)),
+                                             os.path.basename(self.catalog_path))
+            if not os.path.exists(self.catalog_path):
+                os.makedirs(os.path.dirname(self.catalog_path), exist_ok=True)
+                build_catalog_snapshot(self.catalog_path, DEFAULT_THREADS)
+
+        conn = self.connection()
+        if conn.execute("PRAGMA main.user_version").fetchone()[0] < self.USER_SCHEMA_VERSION:
+            self.init_database()
+        self.has_fts = conn.execute(
+            "SELECT (SELECT COUNT(*) FROM main.sqlite_master WHERE name = 'threads_fts') "
+            "+ (SELECT COUNT(*) FROM catalog.sqlite_master WHERE name = 'threads_fts')"
+        ).fetchone()[0] == 2
+
+    def connection(self) -> sqlite3.Connection:
+        """Retourne la connexion du thread courant, ouverte au premier appel"""
+        conn = getattr(self._local, "connection", None)
+        if conn is None:
+            directory = os.path.dirname(os.path.abspath(self.db_path))
+            os.makedirs(directory, exist_ok=True)
+            # check_same_thread=False permet seulement à close() de fermer
+            # toutes les connexions ; chacune n'est utilisée que par son thread
+            conn = sqlite3.connect(self.db_path, cached_statements=64,
+                                   check_same_thread=False, uri=True)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("PRAGMA temp_store = MEMORY")
+            conn.execute("PRAGMA cache_size = -8000")  # 8 Mo
+            catalog_uri = Path(os.path.abspath(self.catalog_path)).as_uri() + "?mode=ro&immutable=1"
+            conn.execute("ATTACH DATABASE ? AS catalog", (catalog_uri,))
+            self._local.connection = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        """Écrit les favoris en attente et ferme toutes les connexions ouvertes"""
+        with self._pending_condition:
+            self._closing = True
+            self._pending_condition.notify()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+            atexit.unregister(self.close)
+        self.flush_favorites()
+        self._closing = False
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
 
     def init_database(self):
-        """Initialise la base de données SQLite"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS threads (
+        """Crée la base de l'utilisateur (première ouverture seulement)"""
+        conn = self.connection()
+        with conn:
+            conn.execute(THREADS_TABLE.replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS"))
+            conn.execute(REFERENCE_INDEX.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS"))
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS favorites (
                     brand TEXT,
                     reference TEXT,
-                    name TEXT,
-                    hex_color TEXT,
-                    is_favorite INTEGER DEFAULT 0,
                     PRIMARY KEY (brand, reference)
-                )
+                ) WITHOUT ROWID
             ''')
-            
-            # Vérifier si la table est vide pour insérer les données initiales
-            cursor.execute("SELECT COUNT(*) FROM threads")
-            if cursor.fetchone()[0] == 0:
-                self.load_initial_data()
-
-    def load_initial_data(self):
-        """Charge les données initiales des fils DMC"""
-        dmc_threads = [
-            ("DMC", "310", "Black", "#000000"),
-            ("DMC", "Blanc", "White", "#FFFFFF"),
-            ("DMC", "B5200", "Snow White", "#FFFFFF"),
-            ("DMC", "606", "Bright Orange-Red", "#FF3800"),
-            ("DMC", "699", "Christmas Green", "#115935"),
-            # Ajoutez d'autres couleurs DMC ici
-        ]
-        
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.executemany(
-                "INSERT INTO threads (brand, reference, name, hex_color) VALUES (?, ?, ?, ?)",
-                dmc_threads
-            )
+        self.init_search_index(conn)
+        self.migrate_legacy_database(conn)
+        conn.execute(f"PRAGMA main.user_version = {self.USER_SCHEMA_VERSION}")
+
+    def migrate_legacy_database(self, conn: sqlite3.Connection) -> bool:
+        """Reprend les favoris et les fils importés d'une ancienne base threads.db
+
+        Seuls les fils absents du catalogue ou différents de celui-ci sont
+        copiés (les autres viennent du catalogue) ; l'ancienne base n'est pas
+        modifiée. Retourne True si une ancienne base a été reprise.
+        """
+        target = os.path.abspath(self.db_path)
+        for path in dict.fromkeys(os.path.abspath(path) for path in LEGACY_DB_PATHS):
+            if path == target or not os.path.isfile(path):
+                continue
+            try:
+                conn.execute("ATTACH DATABASE ? AS legacy", (Path(path).as_uri() + "?mode=ro",))
+                try:
+                    with conn:
+                        conn.execute(
+                            "INSERT OR IGNORE INTO main.threads (brand, reference, name, hex_color) "
+                            "SELECT l.brand, l.reference, l.name, l.hex_color FROM legacy.threads l "
+                            "WHERE NOT EXISTS (SELECT 1 FROM catalog.threads c "
+                            "WHERE c.brand = l.brand AND c.reference = l.reference "
+                            "AND c.name IS l.name AND c.hex_color IS l.hex_color)")
+                        conn.execute(
+                            "INSERT OR IGNORE INTO main.favorites (brand, reference) "
+                            "SELECT brand, reference FROM legacy.threads WHERE is_favorite = 1")
+                finally:
+                    conn.execute("DETACH DATABASE legacy")
+            except sqlite3.Error as e:
+                print(f"Ancienne base de fils illisible ({path}) : {str(e)}")
+                continue
+            print(f"Favoris et fils importés repris de {path}")
+            return True
+        return False
+
+    def init_search_index(self, conn: sqlite3.Connection) -> bool:
+        """Crée l'index plein texte (FTS5) des fils importés par l'utilisateur
+
+        L'index ne stocke que les termes (contenu externe : la table threads)
+        et des triggers le tiennent à jour. Retourne False si SQLite n'a pas
+        été compilé avec FTS5 ; la recherche se fait alors avec LIKE.
+        """
+        exists = conn.execute(
+            "SELECT 1 FROM main.sqlite_master WHERE name = 'threads_fts'").fetchone()
+        if exists:
+            return True
+        try:
+            with conn:
+                conn.execute(SEARCH_TABLE)
+                for trigger in self.SEARCH_TRIGGERS:
+                    conn.execute(trigger)
+        except sqlite3.OperationalError as e:
+            print(f"Recherche plein texte indisponible : {str(e)}")
+            return False
+        return True
+
+    def import_catalog(self, path: str, brand: Optional[str] = None,
+                       progress: Optional[Callable[[int, float], None]] = None,
+                       batch_size: int = 5000) -> int:
+        """Importe un catalogue de fils et retourne le nombre de lignes importées
+
+        Les fils sont ajoutés à la base de l'utilisateur ; un fil de même
+        marque et référence qu'un fil du catalogue de base le remplace.
+        Tout l'import se fait dans une seule transaction, par lots insérés
+        avec executemany, et les favoris sont conservés.
+        progress(lignes, fraction) est appelé après chaque lot. Les triggers
+        de l'index plein texte sont suspendus pendant l'import et l'index
+        reconstruit d'un coup à la fin, ce qui est bien plus rapide que
+        ligne par ligne.
+        """
+        total_size = max(os.path.getsize(path), 1)
+        position = [0]
+
+        def track(characters_read):
+            position[0] = characters_read
+
+        rows = read_catalog(path, brand, track)
+        imported = 0
+        conn = self.connection()
+        with conn:
+            if self.has_fts:
+                for name in ("threads_fts_insert", "threads_fts_delete", "threads_fts_update"):
+                    conn.execute(f"DROP TRIGGER IF EXISTS main.{name}")
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                conn.executemany(self.SQL_UPSERT_THREAD, batch)
+                imported += len(batch)
+                if progress:
+                    progress(imported, min(position[0] / total_size, 1.0))
+            if self.has_fts:
+                conn.execute("INSERT INTO main.threads_fts (threads_fts) VALUES ('rebuild')")
+                for trigger in self.SEARCH_TRIGGERS:
+                    conn.execute(trigger)
+
+        self.catalog_revision += 1
+        if progress:
+            progress(imported, 1.0)
+        return imported
+
+    def get_brands(self) -> List[str]:
+        """Récupère la liste des marques présentes dans la base"""
+        return [row[0] for row in self.connection().execute(self.SQL_BRANDS)]
+
+    def _check_cache(self):
+        """Oublie le cache si le catalogue a été modifié (import)"""
+        if self._cache_revision != self.catalog_revision:
+            self._brand_cache.clear()
+            self._threads.clear()
+            self._favorites = self._favorites_list = None
+            self._cache_revision = self.catalog_revision
+
+    def _resolve(self, rows: Iterable[tuple]) -> List[ThreadColor]:
+        """Convertit des lignes de la base en fils, en réutilisant ceux du cache
+
+        L'état favori en attente d'écriture l'emporte sur celui de la base.
+        """
+        result = []
+        with self._cache_lock:
+            self._check_cache()
+            for row in rows:
+                key = (row[0], row[1])
+                thread = self._threads.get(key)
+                if thread is None:
+                    thread = ThreadColor(*row)
+                    thread.is_favorite = bool(self._pending_favorites.get(key, row[4]))
+                    self._threads[key] = thread
+                result.append(thread)
+        return result
+
+    def _cached_brand(self, brand: str) -> List[ThreadColor]:
+        """Fils d'une marque, lus dans la base au premier appel seulement"""
+        with self._cache_lock:
+            self._check_cache()
+            threads = self._brand_cache.get(brand)
+            if threads is None:
+                cursor = self.connection().execute(self.SQL_BRAND_THREADS_ORDERED, (brand, brand))
+                threads = self._resolve(cursor.fetchall())
+                self._brand_cache[brand] = threads
+            return threads
+
+    def _lookup(self, key: Tuple[str, str]) -> Optional[ThreadColor]:
+        """Fil d'une marque et référence, depuis le cache ou la base"""
+        with self._cache_lock:
+            self._check_cache()
+            thread = self._threads.get(key)
+            if thread is None:
+                rows = self.connection().execute(self.SQL_THREAD, key + key).fetchall()
+                thread = self._resolve(rows)[0] if rows else None
+            return thread
+
+    def _cached_favorites(self) -> List[ThreadColor]:
+        """Favoris triés par marque et référence
+
+        Lus dans la base au premier appel, avec les favoris ajoutés ou
+        retirés en attente d'écriture, puis tenus à jour par
+        toggle_favorite : ni écriture ni requête à chaque page.
+        """
+        with self._cache_lock:
+            self._check_cache()
+            if self._favorites is None:
+                # Sous _write_lock : un lot ne peut pas quitter les favoris en
+                # attente sans être encore visible dans la base
+                with self._write_lock:
+                    rows = self.connection().execute(self.SQL_FAVORITES_ORDERED).fetchall()
+                    with self._pending_condition:
+                        added = [key for key, state in self._pending_favorites.items() if state]
+                favorites = {(thread.brand, thread.reference): thread
+                             for thread in self._resolve(rows) if thread.is_favorite}
+                for key in added:
+                    thread = self._lookup(key)
+                    if thread is not None and thread.is_favorite:
+                        favorites[key] = thread
+                self._favorites = favorites
+            if self._favorites_list is None:
+                self._favorites_list = sorted(self._favorites.values(),
+                                              key=lambda thread: (thread.brand, thread.reference))
+            return self._favorites_list
 
     def get_all_threads(self, brand: str = None) -> List[ThreadColor]:
         """Récupère tous les fils, filtré par marque si spécifiée"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            if brand:
-                cursor.execute(
-                    "SELECT brand, reference, name, hex_color, is_favorite FROM threads WHERE brand = ?",
-                    (brand,)
-                )
-            else:
-                cursor.execute(
-                    "SELECT brand, reference, name, hex_color, is_favorite FROM threads"
-                )
-            return [ThreadColor(*row) for row in cursor.fetchall()]
+        if brand:
+            return list(self._cached_brand(brand))
+        threads = []
+        for each_brand in self.get_brands():
+            threads.extend(self._cached_brand(each_brand))
+        return threads
+
+    def get_threads_page(self, brand: Optional[str], offset: int, limit: int,
+                         favorites_only: bool = False) -> List[ThreadColor]:
+        """Récupère une page de fils d'une marque (ou des favoris)"""
+        threads = self._cached_favorites() if favorites_only else self._cached_brand(brand)
+        return threads[offset:offset + limit]
+
+    def search_threads(self, query: str, limit: int = 200) -> List[ThreadColor]:
+        """Recherche des fils par marque, référence ou nom
+
+        Les fils dont la référence commence par la recherche viennent en
+        premier (index sur reference), puis les résultats de l'index plein
+        texte, chaque mot étant cherché comme début de mot.
+        """
+        query = query.strip()
+        words = re.findall(r"\w+", query)
+        if not words:
+            return []
+        conn = self.connection()
+
+        upper = query + "\U0010FFFF"
+        results = self._resolve(conn.execute(
+            self.SQL_SEARCH_REFERENCE, (query, upper, query, upper, limit)))
+        seen = {(thread.brand, thread.reference) for thread in results}
+
+        if self.has_fts:
+            match = " ".join(f'"{word}"*' for word in words)
+            cursor = conn.execute(self.SQL_SEARCH_TEXT, (match, limit))
+        else:
+            pattern = f"%{query}%"
+            cursor = conn.execute(self.SQL_SEARCH_LIKE, (pattern, pattern, limit))
+        rows = [row for row in islice(cursor, limit) if (row[0], row[1]) not in seen]
+        results.extend(self._resolve(rows))
+        return results[:limit]
 
     def get_favorites(self) -> List[ThreadColor]:
         """Récupère les fils favoris"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT brand, reference, name, hex_color, is_favorite FROM threads WHERE is_favorite = 1"
-            )
-            return [ThreadColor(*row) for row in cursor.fetchall()]
+        return list(self._cached_favorites())
 
     def toggle_favorite(self, brand: str, reference: str) -> bool:
-        """Change l'état favori d'un fil et retourne le nouvel état"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE threads SET is_favorite = NOT is_favorite WHERE brand = ? AND reference = ?",
-                (brand, reference)
-            )
-            cursor.execute(
-                "SELECT is_favorite FROM threads WHERE brand = ? AND reference = ?",
-                (brand, reference)
-            )
-            return bool(cursor.fetchone()[0])
+        """Change l'état favori d'un fil et retourne le nouvel état
 
-class ThreadPanel(ttk.Frame):
-    """Panneau de sélection des fils de broderie"""
-    def __init__(self, parent, callback):
-        super().__init__(parent)
-        self.callback = callback
-        self.db = ThreadDatabase()
-        self.setup_ui()
+        Le cache est mis à jour immédiatement ; l'écriture dans la base est
+        faite plus tard, par lots, par le thread d'écriture.
+        """
+        key = (brand, reference)
+        with self._cache_lock:
+            thread = self._lookup(key)
+            if thread is None:
+                return False
+            is_favorite = not thread.is_favorite
+            thread.is_favorite = is_favorite
+            if self._favorites is not None:
+                if is_favorite:
+                    self._favorites[key] = thread
+                else:
+                    self._favorites.pop(key, None)
+                self._favorites_list = None
+            self.favorites_revision += 1
 
-    def setup_ui(self):
-        # Panneau principal avec onglets
-        notebook = ttk.Notebook(self)
-        notebook.pack(fill=tk.BOTH, expand=True)
+        with self._pending_condition:
+            self._pending_favorites[key] = is_favorite
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._favorites_writer, daemon=True)
+                self._writer.start()
+                # Le thread d'écriture est un démon : les favoris encore en
+                # attente à la sortie du programme sont écrits par close()
+                atexit.register(self.close)
+            self._pending_condition.notify()
+        return is_favorite
 
-        # Onglet Favoris
-        favorites_frame = ttk.Frame(notebook)
-        notebook.add(favorites_frame, text="Favoris")
-        self.create_thread_list(favorites_frame, self.db.get_favorites())
+    def _favorites_writer(self):
+        """Thread d'écriture : enregistre les favoris modifiés par lots"""
+        while True:
+            with self._pending_condition:
+                while not self._pending_favorites and not self._closing:
+                    self._pending_condition.wait()
+                if self._closing:
+                    return
+            # Laisser les clics rapprochés s'accumuler dans un même lot
+            time.sleep(self.FAVORITES_WRITE_DELAY)
+            try:
+                self.flush_favorites()
+            except sqlite3.Error as e:
+                print(f"Erreur lors de l'enregistrement des favoris : {str(e)}")
 
-        # Onglet DMC
-        dmc_frame = ttk.Frame(notebook)
-        notebook.add(dmc_frame, text="DMC")
-        self.create_thread_list(dmc_frame, self.db.get_all_threads("DMC"))
+    def flush_favorites(self):
+        """Écrit immédiatement les favoris en attente dans la base"""
+        with self._write_lock:
+            with self._pending_condition:
+                pending, self._pending_favorites = self._pending_favorites, {}
+            if not pending:
+                return
+            with self.connection() as conn:
+                conn.executemany(self.SQL_ADD_FAVORITE,
+                                 [key for key, state in pending.items() if state])
+                conn.executemany(self.SQL_REMOVE_FAVORITE,
+                                 [key for key, state in pending.items() if not state])
 
-        # Prévoir d'autres onglets pour d'autres marques
-        # Anchor, Madeira, etc.
+class ThreadList(ttk.Frame):
+    """Liste de fils remplie par pages au fil du défilement
 
-    def create_thread_list(self, parent, threads: List[ThreadColor]):
-        """Crée la liste des fils avec aperçu des couleurs"""
-        frame = ttk.Frame(parent)
-        frame.pack(fill=tk.BOTH, expand=True)
+    Les lignes sont demandées à la base par pages de PAGE_SIZE, la page
+    suivante étant chargée quand le bas de la liste approche. Les tags de
+    couleur de la Treeview sont partagés : un seul tag par couleur.
+    """
+    PAGE_SIZE = 200
+    PREFETCH = 0.9  # Position de défilement qui déclenche la page suivante
+
+    def __init__(self, parent, load_page: Callable[[int, int], List[ThreadColor]],
+                 contrast_color: Callable[[str], str]):
+        super().__init__(parent)
+        self.load_page = load_page
+        self.contrast_color = contrast_color
+        self.rows: Dict[str, ThreadColor] = {}  # Ligne de la liste -> fil
+        self.color_tags = set()
+        self.loaded = 0
+        self.exhausted = False
+        self.pending = None
 
         # Scrollbar
-        scrollbar = ttk.Scrollbar(frame)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.scrollbar = ttk.Scrollbar(self)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
         # Liste avec colonnes
         columns = ("Référence", "Nom", "Couleur", "Favori")
-        tree = ttk.Treeview(frame, columns=columns, show="headings", 
-                           yscrollcommand=scrollbar.set)
-        
+        self.tree = ttk.Treeview(self, columns=columns, show="headings",
+                                 yscrollcommand=self.on_scroll)
+
         # Configuration des colonnes
-        tree.heading("Référence", text="Réf.")
-        tree.heading("Nom", text="Nom")
-        tree.heading("Couleur", text="Couleur")
-        tree.heading("Favori", text="★")
-        
-        tree.column("Référence", width=80)
-        tree.column("Nom", width=150)
-        tree.column("Couleur", width=80)
-        tree.column("Favori", width=30)
+        self.tree.heading("Référence", text="Réf.")
+        self.tree.heading("Nom", text="Nom")
+        self.tree.heading("Couleur", text="Couleur")
+        self.tree.heading("Favori", text="★")
+
+        self.tree.column("Référence", width=80)
+        self.tree.column("Nom", width=150)
+        self.tree.column("Couleur", width=80)
+        self.tree.column("Favori", width=30)
+
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.config(command=self.tree.yview)
+
+        self.load_next_page()
 
-        # Remplissage des données
+    def on_scroll(self, first, last):
+        """Met à jour la barre de défilement et charge la suite si besoin"""
+        self.scrollbar.set(first, last)
+        if not self.exhausted and self.pending is None and float(last) >= self.PREFETCH:
+            self.pending = self.after_idle(self.load_next_page)
+
+    def load_next_page(self):
+        """Ajoute la page suivante de fils à la liste"""
+        self.pending = None
+        threads = self.load_page(self.loaded, self.PAGE_SIZE)
+        self.loaded += len(threads)
+        self.exhausted = len(threads) < self.PAGE_SIZE
+
+        tree = self.tree
         for thread in threads:
-            tree.insert("", tk.END, values=(
+            tag = f"color_{thread.hex_color}"
+            if tag not in self.color_tags:
+                # Création du tag de couleur, une fois par couleur
+                tree.tag_configure(tag, background=thread.hex_color,
+                                   foreground=self.contrast_color(thread.hex_color))
+                self.color_tags.add(tag)
+            self.rows[tree.insert("", tk.END, values=(
                 thread.reference,
                 thread.name,
                 "",  # La couleur sera affichée via un tag
                 "★" if thread.is_favorite else ""
-            ), tags=(f"color_{thread.hex_color}",))
-            
-            # Création du tag de couleur
-            tree.tag_configure(f"color_{thread.hex_color}", 
-                             background=thread.hex_color,
-                             foreground=self.get_contrast_color(thread.hex_color))
+            ), tags=(tag,))] = thread
 
-        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.config(command=tree.yview)
+class ThreadPanel(ttk.Frame):
+    """Panneau de sélection des fils de broderie"""
+    SEARCH_DELAY = 120   # Délai (ms) après la dernière frappe avant de chercher
+    SEARCH_LIMIT = 500   # Nombre maximal de résultats affichés
+
+    def __init__(self, parent, callback):
+        super().__init__(parent)
+        self.callback = callback
+        self.db = ThreadDatabase()
+        # Les recherches tournent hors du thread de l'interface, une à la fois
+        self.search_executor = ThreadPoolExecutor(max_workers=1)
+        self.search_pending = None
+        self.search_generation = 0
+        self.search_list: Optional[ThreadList] = None
+        self.setup_ui()
+
+    def setup_ui(self):
+        # Champ de recherche
+        self.search_var = tk.StringVar()
+        search_entry = ttk.Entry(self, textvariable=self.search_var)
+        search_entry.pack(fill=tk.X, padx=2, pady=2)
+        self.search_var.trace_add("write", self.on_search_changed)
+
+        # Panneau principal avec onglets
+        self.notebook = ttk.Notebook(self)
+        self.notebook.pack(fill=tk.BOTH, expand=True)
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+        self.create_tabs()
+        self.on_tab_changed()
+
+    def on_search_changed(self, *args):
+        """Relance la recherche quand la frappe s'interrompt"""
+        if self.search_pending is not None:
+            self.after_cancel(self.search_pending)
+        self.search_pending = self.after(self.SEARCH_DELAY, self.run_search)
+
+    def run_search(self):
+        self.search_pending = None
+        self.search_generation += 1
+        query = self.search_var.get().strip()
+        if not query:
+            self.show_search_results(None)
+            return
+        future = self.search_executor.submit(self.db.search_threads, query, self.SEARCH_LIMIT)
+        self.poll_search(future, self.search_generation)
+
+    def poll_search(self, future, generation: int):
+        """Attend le résultat de la recherche sans bloquer l'interface"""
+        if generation != self.search_generation:
+            return  # Une recherche plus récente a été lancée
+        if not future.done():
+            self.after(5, self.poll_search, future, generation)
+            return
+        try:
+            threads = future.result()
+        except sqlite3.Error as e:
+            print(f"Erreur lors de la recherche : {str(e)}")
+            threads = []
+        self.show_search_results(threads)
+
+    def show_search_results(self, threads: Optional[List[ThreadColor]]):
+        """Affiche les résultats à la place des onglets (None : revenir aux onglets)"""
+        if self.search_list is not None:
+            self.search_list.destroy()
+            self.search_list = None
+        if threads is None:
+            self.notebook.pack(fill=tk.BOTH, expand=True)
+            return
+        self.notebook.pack_forget()
+        self.search_list = self.create_thread_list(
+            self, lambda offset, limit: threads[offset:offset + limit])
+
+    def create_tabs(self):
+        """Crée l'onglet des favoris puis un onglet par marque
+
+        Les onglets sont créés vides : leur liste n'est construite qu'à leur
+        première ouverture.
+        """
+        self.tab_sources = {}  # Onglet -> (marque, favoris seulement)
+        self.tab_lists = {}    # Onglet -> liste déjà construite
+
+        # Onglet Favoris
+        self.add_tab("Favoris", None, True)
+
+        # Un onglet par marque présente dans la base (DMC, Anchor, Madeira...)
+        for brand in self.db.get_brands():
+            self.add_tab(brand, brand, False)
+
+    def add_tab(self, title: str, brand: Optional[str], favorites_only: bool):
+        frame = ttk.Frame(self.notebook)
+        self.notebook.add(frame, text=title)
+        self.tab_sources[str(frame)] = (brand, favorites_only)
+
+    def on_tab_changed(self, event=None):
+        """Construit la liste de l'onglet affiché à sa première ouverture"""
+        tab = self.notebook.select()
+        if not tab or tab in self.tab_lists:
+            return
+        brand, favorites_only = self.tab_sources[tab]
+        self.tab_lists[tab] = self.create_thread_list(
+            self.nametowidget(tab),
+            lambda offset, limit: self.db.get_threads_page(brand, offset, limit, favorites_only))
+
+    def reload(self):
+        """Reconstruit les onglets après une modification du catalogue"""
+        for tab in self.notebook.tabs():
+            self.notebook.forget(tab)
+            self.nametowidget(tab).destroy()
+        self.create_tabs()
+        self.on_tab_changed()
+
+    def create_thread_list(self, parent, load_page: Callable[[int, int], List[ThreadColor]]) -> ThreadList:
+        """Crée la liste des fils avec aperçu des couleurs"""
+        thread_list = ThreadList(parent, load_page, self.get_contrast_color)
+        thread_list.pack(fill=tk.BOTH, expand=True)
 
         # Événements
+        tree = thread_list.tree
         tree.bind("<Double-1>", lambda e: self.on_color_select(e, tree))
-        tree.bind("<Button-1>", lambda e: self.on_click(e, tree))
+        tree.bind("<Button-1>", lambda e: self.on_click(e, tree, thread_list.rows))
+        return thread_list
 
     def get_contrast_color(self, hex_color: str) -> str:
         """Retourne la couleur de texte (noir ou blanc) selon la couleur de fond"""
@@ -193,15 +871,25 @@ class ThreadPanel(ttk.Frame):
         # Appel du callback avec la couleur sélectionnée
         self.callback(hex_color)
 
-    def on_click(self, event, tree):
+    def on_click(self, event, tree, rows):
         """Gestion du clic sur la colonne favori"""
         region = tree.identify("region", event.x, event.y)
         if region == "cell":
             column = tree.identify_column(event.x)
             if column == "#4":  # Colonne Favori
                 item = tree.identify_row(event.y)
-                values = tree.item(item)["values"]
+                if item not in rows:
+                    return
+                thread = rows[item]
                 # Toggle favori dans la base de données
-                is_favorite = self.db.toggle_favorite("DMC", values[0])
+                is_favorite = self.db.toggle_favorite(thread.brand, thread.reference)
+                thread.is_favorite = is_favorite
                 # Mise à jour de l'affichage
-                tree.set(item, "Favori", "★" if is_favorite else "")
\ No newline at end of file
+                tree.set(item, "Favori", "★" if is_favorite else "")
+                self.forget_favorites_tab()
+
+    def forget_favorites_tab(self):
+        """L'onglet Favoris sera reconstruit à sa prochaine ouverture"""
+        for tab, (_, favorites_only) in self.tab_sources.items():
+            if favorites_only and tab in self.tab_lists and tab != self.notebook.select():
+                self.tab_lists.pop(tab).destroy()
\ No newline at end of file
@@ -0,0 +1,135 @@
+# validator.py
+"""Vérification d'un motif avant l'envoi à la machine
+
+    report = validate_design(design)
+    if not report.ok:
+        print("\n".join(report.summary()))
+
+Contrôles :
+- points hors du tambour (tambour centré sur le motif, ou placé à un
+  coin donné, pour un passage de multi_hoop) ;
+- points trop courts (l'aiguille repique dans le même trou, le fil casse)
+  et trop longs (boucles qui s'accrochent) ;
+- surdensité locale : histogramme 2D des piqûres d'aiguille, en piqûres
+  par mm², sur des cellules de DENSITY_CELL_MM mm.
+
+Chaque contrôle travaille sur des colonnes entières (x, y, types) avec
+map, zip et Counter ; seuls les points fautifs sont examinés un par un.
+Les motifs relus d'un projet .cbrd fournissent directement leurs colonnes.
+"""
+
+from collections import Counter
+from dataclasses import dataclass, field
+from itertools import compress
+from typing import Dict, List, Optional, Sequence, Tuple
+import math
+import operator
+from embroidery_export import EmbroideryDesign, StitchPoint, StitchType
+from profiling import span
+
+MIN_STITCH_MM = 0.3
+MAX_STITCH_MM = 12.1
+DENSITY_CELL_MM = 2.0
+MAX_DENSITY = 8.0   # Piqûres par mm² au-delà desquelles le tissu est percé ou gondole
+MAX_MARKERS = 500   # Positions gardées par type de problème, pour l'affichage
+
+@dataclass
+class ValidationReport:
+    """Résultat de la vérification d'un motif (positions en mm)"""
+    stitches: int
+    hoop_box: Tuple[float, float, float, float]
+    out_of_hoop: int = 0
+    short_stitches: int = 0
+    long_stitches: int = 0
+    markers: Dict[str, List[Tuple[float, float]]] = field(default_factory=dict)
+    density: Dict[Tuple[int, int], float] = field(default_factory=dict)  # Cellule -> piqûres/mm²
+    dense_cells: Dict[Tuple[int, int], float] = field(default_factory=dict)  # Cellules trop denses
+    max_density: float = 0.0
+    cell_mm: float = DENSITY_CELL_MM
+
+    @property
+    def ok(self) -> bool:
+        return not (self.out_of_hoop or self.short_stitches or self.long_stitches or self.dense_cells)
+
+    def summary(self) -> List[str]:
+        """Une ligne par type de problème trouvé"""
+        lines = []
+        if self.out_of_hoop:
+            lines.append(f"{self.out_of_hoop} points hors du tambour")
+        if self.short_stitches:
+            lines.append(f"{self.short_stitches} points de moins de {MIN_STITCH_MM} mm")
+        if self.long_stitches:
+            lines.append(f"{self.long_stitches} points de plus de {MAX_STITCH_MM} mm")
+        if self.dense_cells:
+            lines.append(f"{len(self.dense_cells)} zones trop denses "
+                         f"(jusqu'à {self.max_density:.1f} piqûres/mm², limite {MAX_DENSITY:g})")
+        return lines
+
+def _columns(points: Sequence[StitchPoint]) -> Tuple[Sequence[float], Sequence[float], Sequence[int]]:
+    """Colonnes (x, y, types) des points, sans copie pour des points en colonnes"""
+    if hasattr(points, "xs"):  # StitchColumns (motif converti, projet .cbrd)
+        return points.xs, points.ys, points.types
+    return ([point.x for point in points], [point.y for point in points],
+            [point.stitch_type for point in points])
+
+def validate_design(design: EmbroideryDesign, cell_mm: float = DENSITY_CELL_MM,
+                    hoop_origin_mm: Optional[Tuple[float, float]] = None) -> ValidationReport:
+    """Vérifie le flux de points d'un motif
+
+    Sans hoop_origin_mm, le tambour est centré sur le motif, comme le fait
+    la machine : des points hors du tambour ne sont alors trouvés que si le
+    motif est plus grand que lui, cas que l'export découpe déjà en passages.
+    Avec hoop_origin_mm, coin du tambour dans les coordonnées des points
+    ((0, 0) pour un passage de split_design), chaque point est comparé au
+    tambour réellement placé.
+    """
+    xs, ys, types = _columns(design.points)
+    with span("validate_design", stitches=len(xs)):
+        if not len(xs):
+            return ValidationReport(0, (0.0, 0.0) + tuple(design.hoop_size_mm), cell_mm=cell_mm)
+
+        x1, x2, y1, y2 = min(xs), max(xs), min(ys), max(ys)
+        hoop_w, hoop_h = design.hoop_size_mm
+        if hoop_origin_mm is None:
+            # Tambour centré sur le motif
+            if (x2 - x1 > hoop_w or y2 - y1 > hoop_h) and x2 - x1 <= hoop_h and y2 - y1 <= hoop_w:
+                hoop_w, hoop_h = hoop_h, hoop_w  # Tambour tourné d'un quart de tour
+            hx1, hy1 = (x1 + x2 - hoop_w) / 2, (y1 + y2 - hoop_h) / 2
+        else:
+            hx1, hy1 = hoop_origin_mm
+        hx2, hy2 = hx1 + hoop_w, hy1 + hoop_h
+        report = ValidationReport(len(xs), (hx1, hy1, hx2, hy2), cell_mm=cell_mm)
+
+        if x1 < hx1 or x2 > hx2 or y1 < hy1 or y2 > hy2:
+            outside = [(x, y) for x, y in zip(xs, ys) if x < hx1 or x > hx2 or y < hy1 or y > hy2]
+            report.out_of_hoop = len(outside)
+            report.markers["out_of_hoop"] = outside[:MAX_MARKERS]
+
+        # Longueur des points : seuls les points brodés depuis un point brodé
+        # comptent (après un saut, une coupe ou une commande, le fil repart)
+        lengths = list(map(math.hypot, map(operator.sub, xs[1:], xs[:-1]),
+                           map(operator.sub, ys[1:], ys[:-1])))
+        suspects = [i for i, length in enumerate(lengths)
+                    if length < MIN_STITCH_MM or length > MAX_STITCH_MM]
+        short, long_ = [], []
+        for i in suspects:
+            if types[i + 1] == StitchType.NORMAL and types[i] == StitchType.NORMAL:
+                (short if lengths[i] < MIN_STITCH_MM else long_).append((xs[i + 1], ys[i + 1]))
+        report.short_stitches, report.long_stitches = len(short), len(long_)
+        if short:
+            report.markers["short"] = short[:MAX_MARKERS]
+        if long_:
+            report.markers["long"] = long_[:MAX_MARKERS]
+
+        # Histogramme des piqûres par cellule
+        normal = [stitch_type == StitchType.NORMAL for stitch_type in types]
+        scale = 1 / cell_mm
+        histogram = Counter(zip(map(math.floor, map(scale.__mul__, compress(xs, normal))),
+                                map(math.floor, map(scale.__mul__, compress(ys, normal)))))
+        area = cell_mm * cell_mm
+        report.density = {cell: hits / area for cell, hits in histogram.items()}
+        report.dense_cells = {cell: density for cell, density in report.density.items()
+                              if density > MAX_DENSITY}
+        if report.density:
+            report.max_density = max(report.density.values())
+    return report
@@ -0,0 +1,140 @@
+# viewport.py
+
+from typing import List, Sequence, Tuple
+import math
+
+# Unités du monde : les coordonnées des formes sont exprimées en dixièmes
+# de millimètre (10 unités = 1 mm), soit 1 pixel à un zoom de 100 %.
+PIXELS_PER_MM = 10
+
+# Niveaux de détail
+LOD_FULL = 0        # Rendu complet
+LOD_SIMPLIFIED = 1  # Texte remplacé par sa boîte englobante, ovales décimés, points fusionnés
+LOD_COARSE = 2      # Petites formes remplacées par leur boîte englobante
+
+class Viewport:
+    """Transformation monde -> écran du canvas (zoom et déplacement)
+
+    Un point du monde (wx, wy) est affiché en (wx * zoom + offset_x,
+    wy * zoom + offset_y) sur le canvas.
+    """
+    MIN_ZOOM = 0.05
+    MAX_ZOOM = 20.0
+
+    def __init__(self):
+        self.zoom = 1.0
+        self.offset_x = 0.0
+        self.offset_y = 0.0
+
+    def to_screen(self, x: float, y: float) -> Tuple[float, float]:
+        """Convertit un point du monde en coordonnées écran"""
+        return x * self.zoom + self.offset_x, y * self.zoom + self.offset_y
+
+    def to_world(self, x: float, y: float) -> Tuple[float, float]:
+        """Convertit un point écran en coordonnées du monde"""
+        return (x - self.offset_x) / self.zoom, (y - self.offset_y) / self.zoom
+
+    def coords_to_screen(self, coords: Sequence[float]) -> List[float]:
+        """Convertit une liste plate [x1, y1, x2, y2, ...] du monde vers l'écran"""
+        zoom = self.zoom
+        return [c * zoom + (self.offset_x if i % 2 == 0 else self.offset_y)
+                for i, c in enumerate(coords)]
+
+    def coords_to_world(self, coords: Sequence[float]) -> List[float]:
+        """Convertit une liste plate [x1, y1, x2, y2, ...] de l'écran vers le monde"""
+        zoom = self.zoom
+        return [(c - (self.offset_x if i % 2 == 0 else self.offset_y)) / zoom
+                for i, c in enumerate(coords)]
+
+    def zoom_at(self, factor: float, x: float, y: float) -> float:
+        """Zoome autour du point écran (x, y) et retourne le facteur réellement appliqué"""
+        new_zoom = min(max(self.zoom * factor, self.MIN_ZOOM), self.MAX_ZOOM)
+        applied = new_zoom / self.zoom
+        # Le point sous le curseur reste fixe à l'écran
+        self.offset_x = x - (x - self.offset_x) * applied
+        self.offset_y = y - (y - self.offset_y) * applied
+        self.zoom = new_zoom
+        return applied
+
+    def pan(self, dx: float, dy: float):
+        """Déplace la vue de (dx, dy) pixels écran"""
+        self.offset_x += dx
+        self.offset_y += dy
+
+    def reset(self):
+        """Revient au zoom 100 % sans déplacement"""
+        self.zoom = 1.0
+        self.offset_x = 0.0
+        self.offset_y = 0.0
+
+    def visible_world_rect(self, width: int, height: int) -> Tuple[float, float, float, float]:
+        """Rectangle du monde visible dans un canvas de width x height pixels"""
+        x1, y1 = self.to_world(0, 0)
+        x2, y2 = self.to_world(width, height)
+        return x1, y1, x2, y2
+
+    def lod_level(self) -> int:
+        """Niveau de détail adapté au zoom courant"""
+        if self.zoom >= 0.5:
+            return LOD_FULL
+        if self.zoom >= 0.2:
+            return LOD_SIMPLIFIED
+        return LOD_COARSE
+
+    def grid_step(self, grid_size: float, min_step: int = 5) -> float:
+        """Pas de la grille à l'écran, élargi quand la grille deviendrait trop dense"""
+        step = grid_size * self.zoom
+        while step < min_step:
+            step *= 5
+        return step
+
+def scale_font(spec, zoom: float, splitlist) -> tuple:
+    """Met une description de police Tk à l'échelle du zoom
+
+    spec est un tuple (famille, taille, ...) ou une chaîne au format Tcl,
+    découpée avec splitlist (tk.splitlist).
+    """
+    parts = list(splitlist(spec)) if isinstance(spec, str) else list(spec)
+    if len(parts) < 2:
+        return tuple(parts)
+    size = int(parts[1])
+    # Une taille négative est exprimée en pixels, positive en points
+    scaled = max(1, round(abs(size) * zoom))
+    parts[1] = -scaled if size < 0 else scaled
+    return tuple(parts)
+
+def oval_outline(bbox: Sequence[float], pixels_per_side: float = 8.0,
+                 min_sides: int = 8, max_sides: int = 32) -> List[float]:
+    """Polygone approchant l'ovale inscrit dans bbox, en coordonnées plates [x1, y1, ...]
+
+    Un côté pour environ pixels_per_side pixels de périmètre (entre
+    min_sides et max_sides) : en vue dézoomée, un ovale se dessine avec
+    quelques segments.
+    """
+    x1, y1, x2, y2 = bbox[:4]
+    cx, cy, rx, ry = (x1 + x2) / 2, (y1 + y2) / 2, abs(x2 - x1) / 2, abs(y2 - y1) / 2
+    sides = int(min(max(math.pi * (rx + ry) / pixels_per_side, min_sides), max_sides))
+    coords = []
+    for i in range(sides):
+        angle = 2 * math.pi * i / sides
+        coords.extend((cx + rx * math.cos(angle), cy + ry * math.sin(angle)))
+    return coords
+
+def merge_close_points(points: List[Tuple[float, float]], min_distance: float) -> List[Tuple[float, float]]:
+    """Fusionne les points consécutifs plus proches que min_distance
+
+    Utilisé pour simplifier les polylignes quand la vue est dézoomée :
+    les points qui tombent sur le même pixel ne sont pas retracés.
+    Le dernier point est toujours conservé.
+    """
+    if min_distance <= 0 or len(points) < 3:
+        return points
+    limit = min_distance * min_distance
+    kept = [points[0]]
+    last_x, last_y = points[0]
+    for x, y in points[1:-1]:
+        if (x - last_x) ** 2 + (y - last_y) ** 2 >= limit:
+            kept.append((x, y))
+            last_x, last_y = x, y
+    kept.append(points[-1])
+    return kept